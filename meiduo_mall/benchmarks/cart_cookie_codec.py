@@ -0,0 +1,62 @@
+"""
+cookie购物车编码基准测试
+
+对比旧版 base64(pickle) 格式和新版变长整数签名格式在 1~200 件商品时的
+cookie长度和编码、解码耗时。
+在 manage.py 所在目录执行: python benchmarks/cart_cookie_codec.py
+"""
+import os
+import sys
+import time
+import random
+import pickle
+import base64
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meiduo_mall.settings.dev')
+
+import django
+
+django.setup()
+
+from carts.utils import encode_cart_cookie, decode_cart_cookie
+
+SIZES = [1, 5, 20, 50, 100, 200]  # 购物车商品数量
+REPEAT = 2000  # 每项测试重复次数
+
+
+def legacy_encode(cart_dict):
+    return base64.b64encode(pickle.dumps(cart_dict)).decode()
+
+
+def legacy_decode(cart_str):
+    return pickle.loads(base64.b64decode(cart_str.encode()))
+
+
+def timeit(func, arg):
+    """返回单次执行的平均耗时(微秒)"""
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(arg)
+    return (time.perf_counter() - start) / REPEAT * 1000000
+
+
+def main():
+    print('items  legacy_bytes  new_bytes  legacy_enc  new_enc  legacy_dec  new_dec (us)')
+    for size in SIZES:
+        cart_dict = {}
+        for sku_id in random.sample(range(1, 100000), size):
+            cart_dict[sku_id] = {'count': random.randint(1, 10), 'selected': random.random() < 0.8}
+
+        legacy_str = legacy_encode(cart_dict)
+        new_str = encode_cart_cookie(cart_dict)
+        assert decode_cart_cookie(new_str) == cart_dict
+
+        print('%5d  %12d  %9d  %10.1f  %7.1f  %10.1f  %7.1f' % (
+            size, len(legacy_str), len(new_str),
+            timeit(legacy_encode, cart_dict), timeit(encode_cart_cookie, cart_dict),
+            timeit(legacy_decode, legacy_str), timeit(decode_cart_cookie, new_str)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+redis购物车存储结构基准测试
+
+对比旧结构(carts_<user_id> 哈希 + selected_<user_id> 集合)和新结构(cart_<user_id> 单哈希)
+在100万个购物车时的内存占用、读写耗时, 以及旧结构在线转换的速度。
+在 manage.py 所在目录执行: python benchmarks/cart_layout.py [购物车数量] [redis地址]
+测试会清空指定的redis库, 默认使用 redis://127.0.0.1:6379/15, 请不要指向线上库。
+"""
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meiduo_mall.settings.dev')
+
+import django
+
+django.setup()
+
+import redis
+
+from carts.stores import RedisCartStore, encode_cart_count
+
+CARTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000  # 购物车数量
+REDIS_URL = sys.argv[2] if len(sys.argv) > 2 else 'redis://127.0.0.1:6379/15'
+SAMPLES = 10000  # 读写耗时的抽样次数
+BATCH_SIZE = 1000
+
+# 旧结构的读写脚本
+LEGACY_READ_SCRIPT = """
+return {redis.call('HGETALL', KEYS[1]), redis.call('SMEMBERS', KEYS[2])}
+"""
+
+LEGACY_SET_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if ARGV[3] == '1' then
+    redis.call('SADD', KEYS[2], ARGV[1])
+else
+    redis.call('SREM', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+def make_cart():
+    """随机生成一个1~10件商品的购物车"""
+    cart = {}
+    for sku_id in random.sample(range(1, 100000), random.randint(1, 10)):
+        cart[sku_id] = (random.randint(1, 5), random.random() < 0.8)
+    return cart
+
+
+def fill(redis_conn, layout):
+    """写入测试购物车, 返回每个购物车平均占用的内存(字节)"""
+    redis_conn.flushdb()
+    used_memory = redis_conn.info('memory')['used_memory']
+    random.seed(0)
+
+    for start in range(0, CARTS, BATCH_SIZE):
+        pl = redis_conn.pipeline(transaction=False)
+        for user_id in range(start, min(start + BATCH_SIZE, CARTS)):
+            cart = make_cart()
+            if layout == 'legacy':
+                pl.hmset('carts_%s' % user_id, {sku_id: count for sku_id, (count, _) in cart.items()})
+                selected = [sku_id for sku_id, (_, is_selected) in cart.items() if is_selected]
+                if selected:
+                    pl.sadd('selected_%s' % user_id, *selected)
+            else:
+                pl.hmset('cart_%s' % user_id, {
+                    sku_id: encode_cart_count(count, is_selected) for sku_id, (count, is_selected) in cart.items()})
+        pl.execute()
+
+    return (redis_conn.info('memory')['used_memory'] - used_memory) / CARTS
+
+
+def measure(func):
+    """返回抽样耗时的 (平均值, p99) 毫秒"""
+    costs = []
+    for _ in range(SAMPLES):
+        user_id = random.randrange(CARTS)
+        start = time.perf_counter()
+        func(user_id)
+        costs.append((time.perf_counter() - start) * 1000)
+    costs.sort()
+    return statistics.mean(costs), costs[int(len(costs) * 0.99)]
+
+
+def main():
+    redis_conn = redis.StrictRedis.from_url(REDIS_URL)
+    legacy_read = redis_conn.register_script(LEGACY_READ_SCRIPT)
+    legacy_set = redis_conn.register_script(LEGACY_SET_SCRIPT)
+
+    print('%d carts' % CARTS)
+    print('layout  bytes/cart  read_avg  read_p99  write_avg  write_p99 (ms)')
+
+    bytes_per_cart = fill(redis_conn, 'legacy')
+    read = measure(lambda user_id: legacy_read(keys=['carts_%s' % user_id, 'selected_%s' % user_id]))
+    write = measure(lambda user_id: legacy_set(
+        keys=['carts_%s' % user_id, 'selected_%s' % user_id], args=[1, 2, 1]))
+    print('legacy  %10.1f  %8.3f  %8.3f  %9.3f  %9.3f' % ((bytes_per_cart,) + read + write))
+
+    # 在旧数据上执行在线转换
+    start = time.perf_counter()
+    for user_id in range(CARTS):
+        RedisCartStore(user_id, redis_conn).migrate()
+    cost = time.perf_counter() - start
+    print('migrate %d carts: %.1fs (%.0f carts/s)' % (CARTS, cost, CARTS / cost))
+
+    bytes_per_cart = fill(redis_conn, 'single')
+    read = measure(lambda user_id: RedisCartStore(user_id, redis_conn).get())
+    write = measure(lambda user_id: RedisCartStore(user_id, redis_conn).set(1, 2, True))
+    print('single  %10.1f  %8.3f  %8.3f  %9.3f  %9.3f' % ((bytes_per_cart,) + read + write))
+
+    redis_conn.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+商品列表页分页基准测试
+
+对比 OFFSET 分页和游标分页在分类商品数增长到10万时的深页查询耗时。
+在 manage.py 所在目录执行: python benchmarks/list_pagination.py
+测试数据在事务中生成,结束后全部回滚,请连接测试数据库执行。
+"""
+import os
+import sys
+import time
+import random
+import statistics
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meiduo_mall.settings.dev')
+
+import django
+
+django.setup()
+
+from django.db import transaction
+
+from goods import constants
+from goods.models import Brand, GoodsCategory, SPU, SKU
+from goods.utils import get_keyset_page
+
+SIZES = [1000, 10000, 100000]  # 分类商品数
+REPEAT = 20  # 每项测试重复次数
+BATCH_SIZE = 5000
+
+
+def timeit(func):
+    """返回多次执行的耗时中位数(毫秒)"""
+    costs = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        costs.append((time.perf_counter() - start) * 1000)
+    return statistics.median(costs)
+
+
+def create_skus(spu, category, start, stop):
+    """批量生成测试商品"""
+    skus = []
+    for i in range(start, stop):
+        price = Decimal(random.randint(100, 100000)) / 100
+        skus.append(SKU(name='bench-%d' % i, caption='bench', spu=spu, category=category, price=price,
+                        cost_price=price, market_price=price, stock=100, sales=random.randint(0, 10000)))
+        if len(skus) >= BATCH_SIZE:
+            SKU.objects.bulk_create(skus)
+            skus = []
+    SKU.objects.bulk_create(skus)
+
+
+def bench(category, size):
+    limit = constants.GOODS_LIST_LIMIT
+    sku_qs = SKU.objects.filter(category=category, is_launched=True)
+    for sort, ordering in constants.GOODS_LIST_ORDERINGS.items():
+        field = ordering[0].lstrip('-')
+        for offset in [0, size // 2, size - limit]:
+            def offset_page():
+                list(sku_qs.order_by(*ordering)[offset:offset + limit])
+
+            if offset:
+                after = sku_qs.order_by(*ordering).values_list(field, 'id')[offset - 1]
+            else:
+                # 第一页没有游标,用第一个商品作游标,查询耗时与第一页相当
+                after = sku_qs.order_by(*ordering).values_list(field, 'id')[0]
+
+            def keyset_page():
+                get_keyset_page(sku_qs, sort, after, limit)
+
+            print('%8d  %-8s %8d  offset %8.2fms  keyset %8.2fms' % (
+                size, sort, offset, timeit(offset_page), timeit(keyset_page)))
+
+
+def main():
+    with transaction.atomic():
+        brand = Brand.objects.create(name='bench', logo='bench', first_letter='B')
+        cat1 = GoodsCategory.objects.create(name='bench1')
+        cat2 = GoodsCategory.objects.create(name='bench2', parent=cat1)
+        cat3 = GoodsCategory.objects.create(name='bench3', parent=cat2)
+        spu = SPU.objects.create(name='bench', brand=brand, category1=cat1, category2=cat2, category3=cat3)
+
+        print('    size  sort       offset')
+        created = 0
+        for size in SIZES:
+            create_skus(spu, cat3, created, size)
+            created = size
+            bench(cat3, size)
+
+        # 回滚所有测试数据
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+订单编号生成器基准测试
+
+测试单进程和多个进程同时生成订单编号时每秒生成的数量。
+编号不重复、单调递增的检查在 orders/tests.py 中, 用 python manage.py test orders 执行。
+在 manage.py 所在目录执行: python benchmarks/order_id.py [进程数] [每个进程生成的数量]
+"""
+import os
+import sys
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meiduo_mall.settings.dev')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+PROCESSES = int(sys.argv[1]) if len(sys.argv) > 1 else 8  # 进程数
+COUNT = int(sys.argv[2]) if len(sys.argv) > 2 else 200000  # 每个进程生成的数量
+
+
+def generate_ids(count):
+    """在子进程中生成订单编号, 返回耗时"""
+    generator = import_string(settings.ORDER_ID_GENERATOR)()
+    start = time.perf_counter()
+    for _ in range(count):
+        generator.generate()
+    return time.perf_counter() - start
+
+
+def main():
+    cost = generate_ids(COUNT)
+    print('single process: %.0f ids/s' % (COUNT / cost))
+
+    # fork出的子进程各自分配进程号
+    with multiprocessing.Pool(PROCESSES) as pool:
+        costs = pool.map(generate_ids, [COUNT] * PROCESSES)
+
+    total = PROCESSES * COUNT
+    print('%d processes: %.0f ids/s' % (PROCESSES, total / max(costs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+下单扣减库存并发基准测试
+
+50个并发买家同时购买同一个sku, 对比原来的"查询库存 + filter(stock=原库存).update 乐观重试"循环
+和新的"stock >= n 条件UPDATE"在吞吐量和冲突率上的差异。
+冲突率: 乐观锁更新失败需要重新查询的次数 / 成功购买次数; 条件UPDATE统计数据库死锁或锁超时的次数。
+在 manage.py 所在目录执行: python benchmarks/stock_deduction.py <sku_id> [买家数] [每个买家的购买次数]
+测试会真实修改该sku的库存和销量, 结束后恢复原值, 请连接测试数据库执行。
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meiduo_mall.settings.dev')
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction, OperationalError
+
+from goods.models import SKU
+from orders.utils import deduct_stock
+
+SKU_ID = int(sys.argv[1])
+BUYERS = int(sys.argv[2]) if len(sys.argv) > 2 else 50  # 并发买家数
+PURCHASES = int(sys.argv[3]) if len(sys.argv) > 3 else 20  # 每个买家的购买次数
+
+
+def legacy_deduct(sku_id, buy_count):
+    """原来的乐观锁循环, 返回乐观锁更新失败的次数"""
+    conflicts = 0
+    while True:
+        sku = SKU.objects.get(id=sku_id)
+        origin_stock = sku.stock
+        if buy_count > origin_stock:
+            return conflicts
+        result = SKU.objects.filter(id=sku_id, stock=origin_stock).update(
+            stock=origin_stock - buy_count, sales=sku.sales + buy_count)
+        if result:
+            return conflicts
+        conflicts += 1
+
+
+def conditional_deduct(sku_id, buy_count):
+    """条件UPDATE扣减, 不会因为并发修改而失败"""
+    deduct_stock({sku_id: buy_count})
+    return 0
+
+
+def run(deduct):
+    """
+    所有买家同时开始购买
+    :return: (耗时, 冲突次数, 数据库错误次数)
+    """
+    barrier = threading.Barrier(BUYERS + 1)
+    conflicts = [0] * BUYERS
+    errors = [0] * BUYERS
+
+    def buyer(index):
+        barrier.wait()
+        try:
+            for _ in range(PURCHASES):
+                try:
+                    with transaction.atomic():
+                        conflicts[index] += deduct(SKU_ID, 1)
+                except OperationalError:
+                    errors[index] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(BUYERS)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sum(conflicts), sum(errors)
+
+
+def main():
+    origin = SKU.objects.filter(id=SKU_ID).values('stock', 'sales')[0]
+    total = BUYERS * PURCHASES
+    print('%d buyers x %d purchases of sku %d' % (BUYERS, PURCHASES, SKU_ID))
+    print('method       orders/s  conflicts/order  db_errors')
+    try:
+        for name, deduct in (('optimistic', legacy_deduct), ('conditional', conditional_deduct)):
+            SKU.objects.filter(id=SKU_ID).update(stock=total, sales=0)
+            cost, conflicts, errors = run(deduct)
+            stock = SKU.objects.filter(id=SKU_ID).values_list('stock', flat=True)[0]
+            # 库存扣减结果必须与成功购买次数一致, 否则说明有超卖或丢失更新
+            assert stock == errors, (name, stock, errors)
+            print('%-11s  %8.0f  %15.2f  %9d' % (name, (total - errors) / cost, conflicts / total, errors))
+    finally:
+        SKU.objects.filter(id=SKU_ID).update(**origin)
+
+
+if __name__ == '__main__':
+    main()
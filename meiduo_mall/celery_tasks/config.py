@@ -1,2 +1,58 @@
+from datetime import timedelta
+
 # 指定消息队列的位置
 broker_url = 'redis://127.0.0.1/7'
+
+# 下单任务使用单独的队列, 由专门的worker处理: celery -A celery_tasks.main worker -Q orders
+task_routes = {
+    'commit_order': {'queue': 'orders'},
+}
+
+# 定时任务
+beat_schedule = {
+    # 定时重新生成静态首页
+    'generate_static_index_html': {
+        'task': 'generate_static_index_html',
+        'schedule': timedelta(minutes=5),
+    },
+    # 定时将缓冲的分类商品访问量写入数据库
+    'flush_goods_visit': {
+        'task': 'flush_goods_visit',
+        'schedule': timedelta(minutes=1),
+    },
+    # 定时批量更新搜索索引
+    'update_sku_search_index': {
+        'task': 'update_sku_search_index',
+        'schedule': timedelta(seconds=10),
+    },
+    # 定时根据sku销量汇总spu销量
+    'rollup_spu_sales': {
+        'task': 'rollup_spu_sales',
+        'schedule': timedelta(minutes=5),
+    },
+    # 定时把新订单汇总到每日销售汇总表
+    'rollup_order_sales': {
+        'task': 'rollup_order_sales',
+        'schedule': timedelta(minutes=1),
+    },
+    # 定时取消超时未支付的订单
+    'cancel_expired_orders': {
+        'task': 'cancel_expired_orders',
+        'schedule': timedelta(minutes=1),
+    },
+    # 定时将热点商品售出数量同步到数据库
+    'sync_hot_stock': {
+        'task': 'sync_hot_stock',
+        'schedule': timedelta(seconds=10),
+    },
+    # 定时处理过期的热点商品库存预占
+    'resolve_expired_hot_stock_reservations': {
+        'task': 'resolve_expired_hot_stock_reservations',
+        'schedule': timedelta(minutes=1),
+    },
+    # 定时重新归还取消订单后没有归还成功的热点商品库存
+    'retry_hot_stock_restores': {
+        'task': 'retry_hot_stock_restores',
+        'schedule': timedelta(minutes=1),
+    },
+}
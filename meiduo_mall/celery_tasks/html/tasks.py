@@ -0,0 +1,37 @@
+from django.core.cache import cache
+
+from celery_tasks.main import celery_app
+from goods import constants as goods_constants
+from goods.utils import generate_static_sku_detail_html as generate_detail_html
+from goods.utils import generate_all_static_sku_detail_html as generate_all_detail_html
+from contents.utils import generate_static_index_html as generate_index_html
+
+
+@celery_app.task(name='generate_static_sku_detail_html')
+def generate_static_sku_detail_html(sku_id):
+    """
+    生成静态商品详情页面
+    :param sku_id: 商品sku_id
+    :return: None
+    """
+    generate_detail_html(sku_id)
+
+
+@celery_app.task(name='generate_all_static_sku_detail_html')
+def generate_all_static_sku_detail_html():
+    """
+    重新生成所有上架商品的静态详情页面
+    :return: None
+    """
+    # 先清除等待标记, 生成过程中再次修改类别会重新安排一次
+    cache.delete(goods_constants.ALL_DETAIL_HTML_PENDING_CACHE_KEY)
+    generate_all_detail_html()
+
+
+@celery_app.task(name='generate_static_index_html')
+def generate_static_index_html():
+    """
+    生成静态首页
+    :return: None
+    """
+    generate_index_html()
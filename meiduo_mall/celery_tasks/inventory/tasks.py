@@ -0,0 +1,30 @@
+from celery_tasks.main import celery_app
+from goods.inventory import sync_hot_stock as sync_stock, retry_hot_stock_restores as retry_restores
+from orders.utils import resolve_expired_hot_stock_reservations as resolve_reservations
+
+
+@celery_app.task(name='sync_hot_stock')
+def sync_hot_stock():
+    """
+    将redis中已售出的热点商品数量同步到数据库
+    :return: None
+    """
+    sync_stock()
+
+
+@celery_app.task(name='resolve_expired_hot_stock_reservations')
+def resolve_expired_hot_stock_reservations():
+    """
+    确认或释放过期的热点商品库存预占
+    :return: None
+    """
+    resolve_reservations()
+
+
+@celery_app.task(name='retry_hot_stock_restores')
+def retry_hot_stock_restores():
+    """
+    重新归还取消订单后没有归还成功的热点商品库存
+    :return: None
+    """
+    retry_restores()
@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+from celery_tasks.main import celery_app
+from orders.utils import process_order_ticket, cancel_expired_orders as cancel_orders
+
+
+@celery_app.task(name='commit_order')
+def commit_order(ticket, user_id, address_id, pay_method, order_id, lines):
+    """
+    异步下单
+    :param ticket: 下单凭证
+    :param user_id: 用户id
+    :param address_id: 收货地址id
+    :param pay_method: 支付方式
+    :param order_id: 订单编号
+    :param lines: 结算快照中的商品 [[sku_id, 数量, 单价, 分类id], ...]
+    :return: None
+    """
+    lines = {sku_id: (count, Decimal(price), category_id) for sku_id, count, price, category_id in lines}
+    process_order_ticket(ticket, user_id, address_id, pay_method, order_id, lines)
+
+
+@celery_app.task(name='cancel_expired_orders')
+def cancel_expired_orders():
+    """
+    取消超时未支付的订单并归还库存
+    :return: None
+    """
+    cancel_orders()
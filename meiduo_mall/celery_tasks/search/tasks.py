@@ -0,0 +1,11 @@
+from celery_tasks.main import celery_app
+from goods.search_signals import update_queued_search_index
+
+
+@celery_app.task(name='update_sku_search_index')
+def update_sku_search_index():
+    """
+    批量更新队列中sku的搜索索引
+    :return: None
+    """
+    update_queued_search_index()
@@ -0,0 +1,30 @@
+from celery_tasks.main import celery_app
+from goods.utils import flush_goods_visit as flush_visit, rollup_spu_sales as rollup_sales
+from orders.rollups import rollup_sales as rollup_orders
+
+
+@celery_app.task(name='flush_goods_visit')
+def flush_goods_visit():
+    """
+    将redis中缓冲的分类商品访问量写入数据库
+    :return: None
+    """
+    flush_visit()
+
+
+@celery_app.task(name='rollup_spu_sales')
+def rollup_spu_sales():
+    """
+    根据sku销量汇总spu销量
+    :return: None
+    """
+    rollup_sales()
+
+
+@celery_app.task(name='rollup_order_sales')
+def rollup_order_sales():
+    """
+    从水位线开始把新订单汇总到每日销售汇总表
+    :return: None
+    """
+    rollup_orders()
@@ -1,2 +1,27 @@
 # 未登录用户新增购物车商品有效时间
 CARTS_COOKIE_EXPIRES = 60 * 60 * 24 * 7
+
+# cookie购物车编码格式版本
+CARTS_COOKIE_VERSION = 1
+
+# cookie购物车签名长度(字节)
+CARTS_COOKIE_SIGNATURE_LENGTH = 12
+
+# 是否兼容读取旧版pickle格式的cookie购物车, 迁移期结束后改为False
+CARTS_COOKIE_ACCEPT_LEGACY = True
+
+# 购物车存储操作超过该耗时(秒)时记录警告日志
+CART_STORE_SLOW_OP_SECONDS = 0.05
+
+# 每个进程每隔多久(秒)把购物车存储操作统计写入日志并重新统计
+CART_STORE_STATS_LOG_INTERVAL = 60 * 5
+
+# 匿名redis购物车的访客标识cookie
+CART_TOKEN_COOKIE_NAME = 'cart_token'
+CART_TOKEN_COOKIE_SALT = 'carts.cart_token'
+
+# 匿名redis购物车有效时间, 每次修改后刷新
+CARTS_ANONYMOUS_EXPIRES = 60 * 60 * 24 * 7
+
+# 匿名redis购物车的商品种类上限
+CARTS_ANONYMOUS_MAX_ITEMS = 100
@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from carts.stores import RedisCartStore
+
+
+class Command(BaseCommand):
+    help = '在线把redis购物车从 carts_<user_id> + selected_<user_id> 转换为 cart_<user_id> 单哈希结构'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='每次SCAN的键数量')
+        parser.add_argument('--sleep', type=float, default=0, help='每批之间暂停的秒数, 用于降低对线上请求的影响')
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('carts')
+        migrated = 0
+
+        # 只有勾选集合没有购物车哈希的旧数据也需要清理, 所以两种键都要扫描
+        for pattern in ('carts_*', 'selected_*'):
+            prefix = pattern[:-1]
+            batch = 0
+            for key in redis_conn.scan_iter(match=pattern, count=options['count']):
+                user_id = key.decode()[len(prefix):]
+                if not user_id.isdigit():
+                    continue
+
+                # 每个用户的转换是一次Lua脚本调用, 与线上的购物车操作互斥, 重复执行也是安全的
+                RedisCartStore(user_id, redis_conn).migrate()
+                migrated += 1
+
+                batch += 1
+                if batch >= options['count']:
+                    batch = 0
+                    self.stdout.write('已转换%d个购物车' % migrated)
+                    if options['sleep']:
+                        time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('购物车结构转换完成, 共%d个' % migrated))
@@ -0,0 +1,544 @@
+import os, time, uuid, hashlib, logging
+from functools import wraps
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from . import constants
+from .utils import encode_cart_cookie, decode_cart_cookie
+
+logger = logging.getLogger('django')
+
+
+class CartStoreStats(object):
+    """购物车存储操作统计: 每种操作的次数、每秒操作数和耗时, 定期写入日志"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.time()
+        self.ops = {}  # {操作名: [次数, 总耗时, 最大耗时]}
+
+    def record(self, op, cost):
+        stat = self.ops.setdefault(op, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += cost
+        stat[2] = max(stat[2], cost)
+        if cost > constants.CART_STORE_SLOW_OP_SECONDS:
+            logger.warning('购物车存储操作%s耗时%.1fms' % (op, cost * 1000))
+        # 统计满一个周期后写入日志, 各进程的日志汇总即为整体的操作量
+        if time.time() - self.started_at >= constants.CART_STORE_STATS_LOG_INTERVAL:
+            self.log()
+            self.reset()
+
+    def log(self):
+        """把当前进程的统计数据写入日志"""
+        for op, stat in sorted(self.snapshot().items()):
+            logger.info('购物车存储操作统计 pid=%s op=%s count=%d ops_per_sec=%.2f avg_ms=%.2f max_ms=%.2f' % (
+                os.getpid(), op, stat['count'], stat['ops_per_sec'], stat['avg_ms'], stat['max_ms']))
+
+    def snapshot(self):
+        """
+        当前进程的统计数据
+        :return: {操作名: {'count': 次数, 'ops_per_sec': 每秒操作数, 'avg_ms': 平均耗时, 'max_ms': 最大耗时}}
+        """
+        elapsed = max(time.time() - self.started_at, 1e-6)
+        return {op: {
+            'count': count,
+            'ops_per_sec': count / elapsed,
+            'avg_ms': total / count * 1000,
+            'max_ms': maximum * 1000,
+        } for op, (count, total, maximum) in self.ops.items()}
+
+
+# 当前进程的购物车存储操作统计
+cart_store_stats = CartStoreStats()
+
+
+def instrument(func):
+    """记录购物车存储操作的次数和耗时"""
+    op = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            cart_store_stats.record('%s.%s' % (self.name, op), time.perf_counter() - start)
+
+    return wrapper
+
+
+class CartStore(object):
+    """
+    购物车存储
+    购物车数据统一为 {sku_id: {'count': 数量, 'selected': 是否勾选}}
+    """
+    name = None
+
+    def get(self):
+        """查询购物车"""
+        raise NotImplementedError
+
+    def get_selected(self):
+        """查询勾选的商品 {sku_id: 数量}"""
+        raise NotImplementedError
+
+    def add(self, sku_id, count, selected):
+        """添加商品, 已存在时累加数量, 超过购物车商品种类上限时返回False"""
+        raise NotImplementedError
+
+    def set(self, sku_id, count, selected):
+        """修改商品数量和勾选状态, 超过购物车商品种类上限时返回False"""
+        raise NotImplementedError
+
+    def remove(self, *sku_ids):
+        """删除商品"""
+        raise NotImplementedError
+
+    def select_all(self, selected):
+        """全选或取消全选"""
+        raise NotImplementedError
+
+    def merge(self, cart_dict):
+        """合并购物车, 相同商品以cart_dict为准"""
+        raise NotImplementedError
+
+    def get_etag(self):
+        """购物车的ETag, 购物车修改后改变"""
+        raise NotImplementedError
+
+    def save(self, response):
+        """把修改写入响应"""
+        pass
+
+
+# 购物车保存在 cart_<user_id> 一个哈希中, 字段为sku_id, 值为带符号的数量: 正数表示勾选, 负数表示未勾选
+# 所有脚本的 KEYS: 新购物车哈希, 购物车版本号, 旧购物车哈希, 旧勾选集合; 匿名购物车没有旧结构, 只传前两个键
+# 执行前先把旧结构(carts_<user_id> 哈希 + selected_<user_id> 集合)转换为新结构, 迁移期间新旧数据都可读写
+# 每次修改购物车都递增版本号, 用作迷你购物车接口的ETag
+CART_LUA = """
+local function migrate()
+    -- 没有旧结构时只做一次EXISTS检查, 读购物车不会产生写命令
+    if #KEYS < 4 or redis.call('EXISTS', KEYS[3], KEYS[4]) == 0 then
+        return
+    end
+    local old_cart = redis.call('HGETALL', KEYS[3])
+    for i = 1, #old_cart, 2 do
+        local count = tonumber(old_cart[i + 1])
+        -- 新结构用符号表示勾选状态, 无法保存数量不大于0的商品, 旧结构中这样的商品不迁移
+        if count > 0 then
+            local selected = redis.call('SISMEMBER', KEYS[4], old_cart[i]) == 1
+            -- 滚动发布期间旧代码可能在迁移后又写入旧结构, 新旧结构中都有的商品合并:
+            -- 数量取较大的一个, 任意一边勾选即为勾选, 两边的修改都不会丢失
+            local current = redis.call('HGET', KEYS[1], old_cart[i])
+            if current then
+                current = tonumber(current)
+                count = math.max(count, math.abs(current))
+                selected = selected or current >= 0
+            end
+            if not selected then
+                count = -count
+            end
+            redis.call('HSET', KEYS[1], old_cart[i], count)
+        end
+    end
+    redis.call('DEL', KEYS[3], KEYS[4])
+    -- 购物车内容可能改变, 递增版本号
+    redis.call('INCR', KEYS[2])
+end
+
+local function bump()
+    redis.call('INCR', KEYS[2])
+end
+"""
+
+# 迁移旧结构
+MIGRATE_SCRIPT = CART_LUA + """
+migrate()
+return 1
+"""
+
+# 添加商品 ARGV: sku_id, 数量, 是否勾选, 商品种类上限(0为不限制); 未勾选时保持原有的勾选状态
+ADD_SCRIPT = CART_LUA + """
+migrate()
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current and ARGV[4] ~= '0' and redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 0
+end
+local count = tonumber(ARGV[2])
+local selected = ARGV[3] == '1'
+if current then
+    current = tonumber(current)
+    count = count + math.abs(current)
+    selected = selected or current >= 0
+end
+if not selected then
+    count = -count
+end
+redis.call('HSET', KEYS[1], ARGV[1], count)
+bump()
+return 1
+"""
+
+# 修改商品 ARGV: sku_id, 带符号的数量, 商品种类上限(0为不限制)
+SET_SCRIPT = CART_LUA + """
+migrate()
+if ARGV[3] ~= '0' and redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0
+        and redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+bump()
+return 1
+"""
+
+# 删除商品 ARGV: sku_id...
+REMOVE_SCRIPT = CART_LUA + """
+migrate()
+if redis.call('HDEL', KEYS[1], unpack(ARGV)) > 0 then
+    bump()
+end
+return 1
+"""
+
+# 全选或取消全选 ARGV: 是否勾选
+SELECT_ALL_SCRIPT = CART_LUA + """
+migrate()
+local cart = redis.call('HGETALL', KEYS[1])
+for i = 1, #cart, 2 do
+    local count = math.abs(tonumber(cart[i + 1]))
+    if ARGV[1] ~= '1' then
+        count = -count
+    end
+    redis.call('HSET', KEYS[1], cart[i], count)
+end
+if #cart > 0 then
+    bump()
+end
+return 1
+"""
+
+# 查询购物车
+READ_SCRIPT = CART_LUA + """
+migrate()
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# 查询购物车和版本号, 用于生成结算快照
+READ_WITH_VERSION_SCRIPT = CART_LUA + """
+migrate()
+return {redis.call('HGETALL', KEYS[1]), redis.call('GET', KEYS[2]) or '0'}
+"""
+
+# 合并购物车 ARGV: sku_id, 带符号的数量, ...
+MERGE_SCRIPT = CART_LUA + """
+migrate()
+redis.call('HMSET', KEYS[1], unpack(ARGV))
+bump()
+return 1
+"""
+
+# 登录时把匿名购物车合并到用户购物车, 相同商品以匿名购物车为准
+# KEYS: 用户购物车的四个键, 匿名购物车哈希, 匿名购物车版本号
+MERGE_ANONYMOUS_SCRIPT = CART_LUA + """
+migrate()
+if redis.call('EXISTS', KEYS[5]) == 0 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    -- 用户购物车为空时直接改名
+    redis.call('RENAME', KEYS[5], KEYS[1])
+    redis.call('PERSIST', KEYS[1])
+else
+    redis.call('HMSET', KEYS[1], unpack(redis.call('HGETALL', KEYS[5])))
+    redis.call('DEL', KEYS[5])
+end
+redis.call('DEL', KEYS[6])
+bump()
+return 1
+"""
+
+
+def encode_cart_count(count, selected):
+    """
+    把数量和勾选状态编码为带符号的数量
+    :param count: 数量, 必须大于0
+    :param selected: 是否勾选
+    :return: 带符号的数量
+    """
+    if count <= 0:
+        raise ValueError('购物车商品数量必须大于0: %s' % count)
+    return count if selected else -count
+
+
+def decode_cart_count(value):
+    """
+    解码带符号的数量
+    :param value: 哈希字段值
+    :return: (数量, 是否勾选)
+    """
+    value = int(value)
+    return abs(value), value >= 0
+
+
+def get_cart_keys(user_id):
+    """
+    购物车使用的redis键
+    :return: [新购物车哈希, 购物车版本号, 旧购物车哈希, 旧勾选集合]
+    """
+    return ['cart_%s' % user_id, 'cart_version_%s' % user_id, 'carts_%s' % user_id, 'selected_%s' % user_id]
+
+
+class RedisCartStore(CartStore):
+    """
+    登录用户的redis购物车
+    数据保存在 cart_<user_id> 一个哈希中, 每个操作都是一次Lua脚本调用
+    """
+    name = 'redis'
+    max_items = 0  # 商品种类上限, 0为不限制
+    _scripts = {}  # 当前进程注册过的Lua脚本
+
+    def __init__(self, user_id, redis_conn=None):
+        self.user_id = user_id
+        self.redis_conn = redis_conn or get_redis_connection('carts')
+        self.keys = get_cart_keys(user_id)
+
+    def _run(self, script, *args):
+        if script not in self._scripts:
+            self._scripts[script] = self.redis_conn.register_script(script)
+        return self._scripts[script](keys=self.keys, args=args, client=self.redis_conn)
+
+    def _read(self, redis_cart=None):
+        if redis_cart is None:
+            redis_cart = self._run(READ_SCRIPT)
+        cart_dict = {}
+        for i in range(0, len(redis_cart), 2):
+            count, selected = decode_cart_count(redis_cart[i + 1])
+            cart_dict[int(redis_cart[i])] = {'count': count, 'selected': selected}
+        return cart_dict
+
+    @instrument
+    def get(self):
+        return self._read()
+
+    @instrument
+    def get_selected(self):
+        return {sku_id: item['count'] for sku_id, item in self._read().items() if item['selected']}
+
+    @instrument
+    def add(self, sku_id, count, selected):
+        if count <= 0:
+            raise ValueError('购物车商品数量必须大于0: %s' % count)
+        return bool(self._run(ADD_SCRIPT, int(sku_id), count, int(bool(selected)), self.max_items))
+
+    @instrument
+    def set(self, sku_id, count, selected):
+        return bool(self._run(SET_SCRIPT, int(sku_id), encode_cart_count(count, selected), self.max_items))
+
+    @instrument
+    def remove(self, *sku_ids):
+        if sku_ids:
+            self._run(REMOVE_SCRIPT, *[int(sku_id) for sku_id in sku_ids])
+
+    @instrument
+    def select_all(self, selected):
+        self._run(SELECT_ALL_SCRIPT, int(bool(selected)))
+
+    @instrument
+    def merge(self, cart_dict):
+        args = []
+        for sku_id, item in cart_dict.items():
+            # 旧版本写入的cookie中可能有数量不大于0的商品, 不合并
+            if item['count'] <= 0:
+                continue
+            args.extend([int(sku_id), encode_cart_count(item['count'], item['selected'])])
+        if args:
+            self._run(MERGE_SCRIPT, *args)
+
+    @instrument
+    def get_etag(self):
+        # 只读取版本号, 不读取购物车
+        return '"u%s-%s"' % (self.user_id, self.get_version())
+
+    def get_version(self):
+        """购物车版本号, 每次修改购物车后递增"""
+        return int(self.redis_conn.get(self.keys[1]) or 0)
+
+    @instrument
+    def get_selected_with_version(self):
+        """
+        在一次脚本调用中查询勾选的商品和购物车版本号, 两者一定对应同一个购物车状态
+        :return: ({sku_id: 数量}, 版本号)
+        """
+        redis_cart, version = self._run(READ_WITH_VERSION_SCRIPT)
+        selected = {sku_id: item['count'] for sku_id, item in self._read(redis_cart).items() if item['selected']}
+        return selected, int(version)
+
+    def migrate(self):
+        """把旧结构的购物车转换为新结构"""
+        self._run(MIGRATE_SCRIPT)
+
+    def merge_anonymous(self, token):
+        """
+        把匿名购物车合并到当前用户的购物车
+        :param token: 匿名购物车的访客标识
+        :return: 是否有匿名购物车
+        """
+        keys = self.keys + get_anonymous_cart_keys(token)
+        script = self._scripts.get(MERGE_ANONYMOUS_SCRIPT)
+        if script is None:
+            script = self._scripts[MERGE_ANONYMOUS_SCRIPT] = self.redis_conn.register_script(MERGE_ANONYMOUS_SCRIPT)
+        return bool(script(keys=keys, client=self.redis_conn))
+
+
+def get_anonymous_cart_keys(token):
+    """
+    匿名购物车使用的redis键
+    :return: [购物车哈希, 购物车版本号]
+    """
+    return ['cart_anonymous_%s' % token, 'cart_version_anonymous_%s' % token]
+
+
+def get_cart_token(request):
+    """
+    读取请求中的访客标识
+    :return: 签名校验通过的访客标识, 没有或校验失败时返回None
+    """
+    return request.get_signed_cookie(constants.CART_TOKEN_COOKIE_NAME, default=None,
+                                     salt=constants.CART_TOKEN_COOKIE_SALT)
+
+
+class AnonymousRedisCartStore(RedisCartStore):
+    """
+    未登录用户的redis购物车
+    访客标识保存在签名cookie中, 购物车保存在 cart_anonymous_<访客标识> 哈希中,
+    每次修改都会刷新有效期, 商品种类数有上限
+    """
+    name = 'anonymous'
+    max_items = constants.CARTS_ANONYMOUS_MAX_ITEMS
+
+    def __init__(self, request):
+        self.token = get_cart_token(request)
+        self.is_new_token = self.token is None
+        if self.is_new_token:
+            # 第一次修改购物车时才需要写入访客标识cookie
+            self.token = uuid.uuid4().hex
+        self.modified = False
+        self.user_id = None
+        self.redis_conn = get_redis_connection('carts')
+        self.keys = get_anonymous_cart_keys(self.token)
+
+    def _run(self, script, *args):
+        if script not in self._scripts:
+            self._scripts[script] = self.redis_conn.register_script(script)
+
+        if self.is_new_token and script in (READ_SCRIPT, REMOVE_SCRIPT, SELECT_ALL_SCRIPT):
+            # 新访客还没有购物车, 不需要访问redis
+            return []
+        if script is READ_SCRIPT:
+            return self._scripts[script](keys=self.keys, args=args, client=self.redis_conn)
+
+        # 修改和刷新有效期在同一次网络往返中完成
+        self.modified = True
+        pl = self.redis_conn.pipeline()
+        self._scripts[script](keys=self.keys, args=args, client=pl)
+        for key in self.keys:
+            pl.expire(key, constants.CARTS_ANONYMOUS_EXPIRES)
+        return pl.execute()[0]
+
+    @instrument
+    def get_etag(self):
+        version = 0 if self.is_new_token else self.redis_conn.get(self.keys[1])
+        return '"a%s-%s"' % (self.token, int(version or 0))
+
+    def save(self, response):
+        if self.modified:
+            # 访客标识cookie与购物车同时过期
+            response.set_signed_cookie(constants.CART_TOKEN_COOKIE_NAME, self.token,
+                                       salt=constants.CART_TOKEN_COOKIE_SALT,
+                                       max_age=constants.CARTS_ANONYMOUS_EXPIRES, httponly=True)
+
+
+class CookieCartStore(CartStore):
+    """未登录用户的cookie购物车, 修改后调用save写入响应"""
+    name = 'cookie'
+
+    def __init__(self, request):
+        self.cart_str = request.COOKIES.get('carts') or ''
+        self._cart_dict = None
+        self.modified = False
+
+    @property
+    def cart_dict(self):
+        # 只查询ETag时不需要解码cookie
+        if self._cart_dict is None:
+            self._cart_dict = decode_cart_cookie(self.cart_str)
+        return self._cart_dict
+
+    @instrument
+    def get(self):
+        return self.cart_dict
+
+    @instrument
+    def get_selected(self):
+        return {sku_id: item['count'] for sku_id, item in self.cart_dict.items() if item['selected']}
+
+    @instrument
+    def add(self, sku_id, count, selected):
+        sku_id = int(sku_id)
+        # 判断要加入购物车的商品是否已经在购物车中,如有相同商品，累加求和，反之，直接赋值
+        if sku_id in self.cart_dict:
+            count += self.cart_dict[sku_id]['count']
+        self.cart_dict[sku_id] = {'count': count, 'selected': selected}
+        self.modified = True
+        return True
+
+    @instrument
+    def set(self, sku_id, count, selected):
+        self.cart_dict[int(sku_id)] = {'count': count, 'selected': selected}
+        self.modified = True
+        return True
+
+    @instrument
+    def remove(self, *sku_ids):
+        for sku_id in sku_ids:
+            if self.cart_dict.pop(int(sku_id), None) is not None:
+                self.modified = True
+
+    @instrument
+    def select_all(self, selected):
+        for item in self.cart_dict.values():
+            item['selected'] = selected
+        self.modified = bool(self.cart_dict) or self.modified
+
+    @instrument
+    def merge(self, cart_dict):
+        for sku_id, item in cart_dict.items():
+            self.cart_dict[int(sku_id)] = dict(item)
+        self.modified = True
+
+    @instrument
+    def get_etag(self):
+        # cookie购物车没有版本号, 使用cookie内容的摘要
+        return '"c%s"' % hashlib.md5(self.cart_str.encode()).hexdigest()
+
+    def save(self, response):
+        if self.modified:
+            # 将购物车字典编码为cookie字符串写入响应
+            response.set_cookie('carts', encode_cart_cookie(self.cart_dict), max_age=constants.CARTS_COOKIE_EXPIRES)
+
+
+def get_cart_store(request):
+    """
+    根据用户登录状态获取购物车存储
+    :param request: 请求对象
+    :return: 已登录用户返回redis购物车, 未登录用户根据配置返回匿名redis购物车或cookie购物车
+    """
+    user = request.user
+    if user is not None and user.is_authenticated:
+        return RedisCartStore(user.id)
+    if settings.CARTS_ANONYMOUS_REDIS_ENABLED:
+        return AnonymousRedisCartStore(request)
+    return CookieCartStore(request)
@@ -1,5 +1,108 @@
-import pickle, base64
-from django_redis import get_redis_connection
+import io, pickle, base64
+from django.utils.crypto import salted_hmac, constant_time_compare
+
+from . import constants
+
+
+def _write_varint(buffer, value):
+    """写入一个无符号变长整数"""
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, offset):
+    """读取一个无符号变长整数, 返回(值, 新的偏移)"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _sign(payload):
+    return salted_hmac('carts.cookie', payload).digest()[:constants.CARTS_COOKIE_SIGNATURE_LENGTH]
+
+
+def encode_cart_cookie(cart_dict):
+    """
+    将购物车字典编码为cookie字符串
+    格式: base64url(版本 + 按sku_id排序的[sku_id差值, 数量<<1|是否勾选]变长整数序列 + 签名)
+    :param cart_dict: {sku_id: {'count': 数量, 'selected': 是否勾选}}
+    :return: cookie字符串
+    """
+    payload = bytearray([constants.CARTS_COOKIE_VERSION])
+    previous_id = 0
+    for sku_id in sorted(int(sku_id) for sku_id in cart_dict):
+        item = cart_dict.get(sku_id, cart_dict.get(str(sku_id)))
+        # 数量用zigzag编码, 兼容非正数
+        count = int(item['count'])
+        count = (count << 1) ^ (count >> 63)
+        _write_varint(payload, sku_id - previous_id)
+        _write_varint(payload, (count << 1) | bool(item['selected']))
+        previous_id = sku_id
+
+    payload += _sign(bytes(payload))
+    return base64.urlsafe_b64encode(bytes(payload)).rstrip(b'=').decode()
+
+
+class _LegacyCartUnpickler(pickle.Unpickler):
+    """旧版cookie购物车只包含字典、整数、布尔值, 禁止加载任何类和函数"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('forbidden global %s.%s' % (module, name))
+
+
+def _decode_legacy_cart_cookie(cart_str):
+    """解码旧版base64(pickle)格式的cookie购物车"""
+    cart_dict = _LegacyCartUnpickler(io.BytesIO(base64.b64decode(cart_str.encode()))).load()
+    return {int(sku_id): {'count': int(item['count']), 'selected': bool(item['selected'])}
+            for sku_id, item in cart_dict.items()}
+
+
+def decode_cart_cookie(cart_str):
+    """
+    将cookie字符串解码为购物车字典, 数据无效或签名不正确时返回空购物车
+    :param cart_str: cookie字符串
+    :return: {sku_id: {'count': 数量, 'selected': 是否勾选}}
+    """
+    if not cart_str:
+        return {}
+
+    try:
+        data = base64.urlsafe_b64decode(cart_str + '=' * (-len(cart_str) % 4))
+    except ValueError:
+        data = b''
+
+    payload, signature = data[:-constants.CARTS_COOKIE_SIGNATURE_LENGTH], \
+        data[-constants.CARTS_COOKIE_SIGNATURE_LENGTH:]
+    if payload[:1] == bytes([constants.CARTS_COOKIE_VERSION]) and constant_time_compare(signature, _sign(payload)):
+        cart_dict = {}
+        sku_id = 0
+        offset = 1
+        while offset < len(payload):
+            delta, offset = _read_varint(payload, offset)
+            value, offset = _read_varint(payload, offset)
+            sku_id += delta
+            count = value >> 1
+            cart_dict[sku_id] = {
+                'count': (count >> 1) ^ -(count & 1),
+                'selected': bool(value & 1),
+            }
+        return cart_dict
+
+    if constants.CARTS_COOKIE_ACCEPT_LEGACY:
+        try:
+            return _decode_legacy_cart_cookie(cart_str)
+        except Exception:
+            pass
+
+    return {}
 
 
 def merge_cart_cookie_to_redis(request, response):
@@ -10,6 +113,17 @@ def merge_cart_cookie_to_redis(request, response):
     :param response: 借用过来准备做删除cookie的响应对象
     :return:
     """
+    from .stores import RedisCartStore, get_cart_token
+
+    # login状态保持函数中会给request.user赋值为当前登录用户
+    cart_store = RedisCartStore(request.user.id)
+
+    # 匿名redis购物车在服务端合并, 相同商品以匿名购物车为准
+    token = get_cart_token(request)
+    if token is not None:
+        cart_store.merge_anonymous(token)
+        response.delete_cookie(constants.CART_TOKEN_COOKIE_NAME)
+
     # 先获取cookie
     cart_str = request.COOKIES.get('carts')
 
@@ -18,27 +132,10 @@ def merge_cart_cookie_to_redis(request, response):
         # 如果cookie中没有购物车数据,直接返回cute
         return
     # 把cookie购物车的字符串 转换成字典
-    cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-
-    # 创建redis连接对象
-    redis_conn = get_redis_connection('carts')
-    # 创建管道
-    pl = redis_conn.pipeline()
+    cart_dict = decode_cart_cookie(cart_str)
 
-    # login状态保持函数中会给request.user赋值为当前登录用户
-    user = request.user
-
-    # 遍历cookie大字典,把sku_id和count向redis中的hash中存储
-    for sku_id in cart_dict:
-        # 把cookie中的sku_id和count向redis中的hash去存储, 如果存储的sku_id已存在,就直接覆盖,不存在就新增
-        pl.hset('carts_%s' % user.id, sku_id, cart_dict[sku_id]['count'])
-        # 判断当前cookie中的商品是否勾选,如果勾选直接把勾选的商品sku_id存储到set集合
-        if cart_dict[sku_id]['selected']:
-            pl.sadd('selected_%s' % user.id, sku_id)
-        else:
-            pl.srem('selected_%s' % user.id, sku_id)
-    # 执行管道
-    pl.execute()
+    # 把cookie中的商品合并到redis购物车, 相同商品以cookie为准
+    cart_store.merge(cart_dict)
 
     # 删除cookie购物车数据
-    response.delete_cookie('carts')  # 删除cookie
\ No newline at end of file
+    response.delete_cookie('carts')  # 删除cookie
@@ -1,11 +1,12 @@
 from django.shortcuts import render
 from django.views import View
-import json, base64, pickle
-from django.http import HttpResponseForbidden, JsonResponse
-from django_redis import get_redis_connection
+import json
+from django.http import HttpResponseForbidden, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
 
 from goods.models import SKU
-from . import constants
+from goods.utils import get_sku_cards
+from .stores import get_cart_store
 from meiduo_mall.utils.response_code import RETCODE
 
 
@@ -14,45 +15,21 @@ class CartsView(View):
 
     def get(self, request):
         """展示购物车"""
-        user = request.user
-
-        if user.is_authenticated:
-            # 用户已登录，查询redis购物车
-            redis_conn = get_redis_connection('carts')
-            # 获取redis中的购物车数据
-            redis_cart = redis_conn.hgetall('carts_%s' % user.id)
-            # 获取redis中的选中状态
-            cart_selected = redis_conn.smembers('selected_%s' % user.id)
-
-            # 将redis中的数据构造成跟cookie中的格式一致，方便统一查询
-            cart_dict = {}
-            for sku_id, count in redis_cart.items():
-                cart_dict[int(sku_id)] = {
-                    'count': int(count),
-                    'selected': sku_id in cart_selected
-                }
-        else:
-            # 用户未登录，查询cookies购物车
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                # 将cart_str转成bytes,再将bytes转成base64的bytes,最后将bytes转字典
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                cart_dict = {}
-
-        # 构造购物车渲染数据
-        sku_ids = cart_dict.keys()
-        skus = SKU.objects.filter(id__in=sku_ids)
+        # 已登录用户查询redis购物车, 未登录用户查询cookie购物车
+        cart_dict = get_cart_store(request).get()
+
+        # 构造购物车渲染数据, 商品信息从sku卡片缓存中读取
+        sku_cards = get_sku_cards(cart_dict.keys())
         cart_skus = []
-        for sku in skus:
+        for sku in sku_cards.values():
             cart_skus.append({
-                'id': sku.id,
-                'name': sku.name,
-                'count': cart_dict.get(sku.id).get('count'),
-                'selected': str(cart_dict.get(sku.id).get('selected')),  # 将True，转'True'，方便json解析
-                'default_image_url': sku.default_image.url,
-                'price': str(sku.price),  # 从Decimal('10.2')中取出'10.2'，方便json解析
-                'amount': str(sku.price * cart_dict.get(sku.id).get('count')),
+                'id': sku['id'],
+                'name': sku['name'],
+                'count': cart_dict.get(sku['id']).get('count'),
+                'selected': str(cart_dict.get(sku['id']).get('selected')),  # 将True，转'True'，方便json解析
+                'default_image_url': sku['default_image_url'],
+                'price': str(sku['price']),  # 从Decimal('10.2')中取出'10.2'，方便json解析
+                'amount': str(sku['price'] * cart_dict.get(sku['id']).get('count')),
             })
 
         context = {
@@ -85,57 +62,22 @@ class CartsView(View):
             count = int(count)
         except Exception:
             return HttpResponseForbidden('参数count有误')
+        if count <= 0:
+            return HttpResponseForbidden('参数count有误')
         # 2.4 判断selected是否是bool值
         if selected:
             if not isinstance(selected, bool):
                 return HttpResponseForbidden('参数selected有误')
 
-        # 3.业务处理：判断用户是否登录
-        user = request.user
-
-        if user.is_authenticated:
-            # 3.1 用户已登录，添加至redis购物车
-            # 创建redis连接对象
-            redis_conn = get_redis_connection('carts')
-            pl = redis_conn.pipeline()
-            # 新增购物车数据
-            pl.hincrby('carts_%s' % user.id, sku_id, count)
-            # 新增选中的状态
-            if selected:
-                pl.sadd('selected_%s' % user.id, sku_id)
-            # 执行管道
-            pl.execute()
-            # 响应结果
-            return JsonResponse({'code': RETCODE.OK, 'errmsg': '添加购物车成功'})
-
-        else:
-            # 3.2 用户未登录，添加至cookies购物车
-            # 用户未登录，操作cookie购物车
-            cart_str = request.COOKIES.get('carts')
-            # 如果用户操作过cookie购物车
-            if cart_str:
-                # 将cart_str转成bytes,再将bytes转成base64的bytes,最后将bytes转字典
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:  # 用户从没有操作过cookie购物车
-                cart_dict = {}
-
-            # 判断要加入购物车的商品是否已经在购物车中,如有相同商品，累加求和，反之，直接赋值
-            if sku_id in cart_dict:
-                # 累加求和
-                origin_count = cart_dict[sku_id]['count']
-                count += origin_count
-            cart_dict[sku_id] = {
-                'count': count,
-                'selected': selected
-            }
-            # 将字典转成bytes,再将bytes转成base64的bytes,最后将bytes转字符串
-            cookie_cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
-
-            # 创建响应对象
-            response = JsonResponse({'code': RETCODE.OK, 'errmsg': '添加购物车成功'})
-            # 响应结果并将购物车数据写入到cookie
-            response.set_cookie('carts', cookie_cart_str, max_age=constants.CARTS_COOKIE_EXPIRES)
-            return response
+        # 3.业务处理：已登录用户添加至redis购物车, 未登录用户添加至cookie购物车
+        cart_store = get_cart_store(request)
+        if not cart_store.add(sku_id, count, selected):
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '购物车商品种类已达上限'})
+
+        # 响应结果,cookie购物车需要写入到cookie
+        response = JsonResponse({'code': RETCODE.OK, 'errmsg': '添加购物车成功'})
+        cart_store.save(response)
+        return response
 
     def put(self, request):
         """修改购物车"""
@@ -158,67 +100,32 @@ class CartsView(View):
             count = int(count)
         except Exception:
             return HttpResponseForbidden('参数count有误')
+        if count <= 0:
+            return HttpResponseForbidden('参数count有误')
         # 判断selected是否为bool值
         if selected:
             if not isinstance(selected, bool):
                 return HttpResponseForbidden('参数selected有误')
 
-        # 判断用户是否登录
-        user = request.user
-        if user.is_authenticated:
-            # 用户已登录，修改redis购物车
-            redis_conn = get_redis_connection('carts')
-            pl = redis_conn.pipeline()
-            # 因为接口设计为幂等的，直接覆盖
-            pl.hset('carts_%s' % user.id, sku_id, count)
-            # 是否选中
-            if selected:
-                pl.sadd('selected_%s' % user.id, sku_id)
-            else:
-                pl.srem('selected_%s' % user.id, sku_id)
-            pl.execute()
-
-            # 创建响应对象
-            cart_sku = {
-                'id': sku_id,
-                'count': count,
-                'selected': selected,
-                'name': sku.name,
-                'default_image_url': sku.default_image.url,
-                'price': sku.price,
-                'amount': sku.price * count,
-            }
-            return JsonResponse({'code': RETCODE.OK, 'errmsg': '修改购物车成功', 'cart_sku': cart_sku})
-        else:
-            # 用户未登录，修改cookie购物车
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                # 将cart_str转成bytes,再将bytes转成base64的bytes,最后将bytes转字典
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                cart_dict = {}
-            # 因为接口设计为幂等的，直接覆盖
-            cart_dict[sku_id] = {
-                'count': count,
-                'selected': selected
-            }
-            # 将字典转成bytes,再将bytes转成base64的bytes,最后将bytes转字符串
-            cookie_cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
-
-            # 创建响应对象
-            cart_sku = {
-                'id': sku_id,
-                'count': count,
-                'selected': selected,
-                'name': sku.name,
-                'default_image_url': sku.default_image.url,
-                'price': sku.price,
-                'amount': sku.price * count,
-            }
-            response = JsonResponse({'code': RETCODE.OK, 'errmsg': '修改购物车成功', 'cart_sku': cart_sku})
-            # 响应结果并将购物车数据写入到cookie
-            response.set_cookie('carts', cookie_cart_str, max_age=constants.CARTS_COOKIE_EXPIRES)
-            return response
+        # 修改购物车, 因为接口设计为幂等的，直接覆盖
+        cart_store = get_cart_store(request)
+        if not cart_store.set(sku_id, count, selected):
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '购物车商品种类已达上限'})
+
+        # 创建响应对象
+        cart_sku = {
+            'id': sku_id,
+            'count': count,
+            'selected': selected,
+            'name': sku.name,
+            'default_image_url': sku.default_image.url,
+            'price': sku.price,
+            'amount': sku.price * count,
+        }
+        response = JsonResponse({'code': RETCODE.OK, 'errmsg': '修改购物车成功', 'cart_sku': cart_sku})
+        # cookie购物车需要写入到cookie
+        cart_store.save(response)
+        return response
 
     def delete(self, request):
         """删除购物车"""
@@ -234,37 +141,14 @@ class CartsView(View):
         except SKU.DoesNotExist:
             return HttpResponseForbidden('商品不存在')
 
-        # 判断用户是否登录
-        user = request.user
-        if user is not None and user.is_authenticated:
-            # 用户已登录，删除redis购物车
-            redis_conn = get_redis_connection('carts')
-            pl = redis_conn.pipeline()
-            # 删除键，就等价于删除了整条记录
-            pl.hdel('carts_%s' % user.id, sku_id)
-            pl.srem('selected_%s' % user.id, sku_id)
-            pl.execute()
-
-            # 删除结束后，没有响应的数据，只需要响应状态码即可
-            return JsonResponse({'code': RETCODE.OK, 'errmsg': '删除购物车成功'})
-        else:
-            # 用户未登录，删除cookie购物车
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                # 将cart_str转成bytes,再将bytes转成base64的bytes,最后将bytes转字典
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                cart_dict = {}
-
-            # 创建响应对象
-            response = JsonResponse({'code': RETCODE.OK, 'errmsg': '删除购物车成功'})
-            if sku_id in cart_dict:
-                del cart_dict[sku_id]
-                # 将字典转成bytes,再将bytes转成base64的bytes,最后将bytes转字符串
-                cookie_cart_str = base64.b64encode(pickle.dumps(cart_dict)).decode()
-                # 响应结果并将购物车数据写入到cookie
-                response.set_cookie('carts', cookie_cart_str, max_age=constants.CARTS_COOKIE_EXPIRES)
-            return response
+        # 删除购物车中的商品
+        cart_store = get_cart_store(request)
+        cart_store.remove(sku_id)
+
+        # 删除结束后，没有响应的数据，只需要响应状态码即可
+        response = JsonResponse({'code': RETCODE.OK, 'errmsg': '删除购物车成功'})
+        cart_store.save(response)
+        return response
 
 
 class CartsSelectAllView(View):
@@ -280,32 +164,13 @@ class CartsSelectAllView(View):
             if not isinstance(selected, bool):
                 return HttpResponseForbidden('参数selected有误')
 
-        # 判断用户是否登录
-        user = request.user
-        if user is not None and user.is_authenticated:
-            # 用户已登录，操作redis购物车
-            redis_conn = get_redis_connection('carts')
-            cart = redis_conn.hgetall('carts_%s' % user.id)
-            sku_id_list = cart.keys()
-            if selected:
-                # 全选
-                redis_conn.sadd('selected_%s' % user.id, *sku_id_list)
-            else:
-                # 取消全选
-                redis_conn.srem('selected_%s' % user.id, *sku_id_list)
-            return JsonResponse({'code': RETCODE.OK, 'errmsg': '全选购物车成功'})
-        else:
-            # 用户未登录，操作cookie购物车
-            cart = request.COOKIES.get('carts')
-            response = JsonResponse({'code': RETCODE.OK, 'errmsg': '全选购物车成功'})
-            if cart is not None:
-                cart = pickle.loads(base64.b64decode(cart.encode()))
-                for sku_id in cart:
-                    cart[sku_id]['selected'] = selected
-                cookie_cart = base64.b64encode(pickle.dumps(cart)).decode()
-                response.set_cookie('carts', cookie_cart, max_age=constants.CARTS_COOKIE_EXPIRES)
+        # 全选或取消全选
+        cart_store = get_cart_store(request)
+        cart_store.select_all(selected)
 
-            return response
+        response = JsonResponse({'code': RETCODE.OK, 'errmsg': '全选购物车成功'})
+        cart_store.save(response)
+        return response
 
 
 class CartsSimpleView(View):
@@ -317,43 +182,30 @@ class CartsSimpleView(View):
         :param request: 请求对象
         :return: 结果
         """
-        user = request.user
-        if user.is_authenticated:
-            # 如果是登录用户,查询redis购物车
-            redis_conn = get_redis_connection('carts')
-            # 获取redis中的购物车数据
-            redis_cart = redis_conn.hgetall('carts_%s' % user.id)
-            # 获取redis的选中状态
-            cart_selected = redis_conn.smembers('selected_%s' % user.id)
-
-            # 将redis中的数据构造成跟cookie中的格式一致,方便统一查询
-            cart_dict = {}
-            for sku_id, count in redis_cart.items():
-                cart_dict[int(sku_id)] = {
-                    'count': int(count),
-                    'selected': sku_id in cart_selected
-                }
-
-        else:
-            # 未登录用户,查询cookie购物车
-            cart_str = request.COOKIES.get('carts')
-            if cart_str:
-                # 将cart_str转换成bytes,再将bytes转成base64的bytes,最后将bytes转成字典
-                cart_dict = pickle.loads(base64.b64decode(cart_str.encode()))
-            else:
-                # 如果购物车没有数据,直接显示购物车页面
-                cart_dict = {}
-
-        # 构造简单购物车渲染数据
-        sku_ids = cart_dict.keys()
-        skus = SKU.objects.filter(id__in=sku_ids)
+        # 购物车未修改时只比较版本号, 不读取购物车和商品信息
+        cart_store = get_cart_store(request)
+        etag = cart_store.get_etag()
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        # 已登录用户查询redis购物车, 未登录用户查询cookie购物车
+        cart_dict = cart_store.get()
+
+        # 构造简单购物车渲染数据, 商品信息从sku卡片缓存中读取
+        sku_cards = get_sku_cards(cart_dict.keys())
         cart_skus = []
-        for sku in skus:
+        for sku in sku_cards.values():
             cart_skus.append({
-                'id': sku.id,
-                'name': sku.name,
-                'count': cart_dict.get(sku.id).get('count'),
-                'default_image_url': sku.default_image.url,
+                'id': sku['id'],
+                'name': sku['name'],
+                'count': cart_dict.get(sku['id']).get('count'),
+                'default_image_url': sku['default_image_url'],
             })
 
-        return JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'cart_skus': cart_skus})
+        response = JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK', 'cart_skus': cart_skus})
+        # 浏览器每次都要带上If-None-Match重新验证
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ContentsConfig(AppConfig):
     name = 'contents'
+
+    def ready(self):
+        # 注册首页数据变更的信号处理
+        from . import signals  # noqa
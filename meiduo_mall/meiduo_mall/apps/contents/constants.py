@@ -0,0 +1,11 @@
+# 商品类别缓存版本号的缓存键
+CATEGORIES_VERSION_CACHE_KEY = 'categories_version'
+
+# 商品类别数据的缓存键,按版本号区分
+CATEGORIES_CACHE_KEY = 'categories_%s'
+
+# 商品类别数据在redis中的缓存时间
+CATEGORIES_CACHE_EXPIRES = 60 * 60 * 24
+
+# 进程内商品类别缓存版本号多久向redis确认一次
+CATEGORIES_LOCAL_CACHE_EXPIRES = 30
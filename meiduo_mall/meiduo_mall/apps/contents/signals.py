@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from celery_tasks.html.tasks import generate_static_index_html, generate_all_static_sku_detail_html
+from goods import constants as goods_constants
+from goods.models import Content, ContentCategory, GoodsCategory, GoodsChannel
+from .utils import reset_categories_version
+
+
+# 先注册类别缓存失效,保证重新生成静态首页时使用的是新的类别数据
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def categories_changed(sender, **kwargs):
+    """商品类别或频道修改后,事务提交时使商品类别缓存失效"""
+    transaction.on_commit(reset_categories_version)
+
+
+def schedule_all_detail_html():
+    """延迟重新生成全部静态详情页,合并短时间内的多次修改"""
+    if cache.add(goods_constants.ALL_DETAIL_HTML_PENDING_CACHE_KEY, 1, goods_constants.ALL_DETAIL_HTML_DELAY * 2):
+        generate_all_static_sku_detail_html.apply_async(countdown=goods_constants.ALL_DETAIL_HTML_DELAY)
+
+
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def detail_nav_changed(sender, **kwargs):
+    """静态详情页中包含商品分类导航,商品类别或频道修改后,事务提交时重新生成全部静态详情页"""
+    transaction.on_commit(schedule_all_detail_html)
+
+
+@receiver([post_save, post_delete], sender=Content)
+@receiver([post_save, post_delete], sender=ContentCategory)
+@receiver([post_save, post_delete], sender=GoodsCategory)
+@receiver([post_save, post_delete], sender=GoodsChannel)
+def index_data_changed(sender, **kwargs):
+    """首页数据修改后,事务提交时重新生成静态首页"""
+    transaction.on_commit(generate_static_index_html.delay)
@@ -1,17 +1,49 @@
-from goods.models import GoodsChannel
+import os, time, uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.template import loader
 
+from goods.models import GoodsCategory, GoodsChannel, ContentCategory
+from . import constants
 
-def get_categories():
-    """返回商品类别数据"""
 
-    # 查询商品频道和分类
+# 进程内的商品类别缓存版本号, 到期前不再向redis确认
+_local_version = {
+    'version': None,  # 缓存版本号
+    'expires': 0,  # 下次需要确认版本号的时间
+}
+
+# 进程内的商品类别数据副本
+_local_categories = {
+    'version': None,  # 副本对应的缓存版本号
+    'data': None,  # 商品类别数据
+}
+
+# 进程内的商品类别id副本
+_local_category_ids = {
+    'version': None,  # 副本对应的缓存版本号
+    'data': None,  # 所有商品类别id
+}
+
+
+def build_categories():
+    """
+    一次查询出所有商品类别,在内存中构造三级类别数据
+    :return: {group_id: {'channels': [cat1], 'sub_cats': [cat2(含sub_cats)]}}
+    """
+    # 按父类别分组所有商品类别
+    subs_dict = {}  # {parent_id: [category]}
+    for category in GoodsCategory.objects.order_by('id').values('id', 'name', 'parent_id'):
+        subs_dict.setdefault(category['parent_id'], []).append(category)
+
     categories = {}  # 用来包装所有商品类别数据
     # 获取所有一级类别分组数据
-    goods_channels_qs = GoodsChannel.objects.order_by('group_id', 'sequence')
+    goods_channels_qs = GoodsChannel.objects.order_by('group_id', 'sequence').values(
+        'group_id', 'url', 'category_id', 'category__name')
 
     # 遍历商品频道查询集
     for channel in goods_channels_qs:
-        group_id = channel.group_id  # 获取组号
+        group_id = channel['group_id']  # 获取组号
 
         # 判断当前的组号在字典中是否存在
         if group_id not in categories:
@@ -21,15 +53,138 @@ def get_categories():
                 'sub_cats': []
             }
 
-        cat1 = channel.category  # 获得一级类别数据
-        cat1.url = channel.url  # 将频道中的url绑定给一级类型对象
+        # 将频道中的url绑定给一级类别
+        categories[group_id]['channels'].append({
+            'id': channel['category_id'],
+            'name': channel['category__name'],
+            'url': channel['url'],
+        })
+
+        # 把二级下面的所有三级绑定给二级类别的sub_cats
+        for cat2 in subs_dict.get(channel['category_id'], []):
+            categories[group_id]['sub_cats'].append({
+                'id': cat2['id'],
+                'name': cat2['name'],
+                'sub_cats': [{'id': cat3['id'], 'name': cat3['name']} for cat3 in subs_dict.get(cat2['id'], [])],
+            })
+
+    return categories
 
-        categories[group_id]['channels'].append(cat1)
 
-        cat2_qs = cat1.subs.all()  # 获取当前一组下面的所有二级数据
-        for cat2 in cat2_qs:  # 遍历二级数据查询集
-            cat3_qs = cat2.subs.all()  # 获得当前二级数据下的所有三级，得到三级查询集
-            cat2.sub_cats = cat3_qs  # 把二级下面的所有三级绑定给cat2对象的sub_cats属性
-            categories[group_id]['sub_cats'].append(cat2)
+def get_categories(refresh=False):
+    """
+    返回商品类别数据
+    :param refresh: 是否立即向redis确认版本号, 生成静态页面时使用, 保证其他进程修改的类别立即生效
+    :return: 商品类别数据
+    """
+    version = get_categories_version(refresh)
+    if version == _local_categories['version']:
+        # 版本号没有变化,继续使用进程内副本
+        return _local_categories['data']
+
+    categories = cache.get(constants.CATEGORIES_CACHE_KEY % version)
+    if categories is None:
+        categories = build_categories()
+        cache.set(constants.CATEGORIES_CACHE_KEY % version, categories, constants.CATEGORIES_CACHE_EXPIRES)
+
+    _local_categories.update({
+        'version': version,
+        'data': categories,
+    })
 
     return categories
+
+
+def get_category_ids():
+    """
+    返回所有商品类别id, 用于校验请求中的类别id
+    :return: frozenset(category_id)
+    """
+    version = get_categories_version()
+    # 版本号变化时才重新查询
+    if version != _local_category_ids['version']:
+        _local_category_ids.update({
+            'version': version,
+            'data': frozenset(GoodsCategory.objects.values_list('id', flat=True)),
+        })
+    return _local_category_ids['data']
+
+
+def get_categories_version(refresh=False):
+    """
+    查询当前商品类别缓存版本号, 进程内的版本号到期前直接使用, 不访问redis
+    :param refresh: 是否忽略进程内的版本号, 立即向redis确认
+    :return: 版本号
+    """
+    now = time.time()
+    if not refresh and _local_version['version'] is not None and now < _local_version['expires']:
+        return _local_version['version']
+
+    version = cache.get(constants.CATEGORIES_VERSION_CACHE_KEY)
+    if version is None:
+        return reset_categories_version()
+
+    _local_version.update({
+        'version': version,
+        'expires': now + constants.CATEGORIES_LOCAL_CACHE_EXPIRES,
+    })
+    return version
+
+
+def reset_categories_version():
+    """
+    生成新的商品类别缓存版本号,使所有进程的旧缓存失效
+    :return: 新版本号
+    """
+    version = uuid.uuid4().hex
+    cache.set(constants.CATEGORIES_VERSION_CACHE_KEY, version, None)
+    # 当前进程立即使用新版本号, 其他进程在进程内的版本号到期后确认时使用
+    _local_version.update({
+        'version': version,
+        'expires': time.time() + constants.CATEGORIES_LOCAL_CACHE_EXPIRES,
+    })
+    return version
+
+
+def get_index_context():
+    """构造首页模板上下文"""
+
+    # 广告数据
+    contents = {}
+    content_categories = ContentCategory.objects.all()
+    for cat in content_categories:
+        contents[cat.key] = cat.content_set.filter(status=True).order_by('sequence')
+
+    # 渲染模板的上下文
+    context = {
+        'categories': get_categories(),
+        'contents': contents,
+    }
+
+    return context
+
+
+def get_static_index_html_path():
+    """获取静态首页文件路径"""
+    return os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'index.html')
+
+
+def generate_static_index_html():
+    """
+    生成静态首页
+    :return: 生成的文件路径
+    """
+    # 静态页面生成后长期使用, 先确认类别版本号, 不使用进程内可能过期的类别数据
+    get_categories(refresh=True)
+    template = loader.get_template('index.html')
+    html_text = template.render(get_index_context())
+
+    # 先写临时文件再替换,保证正在读取静态首页的请求不会读到半个文件
+    file_path = get_static_index_html_path()
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = '%s.%s.tmp' % (file_path, os.getpid())
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(html_text)
+    os.replace(temp_path, file_path)
+
+    return file_path
@@ -1,8 +1,11 @@
+import os, time
+from django import http
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.http import http_date
 from django.views import View
 
-from goods.models import ContentCategory
-from contents.utils import get_categories
+from contents.utils import get_index_context, get_static_index_html_path
 
 
 class IndexView(View):
@@ -12,17 +15,21 @@ class IndexView(View):
         :param request:
         :return:
         """
+        # 静态首页模式下优先返回已生成的静态首页
+        if settings.STATIC_INDEX_HTML_ENABLED:
+            file_path = get_static_index_html_path()
+            try:
+                with open(file_path, 'rb') as f:
+                    html_text = f.read()
+                    generated_time = os.fstat(f.fileno()).st_mtime
+            except FileNotFoundError:
+                # 静态首页还未生成,查询数据库渲染
+                pass
+            else:
+                response = http.HttpResponse(html_text)
+                # 静态首页的生成时间和已生成的秒数
+                response['Last-Modified'] = http_date(generated_time)
+                response['Age'] = max(0, int(time.time() - generated_time))
+                return response
 
-        # 广告数据
-        contents = {}
-        content_categories = ContentCategory.objects.all()
-        for cat in content_categories:
-            contents[cat.key] = cat.content_set.filter(status=True).order_by('sequence')
-
-        # 渲染模板的上下文
-        context = {
-            'categories': get_categories(),
-            'contents': contents,
-        }
-
-        return render(request, 'index.html', context)
+        return render(request, 'index.html', get_index_context())
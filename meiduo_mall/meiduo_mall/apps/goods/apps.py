@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GoodsConfig(AppConfig):
     name = 'goods'
+
+    def ready(self):
+        # 注册商品数据变更的信号处理
+        from . import signals  # noqa
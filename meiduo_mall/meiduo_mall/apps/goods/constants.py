@@ -1 +1,98 @@
-GOODS_LIST_LIMIT = 5
\ No newline at end of file
+GOODS_LIST_LIMIT = 5
+
+# spu规格矩阵的缓存键
+SPU_SPEC_MATRIX_CACHE_KEY = 'spu_spec_matrix_%s'
+
+# spu规格矩阵的缓存时间
+SPU_SPEC_MATRIX_CACHE_EXPIRES = 60 * 60 * 24
+
+# sku卡片(名称,价格,图片等列表展示信息)的缓存键
+SKU_CARD_CACHE_KEY = 'sku_card_%s'
+
+# sku卡片的缓存时间
+SKU_CARD_CACHE_EXPIRES = 60 * 60 * 24
+
+# 列表页各排序方式的排序字段,都以id作为最后的排序字段保证顺序稳定
+GOODS_LIST_ORDERINGS = {
+    'default': ('create_time', 'id'),
+    'price': ('price', 'id'),
+    'hot': ('-sales', '-id'),
+}
+
+# 列表页分类商品总数的缓存键
+GOODS_LIST_COUNT_CACHE_KEY = 'goods_list_count_%s'
+
+# 列表页分类商品总数的缓存时间
+GOODS_LIST_COUNT_CACHE_EXPIRES = 60 * 5
+
+# 分类热销排行的redis键(有序集合, 成员为sku_id, 分值为销量)
+HOT_GOODS_REDIS_KEY = 'hot_skus_%s'
+
+# 列表页和详情页展示的热销商品数量
+HOT_GOODS_LIMIT = 2
+
+# 分类商品访问量的redis缓冲键(哈希, 字段为category_id, 值为访问量), 按日期区分
+GOODS_VISIT_REDIS_KEY = 'goods_visit_%s'
+
+# 正在写入数据库的访问量缓冲键, 按"日期_批次号"区分, 键名同时作为写入数据库的批次
+GOODS_VISIT_FLUSHING_REDIS_KEY = 'goods_visit_flushing_%s'
+
+# 访问量写入数据库的任务锁
+GOODS_VISIT_FLUSH_LOCK_KEY = 'goods_visit_flush_lock'
+
+# 访问量写入数据库的任务锁有效期
+GOODS_VISIT_FLUSH_LOCK_EXPIRES = 60 * 5
+
+# 已写入批次记录的保留时间(天), 崩溃后残留的待写入键在这之前早已重新写入
+GOODS_VISIT_FLUSH_RECORD_DAYS = 7
+
+# 待更新搜索索引的sku_id集合的redis键
+SEARCH_INDEX_QUEUE_REDIS_KEY = 'search_index_queue'
+
+# 每批更新搜索索引的sku数量
+SEARCH_INDEX_BATCH_SIZE = 500
+
+# 影响搜索索引的sku字段, 只有这些字段变化时才需要重建索引
+SEARCH_INDEX_FIELDS = ('name', 'caption', 'is_launched')
+
+# 热点商品在redis中的可售库存, 键存在表示该sku开启了热点库存模式
+HOT_STOCK_REDIS_KEY = 'hot_stock_%s'
+
+# 订单预占的热点商品库存 {sku_id: 数量}
+HOT_STOCK_RESERVATION_REDIS_KEY = 'hot_stock_reservation_%s'
+
+# 所有未确认的库存预占, 分数为过期时间戳
+HOT_STOCK_RESERVATIONS_REDIS_KEY = 'hot_stock_reservations'
+
+# 库存预占的有效时间(秒), 过期仍未确认或释放的预占由定时任务处理
+HOT_STOCK_RESERVATION_EXPIRES = 60 * 5
+
+# 已售出但还未同步到数据库的热点商品库存 {sku_id: 数量}, 负数表示需要归还数据库库存
+HOT_STOCK_PENDING_REDIS_KEY = 'hot_stock_pending'
+
+# 正在同步到数据库的热点商品库存, 批次号保存在该哈希的batch字段中
+HOT_STOCK_SYNCING_REDIS_KEY = 'hot_stock_syncing'
+HOT_STOCK_SYNCING_BATCH_FIELD = 'batch'
+
+# 已同步批次记录的保留时间(天)
+HOT_STOCK_SYNC_RECORD_DAYS = 7
+
+# 同步热点商品库存的任务锁及其过期时间(秒)
+HOT_STOCK_SYNC_LOCK_KEY = 'hot_stock_sync_lock'
+HOT_STOCK_SYNC_LOCK_EXPIRES = 60 * 5
+
+# 已归还到redis的库存标记, 值为归还到redis的sku_id, 重复归还同一条记录时直接返回
+HOT_STOCK_RESTORED_REDIS_KEY = 'hot_stock_restored_%s'
+HOT_STOCK_RESTORED_EXPIRES = 60 * 60 * 24
+
+# 待归还库存记录创建后超过该时间(秒)仍未归还时, 由定时任务重新归还
+HOT_STOCK_RESTORE_RETRY_DELAY = 60
+
+# 汇总spu销量时每条UPDATE更新的spu数量
+SPU_SALES_ROLLUP_BATCH_SIZE = 500
+
+# 等待重新生成全部静态详情页的标记, 标记存在期间的类别或频道修改只重新生成一次
+ALL_DETAIL_HTML_PENDING_CACHE_KEY = 'all_detail_html_pending'
+
+# 类别或频道修改后延迟多久(秒)重新生成全部静态详情页
+ALL_DETAIL_HTML_DELAY = 60
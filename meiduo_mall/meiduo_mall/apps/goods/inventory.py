@@ -0,0 +1,339 @@
+import time, json, uuid, logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_lock import acquire_lock, release_lock
+from .models import SKU, HotStockRestore, HotStockSync
+from . import constants
+
+logger = logging.getLogger('django')
+
+# 热点库存模式:
+# 开启后sku的可售库存保存在redis中, 下单时用Lua脚本原子地预占库存, 不再更新数据库中的sku行;
+# 订单提交成功后确认预占, 售出数量累加到待同步哈希中, 由定时任务批量扣减数据库的库存和增加销量;
+# 订单失败时释放预占, 进程崩溃遗留的预占过期后由定时任务根据订单是否存在确认或释放;
+# 订单取消时热点商品的库存先记录到待归还表, 事务提交后归还到redis, 归还失败的记录由定时任务重新归还。
+
+# 预占库存 KEYS: 预占哈希, 预占有序集合, 各sku的热点库存键...
+# ARGV: 过期时间戳, 订单编号, sku_id, 数量, ...(与热点库存键一一对应)
+# 返回: 预占的sku_id列表, 库存不足时返回-1且不做任何修改
+RESERVE_SCRIPT = """
+local reserved = {}
+for i = 3, #KEYS do
+    local stock = redis.call('GET', KEYS[i])
+    if stock then
+        if tonumber(stock) < tonumber(ARGV[2 * i - 2]) then
+            return -1
+        end
+        table.insert(reserved, i)
+    end
+end
+local sku_ids = {}
+for _, i in ipairs(reserved) do
+    redis.call('DECRBY', KEYS[i], ARGV[2 * i - 2])
+    redis.call('HSET', KEYS[1], ARGV[2 * i - 3], ARGV[2 * i - 2])
+    table.insert(sku_ids, ARGV[2 * i - 3])
+end
+if #sku_ids > 0 then
+    redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+end
+return sku_ids
+"""
+
+# 确认预占, 售出数量计入待同步哈希 KEYS: 预占哈希, 预占有序集合, 待同步哈希  ARGV: 订单编号
+CONFIRM_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[1])
+for i = 1, #items, 2 do
+    redis.call('HINCRBY', KEYS[3], items[i], items[i + 1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return #items / 2
+"""
+
+# 释放预占, 库存退回redis KEYS: 预占哈希, 预占有序集合  ARGV: 订单编号, 热点库存键前缀
+# 期间关闭了热点库存模式的sku没有扣减过数据库库存, 直接丢弃
+RELEASE_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[1])
+for i = 1, #items, 2 do
+    local key = ARGV[2] .. items[i]
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, items[i + 1])
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return #items / 2
+"""
+
+# 归还已售出的库存(如订单取消) KEYS: 待同步哈希, 归还标记, 各sku的热点库存键...
+# ARGV: 归还标记有效期, sku_id, 数量, ...(与热点库存键一一对应)
+# 返回: 归还到redis的sku_id(逗号分隔), 其余sku由调用方归还数据库库存; 已经归还过时直接返回上次的结果
+RESTORE_SCRIPT = """
+local restored = redis.call('GET', KEYS[2])
+if restored then
+    return restored
+end
+local sku_ids = {}
+for i = 3, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[2 * i - 3])
+        redis.call('HINCRBY', KEYS[1], ARGV[2 * i - 4], -tonumber(ARGV[2 * i - 3]))
+        table.insert(sku_ids, ARGV[2 * i - 4])
+    end
+end
+restored = table.concat(sku_ids, ',')
+redis.call('SET', KEYS[2], restored, 'EX', ARGV[1])
+return restored
+"""
+
+# 开始同步: 没有同步中的数据时把待同步哈希改名为同步中的哈希, 并为这一批数据分配批次号
+# KEYS: 待同步哈希, 同步中的哈希  ARGV: 批次号字段, 新批次号
+# 返回: 同步中的哈希的全部字段(含批次号), 没有待同步的数据时返回空列表
+START_SYNC_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[2])
+return redis.call('HGETALL', KEYS[2])
+"""
+
+_scripts = {}  # 当前进程注册过的Lua脚本
+
+
+def _run(script, keys, args):
+    redis_conn = get_redis_connection('inventory')
+    if script not in _scripts:
+        _scripts[script] = redis_conn.register_script(script)
+    return _scripts[script](keys=keys, args=args, client=redis_conn)
+
+
+def enable_hot_stock(sku_id):
+    """
+    开启sku的热点库存模式, 把数据库中的库存加载到redis
+    锁住sku行后加载, 加载时不能有正在扣减该sku库存的事务, 建议在活动开始前执行
+    :param sku_id: 商品sku_id
+    :return: 加载的库存, 已经开启时返回None
+    """
+    redis_conn = get_redis_connection('inventory')
+    with transaction.atomic():
+        stock = SKU.objects.select_for_update().filter(id=sku_id).values_list('stock', flat=True)[0]
+        if not redis_conn.set(constants.HOT_STOCK_REDIS_KEY % sku_id, stock, nx=True):
+            return None
+    return stock
+
+
+def disable_hot_stock(sku_id):
+    """
+    关闭sku的热点库存模式, 之后的订单直接扣减数据库库存
+    已售出的数量立即同步到数据库
+    :param sku_id: 商品sku_id
+    :return: None
+    """
+    get_redis_connection('inventory').delete(constants.HOT_STOCK_REDIS_KEY % sku_id)
+    sync_hot_stock()
+
+
+def get_hot_stock(sku_id):
+    """
+    查询sku在redis中的可售库存
+    :return: 库存, 未开启热点库存模式时返回None
+    """
+    stock = get_redis_connection('inventory').get(constants.HOT_STOCK_REDIS_KEY % sku_id)
+    return None if stock is None else int(stock)
+
+
+def reserve_hot_stock(order_id, cart_dict):
+    """
+    为订单预占热点商品的库存, 所有商品要么全部预占成功, 要么都不预占
+    :param order_id: 订单编号
+    :param cart_dict: 要购买的商品 {sku_id: 数量}
+    :return: 预占了库存的sku_id集合(不是热点商品时为空集合), 热点商品库存不足时返回None
+    """
+    sku_ids = sorted(cart_dict)
+    keys = [constants.HOT_STOCK_RESERVATION_REDIS_KEY % order_id, constants.HOT_STOCK_RESERVATIONS_REDIS_KEY]
+    keys += [constants.HOT_STOCK_REDIS_KEY % sku_id for sku_id in sku_ids]
+    args = [int(time.time()) + constants.HOT_STOCK_RESERVATION_EXPIRES, order_id]
+    for sku_id in sku_ids:
+        args.extend([sku_id, cart_dict[sku_id]])
+
+    result = _run(RESERVE_SCRIPT, keys, args)
+    if result == -1:
+        return None
+    return {int(sku_id) for sku_id in result}
+
+
+def confirm_hot_stock(order_id):
+    """
+    订单提交成功后确认预占, 售出数量等待同步到数据库
+    :param order_id: 订单编号
+    :return: None
+    """
+    _run(CONFIRM_SCRIPT, [constants.HOT_STOCK_RESERVATION_REDIS_KEY % order_id,
+                          constants.HOT_STOCK_RESERVATIONS_REDIS_KEY,
+                          constants.HOT_STOCK_PENDING_REDIS_KEY], [order_id])
+
+
+def release_hot_stock(order_id):
+    """
+    订单提交失败后释放预占的库存
+    :param order_id: 订单编号
+    :return: None
+    """
+    _run(RELEASE_SCRIPT, [constants.HOT_STOCK_RESERVATION_REDIS_KEY % order_id,
+                          constants.HOT_STOCK_RESERVATIONS_REDIS_KEY],
+         [order_id, constants.HOT_STOCK_REDIS_KEY % ''])
+
+
+def _restore_db_stock(sku_counts):
+    """
+    用一条UPDATE归还多个sku的数据库库存并扣减销量
+    :param sku_counts: {sku_id: 数量}
+    :return: None
+    """
+    if not sku_counts:
+        return
+
+    def counts():
+        return Case(*[When(id=sku_id, then=Value(count)) for sku_id, count in sku_counts.items()],
+                    default=Value(0), output_field=IntegerField())
+
+    SKU.objects.filter(id__in=sku_counts.keys()).update(stock=F('stock') + counts(), sales=F('sales') - counts())
+
+
+def restore_stock(sku_counts):
+    """
+    归还已售出商品的库存(如订单取消), 必须在事务中调用
+    普通商品在当前事务中归还数据库库存; 热点商品记录到待归还表, 事务提交后归还到redis并在同步时增加数据库库存
+    :param sku_counts: {sku_id: 数量}
+    :return: None
+    """
+    sku_ids = sorted(sku_counts)
+    if not sku_ids:
+        return
+
+    redis_conn = get_redis_connection('inventory')
+    stocks = redis_conn.mget([constants.HOT_STOCK_REDIS_KEY % sku_id for sku_id in sku_ids])
+    hot_sku_ids = {sku_id for sku_id, stock in zip(sku_ids, stocks) if stock is not None}
+
+    _restore_db_stock({sku_id: count for sku_id, count in sku_counts.items() if sku_id not in hot_sku_ids})
+
+    if hot_sku_ids:
+        restore = HotStockRestore.objects.create(
+            sku_counts=json.dumps({sku_id: sku_counts[sku_id] for sku_id in hot_sku_ids}))
+        transaction.on_commit(lambda: _apply_hot_stock_restore_quietly(restore.id))
+
+
+def _apply_hot_stock_restore_quietly(restore_id):
+    """事务提交后归还热点商品库存, 失败时由定时任务重新归还"""
+    try:
+        apply_hot_stock_restore(restore_id)
+    except Exception as e:
+        logger.warning('归还热点库存%s失败, 等待重新归还: %s' % (restore_id, e))
+
+
+def apply_hot_stock_restore(restore_id):
+    """
+    把一条待归还记录中的库存归还到redis, 归还期间关闭了热点库存模式的sku归还数据库库存, 完成后删除记录
+    redis中的归还带有标记, 删除记录的事务失败后重新归还不会重复增加redis库存
+    :param restore_id: 待归还记录id
+    :return: 是否归还, 记录已经处理过时返回False
+    """
+    with transaction.atomic():
+        # 锁住记录, 事务提交后的归还与定时任务的重新归还互斥
+        restore = HotStockRestore.objects.select_for_update().filter(id=restore_id).first()
+        if restore is None:
+            return False
+
+        sku_counts = {int(sku_id): count for sku_id, count in json.loads(restore.sku_counts).items()}
+        sku_ids = sorted(sku_counts)
+        keys = [constants.HOT_STOCK_PENDING_REDIS_KEY, constants.HOT_STOCK_RESTORED_REDIS_KEY % restore_id]
+        keys += [constants.HOT_STOCK_REDIS_KEY % sku_id for sku_id in sku_ids]
+        args = [constants.HOT_STOCK_RESTORED_EXPIRES]
+        for sku_id in sku_ids:
+            args.extend([sku_id, sku_counts[sku_id]])
+
+        restored = _run(RESTORE_SCRIPT, keys, args)
+        restored = {int(sku_id) for sku_id in restored.decode().split(',') if sku_id}
+        _restore_db_stock({sku_id: count for sku_id, count in sku_counts.items() if sku_id not in restored})
+        restore.delete()
+    return True
+
+
+def retry_hot_stock_restores():
+    """
+    重新归还事务提交后没有归还成功的热点商品库存
+    :return: 归还的记录数量
+    """
+    deadline = timezone.now() - timedelta(seconds=constants.HOT_STOCK_RESTORE_RETRY_DELAY)
+    restore_ids = HotStockRestore.objects.filter(create_time__lt=deadline).order_by('id').values_list(
+        'id', flat=True)
+    count = 0
+    for restore_id in restore_ids:
+        try:
+            count += apply_hot_stock_restore(restore_id)
+        except Exception as e:
+            logger.error('重新归还热点库存%s失败: %s' % (restore_id, e))
+    return count
+
+
+def get_expired_hot_stock_reservations():
+    """
+    查询已过期的库存预占
+    :return: 订单编号列表
+    """
+    redis_conn = get_redis_connection('inventory')
+    order_ids = redis_conn.zrangebyscore(constants.HOT_STOCK_RESERVATIONS_REDIS_KEY, '-inf', int(time.time()))
+    return [order_id.decode() for order_id in order_ids]
+
+
+def sync_hot_stock():
+    """
+    把已售出的热点商品数量同步到数据库, 扣减库存并增加销量
+    先把待同步哈希RENAME为同步中的键再写数据库, 写入成功后才删除,
+    任务中途崩溃时同步中的键会保留, 下次执行时重新写入;
+    同步中的键带有批次号, 与库存扣减在同一个事务中记录, 提交后、删除同步中的键前崩溃时不会重复扣减
+    :return: 同步的sku数量
+    """
+    redis_conn = get_redis_connection('inventory')
+    # 同一时间只允许一个任务同步, 避免重复扣减
+    lock_token = acquire_lock(redis_conn, constants.HOT_STOCK_SYNC_LOCK_KEY, constants.HOT_STOCK_SYNC_LOCK_EXPIRES)
+    if lock_token is None:
+        return 0
+
+    try:
+        # 上次没有写完的数据优先处理, 之后售出的数量会累加到新的待同步哈希中
+        items = _run(START_SYNC_SCRIPT,
+                     [constants.HOT_STOCK_PENDING_REDIS_KEY, constants.HOT_STOCK_SYNCING_REDIS_KEY],
+                     [constants.HOT_STOCK_SYNCING_BATCH_FIELD, uuid.uuid4().hex])
+        if not items:
+            # 没有待同步的数据
+            return 0
+
+        syncing = {items[i].decode(): items[i + 1].decode() for i in range(0, len(items), 2)}
+        batch_id = syncing.pop(constants.HOT_STOCK_SYNCING_BATCH_FIELD)
+        sku_counts = {int(sku_id): int(count) for sku_id, count in syncing.items()}
+        with transaction.atomic():
+            # batch_id唯一, 上次同步成功但没来得及删除同步中的键时, 这里会查到已有记录
+            _, created = HotStockSync.objects.get_or_create(batch_id=batch_id)
+            if created:
+                # 按sku_id顺序更新, 与下单扣减库存的加锁顺序一致
+                for sku_id in sorted(sku_counts):
+                    count = sku_counts[sku_id]
+                    if count:
+                        SKU.objects.filter(id=sku_id).update(stock=F('stock') - count, sales=F('sales') + count)
+        redis_conn.delete(constants.HOT_STOCK_SYNCING_REDIS_KEY)
+
+        # 清理早已不会重复出现的批次记录
+        HotStockSync.objects.filter(
+            create_time__lt=timezone.now() - timedelta(days=constants.HOT_STOCK_SYNC_RECORD_DAYS)).delete()
+    finally:
+        release_lock(redis_conn, constants.HOT_STOCK_SYNC_LOCK_KEY, lock_token)
+
+    return len(sku_counts)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from goods.inventory import enable_hot_stock, disable_hot_stock, get_hot_stock
+
+
+class Command(BaseCommand):
+    help = '开启或关闭sku的热点库存模式, 开启后下单在redis中预占库存, 数据库库存由定时任务同步'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'disable', 'show'], help='开启, 关闭或查看')
+        parser.add_argument('sku_ids', nargs='+', type=int, help='商品sku_id')
+
+    def handle(self, *args, **options):
+        for sku_id in options['sku_ids']:
+            if options['action'] == 'enable':
+                try:
+                    stock = enable_hot_stock(sku_id)
+                except IndexError:
+                    raise CommandError('sku %d不存在' % sku_id)
+                if stock is None:
+                    self.stdout.write('sku %d已经是热点库存模式' % sku_id)
+                else:
+                    self.stdout.write(self.style.SUCCESS('sku %d开启热点库存模式, 库存%d' % (sku_id, stock)))
+            elif options['action'] == 'disable':
+                disable_hot_stock(sku_id)
+                self.stdout.write(self.style.SUCCESS('sku %d关闭热点库存模式' % sku_id))
+            else:
+                stock = get_hot_stock(sku_id)
+                self.stdout.write('sku %d: %s' % (sku_id, '未开启' if stock is None else '库存%d' % stock))
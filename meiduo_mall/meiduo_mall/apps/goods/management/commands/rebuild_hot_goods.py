@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from goods.utils import rebuild_hot_goods
+
+
+class Command(BaseCommand):
+    help = '根据商品销量重建redis中的分类热销排行'
+
+    def handle(self, *args, **options):
+        count = rebuild_hot_goods()
+        self.stdout.write(self.style.SUCCESS('重建热销排行完成, 共%d个分类' % count))
@@ -0,0 +1,39 @@
+import os
+from multiprocessing import Pool
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from goods.models import SKU
+from goods.utils import generate_static_sku_detail_html
+
+
+def init_worker():
+    """子进程不能复用父进程的数据库连接,丢弃后由子进程自己重新建立"""
+    connections.close_all()
+
+
+def generate_html(sku_id):
+    """子进程中生成单个商品的静态详情页"""
+    return generate_static_sku_detail_html(sku_id)
+
+
+class Command(BaseCommand):
+    help = '多进程并行生成所有上架商品的静态详情页'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='工作进程数')
+        parser.add_argument('--chunksize', type=int, default=20, help='每次分发给工作进程的商品数')
+
+    def handle(self, *args, **options):
+        sku_ids = list(SKU.objects.filter(is_launched=True).order_by('id').values_list('id', flat=True))
+        total = len(sku_ids)
+
+        # fork之前关闭数据库连接,避免多个进程共用同一个连接
+        connections.close_all()
+
+        with Pool(processes=options['processes'], initializer=init_worker) as pool:
+            for count, _ in enumerate(pool.imap_unordered(generate_html, sku_ids, options['chunksize']), 1):
+                if count % 1000 == 0 or count == total:
+                    self.stdout.write('%d/%d' % (count, total))
+
+        self.stdout.write(self.style.SUCCESS('生成静态详情页完成, 共%d个' % total))
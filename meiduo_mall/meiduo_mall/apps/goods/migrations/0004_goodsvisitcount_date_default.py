@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 11:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_sku_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='goodsvisitcount',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate, verbose_name='统计日期'),
+        ),
+    ]
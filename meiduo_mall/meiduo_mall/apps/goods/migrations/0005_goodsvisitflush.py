@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_goodsvisitcount_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsVisitFlush',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('batch_id', models.CharField(max_length=100, unique=True, verbose_name='批次')),
+            ],
+            options={
+                'verbose_name': '访问量写入批次',
+                'verbose_name_plural': '访问量写入批次',
+                'db_table': 'tb_goods_visit_flush',
+            },
+        ),
+    ]
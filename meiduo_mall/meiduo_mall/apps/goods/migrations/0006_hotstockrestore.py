@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0005_goodsvisitflush'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotStockRestore',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('sku_counts', models.TextField(verbose_name='归还数量')),
+            ],
+            options={
+                'verbose_name': '待归还热点库存',
+                'verbose_name_plural': '待归还热点库存',
+                'db_table': 'tb_hot_stock_restore',
+            },
+        ),
+    ]
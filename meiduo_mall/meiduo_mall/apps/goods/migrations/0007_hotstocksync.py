@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 19:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0006_hotstockrestore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotStockSync',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('batch_id', models.CharField(max_length=32, unique=True, verbose_name='批次')),
+            ],
+            options={
+                'verbose_name': '热点库存同步批次',
+                'verbose_name_plural': '热点库存同步批次',
+                'db_table': 'tb_hot_stock_sync',
+            },
+        ),
+    ]
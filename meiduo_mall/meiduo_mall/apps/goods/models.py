@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from meiduo_mall.utils.models import BaseModel
 
@@ -136,6 +137,12 @@ class SKU(BaseModel):
         db_table = 'tb_sku'
         verbose_name = '商品SKU'
         verbose_name_plural = verbose_name
+        # 列表页各排序方式的游标分页联合索引
+        indexes = [
+            models.Index(fields=['category', 'is_launched', 'create_time', 'id'], name='tb_sku_list_ctime_idx'),
+            models.Index(fields=['category', 'is_launched', 'price', 'id'], name='tb_sku_list_price_idx'),
+            models.Index(fields=['category', 'is_launched', 'sales', 'id'], name='tb_sku_list_sales_idx'),
+        ]
 
     def __str__(self):
         return '%s: %s' % (self.id, self.name)
@@ -202,9 +209,40 @@ class GoodsVisitCount(BaseModel):
     """统计分类商品访问量模型类"""
     category = models.ForeignKey(GoodsCategory, on_delete=models.CASCADE, verbose_name='商品分类')
     count = models.IntegerField(verbose_name='访问量', default=0)
-    date = models.DateField(auto_now_add=True, verbose_name='统计日期')
+    # 访问量由定时任务补写, 统计日期需要能指定为缓冲时的日期
+    date = models.DateField(default=timezone.localdate, verbose_name='统计日期')
 
     class Meta:
         db_table = 'tb_goods_visit'
         verbose_name = '统计分类商品访问量'
         verbose_name_plural = verbose_name
+
+
+class GoodsVisitFlush(BaseModel):
+    """已写入数据库的访问量批次, 与访问量在同一个事务中记录, 重复写入同一批次时跳过"""
+    batch_id = models.CharField(max_length=100, unique=True, verbose_name='批次')
+
+    class Meta:
+        db_table = 'tb_goods_visit_flush'
+        verbose_name = '访问量写入批次'
+        verbose_name_plural = verbose_name
+
+
+class HotStockRestore(BaseModel):
+    """待归还到redis的热点商品库存, 与取消订单在同一个事务中记录, 归还后删除"""
+    sku_counts = models.TextField(verbose_name='归还数量')  # json: {sku_id: 数量}
+
+    class Meta:
+        db_table = 'tb_hot_stock_restore'
+        verbose_name = '待归还热点库存'
+        verbose_name_plural = verbose_name
+
+
+class HotStockSync(BaseModel):
+    """已同步到数据库的热点库存批次, 与库存扣减在同一个事务中记录, 重复同步同一批次时跳过"""
+    batch_id = models.CharField(max_length=32, unique=True, verbose_name='批次')
+
+    class Meta:
+        db_table = 'tb_hot_stock_sync'
+        verbose_name = '热点库存同步批次'
+        verbose_name_plural = verbose_name
@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models import signals
+from django_redis import get_redis_connection
+from haystack import connections, connection_router
+from haystack.signals import BaseSignalProcessor
+
+from .models import SKU
+from . import constants
+
+# 加载时被延迟(.only/.defer)的字段没有记录值
+DEFERRED = object()
+
+
+class SKUQueuedSignalProcessor(BaseSignalProcessor):
+    """
+    队列式搜索索引信号处理器
+    SKU修改或删除时只把sku_id记录到redis集合中(自动去重),由定时任务批量更新索引,
+    不影响搜索索引的字段(库存、销量等)变化时不记录
+    """
+
+    def setup(self):
+        signals.post_init.connect(self.handle_init, sender=SKU)
+        signals.post_save.connect(self.handle_save, sender=SKU)
+        signals.post_delete.connect(self.handle_delete, sender=SKU)
+
+    def teardown(self):
+        signals.post_init.disconnect(self.handle_init, sender=SKU)
+        signals.post_save.disconnect(self.handle_save, sender=SKU)
+        signals.post_delete.disconnect(self.handle_delete, sender=SKU)
+
+    @staticmethod
+    def get_index_values(instance):
+        """
+        获取影响搜索索引的字段值
+        只读取已经加载到instance.__dict__中的值, 不能用getattr: 延迟字段会在post_init中再次查询并构造实例, 无限递归
+        """
+        return tuple(instance.__dict__.get(field, DEFERRED) for field in constants.SEARCH_INDEX_FIELDS)
+
+    def handle_init(self, sender, instance, **kwargs):
+        """记录sku加载时影响搜索索引的字段值"""
+        instance._search_index_values = self.get_index_values(instance)
+
+    def handle_save(self, sender, instance, created=False, update_fields=None, **kwargs):
+        """sku保存后,索引字段有变化时记录sku_id"""
+        if update_fields is not None and not set(update_fields) & set(constants.SEARCH_INDEX_FIELDS):
+            return
+
+        index_values = self.get_index_values(instance)
+        old_values = getattr(instance, '_search_index_values', None)
+        # 保存时仍未加载的字段没有被修改; 加载时延迟、之后才赋值的字段无法比较, 按有变化处理
+        if not created and old_values is not None and all(
+                value is DEFERRED or value == old_value for value, old_value in zip(index_values, old_values)):
+            return
+
+        instance._search_index_values = index_values
+        self.enqueue(instance.id)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        """sku删除后记录sku_id"""
+        self.enqueue(instance.id)
+
+    @staticmethod
+    def enqueue(sku_id):
+        """事务提交后把sku_id加入待更新索引集合"""
+        transaction.on_commit(
+            lambda: get_redis_connection('goods').sadd(constants.SEARCH_INDEX_QUEUE_REDIS_KEY, sku_id))
+
+
+# 从集合中原子地取出并删除一批成员 KEYS: 集合  ARGV: 数量
+# 用SRANDMEMBER + SREM实现, 不依赖redis 3.2才支持的带数量的SPOP
+POP_BATCH_SCRIPT = """
+local members = redis.call('SRANDMEMBER', KEYS[1], ARGV[1])
+if #members > 0 then
+    redis.call('SREM', KEYS[1], unpack(members))
+end
+return members
+"""
+
+
+def update_queued_search_index():
+    """
+    批量更新redis集合中记录的sku的搜索索引
+    上架的sku更新索引, 已删除或已下架的sku删除索引, 更新失败时sku_id放回集合等待下次处理
+    :return: 处理的sku数量
+    """
+    redis_conn = get_redis_connection('goods')
+    pop_batch = redis_conn.register_script(POP_BATCH_SCRIPT)
+    total = 0
+
+    while True:
+        sku_ids = pop_batch(keys=[constants.SEARCH_INDEX_QUEUE_REDIS_KEY], args=[constants.SEARCH_INDEX_BATCH_SIZE])
+        if not sku_ids:
+            break
+        sku_ids = [int(sku_id) for sku_id in sku_ids]
+
+        try:
+            for using in connection_router.for_write(models=[SKU]):
+                backend = connections[using].get_backend()
+                index = connections[using].get_unified_index().get_index(SKU)
+
+                sku_qs = index.index_queryset(using=using).filter(id__in=sku_ids)
+                skus = list(sku_qs)
+                if skus:
+                    backend.update(index, skus)
+
+                launched_ids = {sku.id for sku in skus}
+                for sku_id in sku_ids:
+                    if sku_id not in launched_ids:
+                        backend.remove('goods.sku.%s' % sku_id)
+        except Exception:
+            redis_conn.sadd(constants.SEARCH_INDEX_QUEUE_REDIS_KEY, *sku_ids)
+            raise
+
+        total += len(sku_ids)
+
+    return total
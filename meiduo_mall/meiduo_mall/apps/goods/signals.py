@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django_redis import get_redis_connection
+
+from celery_tasks.html.tasks import generate_static_sku_detail_html
+from .models import SKU, SPU, SKUImage, SKUSpecification, SPUSpecification, SpecificationOption
+from .utils import delete_spu_spec_matrix, delete_sku_card
+from . import constants
+
+
+def refresh_spu_detail(spu_id, extra_sku_ids=()):
+    """
+    事务提交后清除spu的规格矩阵缓存,并重新生成spu下所有sku的静态详情页
+    同一spu下的sku页面互相引用规格选项链接,所以任一sku变化都要整体重新生成
+    :param spu_id: 商品spu_id
+    :param extra_sku_ids: 额外需要处理的sku_id(如已删除的sku)
+    :return: None
+    """
+    sku_ids = set(SKU.objects.filter(spu_id=spu_id).values_list('id', flat=True))
+    sku_ids.update(extra_sku_ids)
+
+    def send_tasks():
+        delete_spu_spec_matrix(spu_id)
+        for sku_id in sku_ids:
+            generate_static_sku_detail_html.delay(sku_id)
+
+    transaction.on_commit(send_tasks)
+
+
+@receiver([post_save, post_delete], sender=SKU)
+def sku_changed(sender, instance, **kwargs):
+    """sku修改或删除"""
+    refresh_spu_detail(instance.spu_id, extra_sku_ids=[instance.id])
+
+
+@receiver([post_save, post_delete], sender=SPU)
+def spu_changed(sender, instance, **kwargs):
+    """spu修改或删除"""
+    refresh_spu_detail(instance.id)
+
+
+@receiver([post_save, post_delete], sender=SKUImage)
+@receiver([post_save, post_delete], sender=SKUSpecification)
+def sku_detail_changed(sender, instance, **kwargs):
+    """sku图片或规格修改"""
+    try:
+        spu_id = SKU.objects.filter(id=instance.sku_id).values_list('spu_id', flat=True)[0]
+    except IndexError:
+        return
+    refresh_spu_detail(spu_id, extra_sku_ids=[instance.sku_id])
+
+
+@receiver([post_save, post_delete], sender=SPUSpecification)
+def spu_spec_changed(sender, instance, **kwargs):
+    """spu规格修改"""
+    refresh_spu_detail(instance.spu_id)
+
+
+@receiver([post_save, post_delete], sender=SpecificationOption)
+def spec_option_changed(sender, instance, **kwargs):
+    """规格选项修改"""
+    try:
+        spu_id = SPUSpecification.objects.filter(id=instance.spec_id).values_list('spu_id', flat=True)[0]
+    except IndexError:
+        return
+    refresh_spu_detail(spu_id)
+
+
+@receiver(post_save, sender=SKU)
+def sku_hot_goods_changed(sender, instance, **kwargs):
+    """sku修改后,事务提交时同步分类热销排行"""
+    def update_hot_goods():
+        redis_conn = get_redis_connection('goods')
+        key = constants.HOT_GOODS_REDIS_KEY % instance.category_id
+        # 排行未建立时不处理,由重建命令统一生成
+        if not redis_conn.exists(key):
+            return
+        if instance.is_launched:
+            redis_conn.zadd(key, {instance.id: instance.sales})
+        else:
+            redis_conn.zrem(key, instance.id)
+
+    transaction.on_commit(update_hot_goods)
+
+
+@receiver(post_delete, sender=SKU)
+def sku_hot_goods_deleted(sender, instance, **kwargs):
+    """sku删除后,事务提交时从分类热销排行中移除"""
+    def remove_hot_goods():
+        get_redis_connection('goods').zrem(constants.HOT_GOODS_REDIS_KEY % instance.category_id, instance.id)
+
+    transaction.on_commit(remove_hot_goods)
+
+
+@receiver([post_save, post_delete], sender=SKU)
+def sku_card_changed(sender, instance, **kwargs):
+    """sku修改或删除后,事务提交时清除sku卡片缓存"""
+    sku_id = instance.id
+    transaction.on_commit(lambda: delete_sku_card(sku_id))
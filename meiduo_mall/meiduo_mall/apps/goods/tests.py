@@ -1,3 +1,88 @@
-from django.test import TestCase
+from unittest import mock
+from django.apps import apps
+from django.db.models import signals
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .models import GoodsCategory, Brand, SPU, SKU
+from .search_signals import SKUQueuedSignalProcessor
+from .utils import get_sku_cards
+
+
+def create_skus(count):
+    """创建测试用的sku"""
+    category = GoodsCategory.objects.create(name='手机')
+    brand = Brand.objects.create(name='品牌', logo='logo.png', first_letter='P')
+    spu = SPU.objects.create(name='spu', brand=brand, category1=category, category2=category, category3=category)
+    return [SKU.objects.create(name='sku%s' % i, caption='caption', spu=spu, category=category, price=10,
+                               cost_price=8, market_price=12, default_image='group1/sku%s.jpg' % i if i else '')
+            for i in range(count)]
+
+
+class SKUQueuedSignalProcessorTest(TestCase):
+    """队列式搜索索引信号处理器"""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_skus(3)
+
+    def setUp(self):
+        # settings中配置的信号处理器, 已经连接了sku的信号
+        self.processor = apps.get_app_config('haystack').signal_processor
+        self.assertIsInstance(self.processor, SKUQueuedSignalProcessor)
+        patcher = mock.patch.object(self.processor, 'enqueue')
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deferred_fields_not_loaded(self):
+        """加载只查询部分字段的sku时不会查询延迟字段"""
+        with self.assertNumQueries(1):
+            skus = list(SKU.objects.only('id', 'name', 'price', 'is_launched'))
+        self.assertEqual(len(skus), 3)
+        self.assertIn('caption', skus[0].get_deferred_fields())
+
+    def test_save_deferred_instance(self):
+        """只查询部分字段的sku, 修改索引字段时记录, 修改其他字段时不记录"""
+        sku = SKU.objects.only('id', 'name', 'price').first()
+        sku.price = 20
+        sku.save()
+        self.enqueue.assert_not_called()
+
+        sku.name = 'new name'
+        sku.save()
+        self.enqueue.assert_called_once_with(sku.id)
+
+    def test_assign_deferred_index_field(self):
+        """加载时延迟的索引字段被赋值后按有变化处理"""
+        sku = SKU.objects.only('id', 'name').first()
+        sku.caption = 'new caption'
+        sku.save(update_fields=['caption'])
+        self.enqueue.assert_called_once_with(sku.id)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GetSKUCardsTest(TestCase):
+    """批量获取sku卡片"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.skus = create_skus(2)
+
+    def test_no_model_instances(self):
+        """缓存未命中时只查询元组, 不构造sku实例"""
+        init_handler = mock.Mock()
+        signals.post_init.connect(init_handler, sender=SKU)
+        self.addCleanup(signals.post_init.disconnect, init_handler, sender=SKU)
+
+        sku_ids = [sku.id for sku in self.skus]
+        with self.assertNumQueries(1):
+            cards = get_sku_cards(sku_ids + [0])
+        init_handler.assert_not_called()
+
+        self.assertEqual(set(cards), set(sku_ids))
+        self.assertEqual(cards[self.skus[0].id]['default_image_url'], '')
+        self.assertEqual(cards[self.skus[1].id]['default_image_url'], self.skus[1].default_image.url)
+        self.assertEqual(cards[self.skus[1].id]['name'], 'sku1')
+
+        # 再次获取全部命中缓存
+        with self.assertNumQueries(0):
+            self.assertEqual(get_sku_cards(sku_ids), cards)
@@ -9,5 +9,7 @@ urlpatterns = [
     url(r'^hot/(?P<category_id>\d+)/$', views.HotGoodsView.as_view()),
     # 商品详情页
     url(r'^detail/(?P<sku_id>\d+)/$', views.DetailView.as_view()),
+    # 详情页分类商品访问量
+    url(r'^visit/(?P<category_id>\d+)/$', views.DetailVisitView.as_view()),
 
 ]
\ No newline at end of file
@@ -1,3 +1,23 @@
+import os, uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, F, Sum, Case, When, Value, IntegerField
+from django.template import loader
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_lock import acquire_lock, release_lock
+from .models import SKU, SPU, SPUSpecification, SKUSpecification, GoodsCategory, GoodsVisitCount, \
+    GoodsVisitFlush
+from . import constants
+from contents.utils import get_categories
+
+
 def get_breadcrumb(category):
     """
     面包屑导航
@@ -15,3 +35,476 @@ def get_breadcrumb(category):
     }
 
     return breadcrumb
+
+
+def get_goods_list_count(category_id):
+    """
+    获取分类下上架商品总数,结果短时间缓存,避免每次翻页都COUNT(*)
+    :param category_id: 三级分类id
+    :return: 商品总数
+    """
+    cache_key = constants.GOODS_LIST_COUNT_CACHE_KEY % category_id
+    count = cache.get(cache_key)
+    if count is None:
+        count = SKU.objects.filter(category_id=category_id, is_launched=True).count()
+        cache.set(cache_key, count, constants.GOODS_LIST_COUNT_CACHE_EXPIRES)
+    return count
+
+
+def dumps_list_cursor(sort, sku):
+    """
+    生成列表页游标: 记录当前页最后一个商品的排序字段值和id
+    :param sort: 排序方式
+    :param sku: 当前页最后一个sku
+    :return: 游标字符串
+    """
+    field = constants.GOODS_LIST_ORDERINGS[sort][0].lstrip('-')
+    value = getattr(sku, field)
+    value = value.isoformat() if field == 'create_time' else str(value)
+    return signing.dumps([sort, value, sku.id], salt='goods_list_cursor', compress=True)
+
+
+def loads_list_cursor(sort, cursor):
+    """
+    解析列表页游标
+    :param sort: 排序方式
+    :param cursor: 游标字符串
+    :return: (排序字段值, sku_id), 游标无效时返回None
+    """
+    try:
+        cursor_sort, value, sku_id = signing.loads(cursor, salt='goods_list_cursor')
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_sort != sort:
+        return None
+
+    field = constants.GOODS_LIST_ORDERINGS[sort][0].lstrip('-')
+    if field == 'create_time':
+        value = parse_datetime(value)
+    elif field == 'price':
+        value = Decimal(value)
+    else:
+        value = int(value)
+    return value, sku_id
+
+
+def get_keyset_page(sku_qs, sort, after, limit):
+    """
+    游标分页: 用 (排序字段, id) > 游标值 代替OFFSET,深页查询耗时与页码无关
+    :param sku_qs: 分类下上架商品查询集
+    :param sort: 排序方式
+    :param after: 上一页最后一个商品的(排序字段值, sku_id)
+    :param limit: 每页数量
+    :return: 当前页sku列表
+    """
+    ordering = constants.GOODS_LIST_ORDERINGS[sort]
+    field = ordering[0].lstrip('-')
+    value, sku_id = after
+    # 降序排序时取更小的值
+    lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+    # 先用排序字段做范围条件,保证能走(category, is_launched, 排序字段, id)联合索引的范围扫描
+    sku_qs = sku_qs.filter(**{'%s__%se' % (field, lookup): value})
+    sku_qs = sku_qs.filter(Q(**{'%s__%s' % (field, lookup): value}) | Q(**{'id__%s' % lookup: sku_id}))
+    return list(sku_qs.order_by(*ordering)[:limit])
+
+
+def get_hot_sku_ids(category_id, limit):
+    """
+    从分类热销排行中查询销量最高的sku_id
+    :param category_id: 三级分类id
+    :param limit: 查询数量
+    :return: sku_id列表, 排行不存在时返回None
+    """
+    redis_conn = get_redis_connection('goods')
+    key = constants.HOT_GOODS_REDIS_KEY % category_id
+    pl = redis_conn.pipeline()
+    pl.exists(key)
+    pl.zrevrange(key, 0, limit - 1)
+    exists, sku_ids = pl.execute()
+    if not exists:
+        return None
+    return [int(sku_id) for sku_id in sku_ids]
+
+
+# 累加分类热销排行中的销量 KEYS: 各分类的排行键  ARGV: sku_id, 购买数量, ...(与排行键一一对应)
+# 排行不存在时不累加, 否则会生成只有新售出商品的排行, 读取时不再回退到数据库
+INCR_HOT_GOODS_SCRIPT = """
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('ZINCRBY', KEYS[i], ARGV[2 * i], ARGV[2 * i - 1])
+    end
+end
+return 1
+"""
+
+
+def incr_hot_goods_sales(sku_sales):
+    """
+    下单成功后累加分类热销排行中的销量, 排行未建立的分类不处理, 由重建命令统一生成
+    :param sku_sales: [(category_id, sku_id, 购买数量)]
+    :return: None
+    """
+    if not sku_sales:
+        return
+    keys, args = [], []
+    for category_id, sku_id, count in sku_sales:
+        keys.append(constants.HOT_GOODS_REDIS_KEY % category_id)
+        args.extend([sku_id, count])
+    redis_conn = get_redis_connection('goods')
+    redis_conn.register_script(INCR_HOT_GOODS_SCRIPT)(keys=keys, args=args, client=redis_conn)
+
+
+def rebuild_hot_goods():
+    """
+    根据SKU.sales重建所有分类的热销排行
+    先写入临时键再RENAME,重建过程中读取的仍是旧的排行
+    :return: 重建的分类数量
+    """
+    hot_goods = {}  # {category_id: {sku_id: sales}}
+    sku_qs = SKU.objects.filter(is_launched=True).values_list('category_id', 'id', 'sales')
+    for category_id, sku_id, sales in sku_qs.iterator():
+        hot_goods.setdefault(category_id, {})[sku_id] = sales
+
+    redis_conn = get_redis_connection('goods')
+    # 已经没有上架商品的分类要删除旧排行
+    key_prefix = constants.HOT_GOODS_REDIS_KEY % ''
+    for key in redis_conn.scan_iter(match=key_prefix + '*'):
+        category_id = key.decode()[len(key_prefix):]
+        if category_id.isdigit() and int(category_id) not in hot_goods:
+            redis_conn.delete(key)
+
+    for category_id, sku_sales in hot_goods.items():
+        key = constants.HOT_GOODS_REDIS_KEY % category_id
+        temp_key = key + '_rebuild'
+        pl = redis_conn.pipeline()
+        pl.delete(temp_key)
+        pl.zadd(temp_key, sku_sales)
+        pl.rename(temp_key, key)
+        pl.execute()
+
+    return len(hot_goods)
+
+
+def rollup_spu_sales():
+    """
+    根据SKU.sales汇总SPU.sales, 下单时不再修改spu行, 由定时任务汇总
+    只更新有变化的spu, 每批用一条UPDATE完成, 不会触发spu的保存信号
+    :return: 更新的spu数量
+    """
+    sku_sales = dict(SKU.objects.order_by().values_list('spu_id').annotate(Sum('sales')))
+    changed = {}
+    for spu_id, sales in SPU.objects.values_list('id', 'sales'):
+        total = sku_sales.get(spu_id) or 0
+        if total != sales:
+            changed[spu_id] = total
+
+    spu_ids = sorted(changed)
+    for i in range(0, len(spu_ids), constants.SPU_SALES_ROLLUP_BATCH_SIZE):
+        batch = spu_ids[i:i + constants.SPU_SALES_ROLLUP_BATCH_SIZE]
+        SPU.objects.filter(id__in=batch).update(sales=Case(
+            *[When(id=spu_id, then=Value(changed[spu_id])) for spu_id in batch], output_field=IntegerField()
+        ))
+    return len(changed)
+
+
+def incr_goods_visit(category_id):
+    """
+    在redis中累加分类商品当天的访问量
+    :param category_id: 三级分类id
+    :return: None
+    """
+    redis_conn = get_redis_connection('goods')
+    redis_conn.hincrby(constants.GOODS_VISIT_REDIS_KEY % timezone.localdate().isoformat(), category_id, 1)
+
+
+def save_goods_visit(date, visit_counts, batch_id):
+    """
+    将一天的访问量批量累加到数据库
+    :param date: 统计日期
+    :param visit_counts: {category_id: 访问量}
+    :param batch_id: 批次, 与访问量在同一个事务中记录, 已经写入过的批次不再累加
+    :return: 是否写入, 批次已经写入过时返回False
+    """
+    # 过滤掉不存在的分类
+    category_ids = set(GoodsCategory.objects.filter(id__in=visit_counts.keys()).values_list('id', flat=True))
+    visit_counts = {category_id: count for category_id, count in visit_counts.items() if category_id in category_ids}
+
+    with transaction.atomic():
+        # batch_id唯一, 上次写入成功但没来得及删除待写入键时, 这里会查到已有记录
+        _, created = GoodsVisitFlush.objects.get_or_create(batch_id=batch_id)
+        if not created or not visit_counts:
+            return created
+
+        visit_qs = GoodsVisitCount.objects.filter(date=date, category_id__in=visit_counts.keys())
+        exist_ids = set(visit_qs.values_list('category_id', flat=True))
+
+        # 已有记录用一条UPDATE累加
+        if exist_ids:
+            visit_qs.update(count=F('count') + Case(
+                *[When(category_id=category_id, then=Value(visit_counts[category_id])) for category_id in exist_ids],
+                default=Value(0), output_field=IntegerField()
+            ))
+
+        # 没有记录的分类批量新增
+        GoodsVisitCount.objects.bulk_create([
+            GoodsVisitCount(category_id=category_id, count=count, date=date)
+            for category_id, count in visit_counts.items() if category_id not in exist_ids
+        ])
+    return True
+
+
+def flush_goods_visit():
+    """
+    将redis中缓冲的访问量写入数据库
+    先把缓冲键RENAME为带批次号的待写入键再写数据库,写入成功后才删除待写入键,
+    任务中途崩溃时待写入键会保留,下次执行时重新写入,访问量不会丢失;
+    待写入键名作为批次与访问量在同一个事务中记录,提交后、删除待写入键前崩溃时不会重复累加
+    :return: 写入的批次数量
+    """
+    redis_conn = get_redis_connection('goods')
+    # 同一时间只允许一个任务写入,避免重复累加
+    lock_token = acquire_lock(redis_conn, constants.GOODS_VISIT_FLUSH_LOCK_KEY,
+                              constants.GOODS_VISIT_FLUSH_LOCK_EXPIRES)
+    if lock_token is None:
+        return 0
+
+    try:
+        visit_prefix = constants.GOODS_VISIT_REDIS_KEY % ''
+        flushing_prefix = constants.GOODS_VISIT_FLUSHING_REDIS_KEY % ''
+
+        # 把缓冲键转为待写入键,之后的访问量会累加到新的缓冲键中
+        for key in redis_conn.scan_iter(match=visit_prefix + '*'):
+            date = key.decode()[len(visit_prefix):]
+            if parse_date(date) is None:
+                # 跳过待写入键
+                continue
+            batch = '%s_%s' % (date, uuid.uuid4().hex)
+            redis_conn.rename(key, constants.GOODS_VISIT_FLUSHING_REDIS_KEY % batch)
+
+        # 本次转换的和上次没有写完的待写入键一起处理
+        flushing_keys = [key.decode() for key in redis_conn.scan_iter(match=flushing_prefix + '*')]
+        for flushing_key in flushing_keys:
+            date = flushing_key[len(flushing_prefix):].split('_', 1)[0]
+            visit_counts = {int(category_id): int(count)
+                            for category_id, count in redis_conn.hgetall(flushing_key).items()}
+            save_goods_visit(parse_date(date), visit_counts, flushing_key)
+            redis_conn.delete(flushing_key)
+
+        # 清理早已不会重复出现的批次记录
+        GoodsVisitFlush.objects.filter(
+            create_time__lt=timezone.now() - timedelta(days=constants.GOODS_VISIT_FLUSH_RECORD_DAYS)).delete()
+    finally:
+        release_lock(redis_conn, constants.GOODS_VISIT_FLUSH_LOCK_KEY, lock_token)
+
+    return len(flushing_keys)
+
+
+def build_spu_spec_matrix(spu_id):
+    """
+    查询spu的规格矩阵
+    :param spu_id: 商品spu_id
+    :return: {
+        'specs': [{'name': 规格名称, 'options': [{'id': 选项id, 'value': 选项值}]}],  # 按规格id排序
+        'sku_options': {sku_id: (选项id, ...)},  # 每个sku按规格id排序的选项
+        'spec_sku_map': {(选项id, ...): sku_id},  # 规格选择仓库
+    }
+    """
+    # 查询spu的所有规格及选项
+    specs = []
+    for spec in SPUSpecification.objects.filter(spu_id=spu_id).order_by('id').prefetch_related('options'):
+        specs.append({
+            'name': spec.name,
+            'options': [{'id': option.id, 'value': option.value} for option in spec.options.all()],
+        })
+
+    # 一次查询出spu下所有sku的规格选项
+    sku_options = {}
+    sku_spec_qs = SKUSpecification.objects.filter(sku__spu_id=spu_id).order_by('sku_id', 'spec_id')
+    for sku_id, option_id in sku_spec_qs.values_list('sku_id', 'option_id'):
+        sku_options.setdefault(sku_id, []).append(option_id)
+    # 没有规格的sku也要在矩阵中
+    for sku_id in SKU.objects.filter(spu_id=spu_id).values_list('id', flat=True):
+        sku_options.setdefault(sku_id, [])
+
+    sku_options = {sku_id: tuple(option_ids) for sku_id, option_ids in sku_options.items()}
+    spec_sku_map = {option_ids: sku_id for sku_id, option_ids in sku_options.items()}
+
+    return {
+        'specs': specs,
+        'sku_options': sku_options,
+        'spec_sku_map': spec_sku_map,
+    }
+
+
+def get_spu_spec_matrix(spu_id):
+    """
+    获取spu的规格矩阵,同一spu下的sku共用一份缓存
+    :param spu_id: 商品spu_id
+    :return: 规格矩阵
+    """
+    cache_key = constants.SPU_SPEC_MATRIX_CACHE_KEY % spu_id
+    matrix = cache.get(cache_key)
+    if matrix is None:
+        matrix = build_spu_spec_matrix(spu_id)
+        cache.set(cache_key, matrix, constants.SPU_SPEC_MATRIX_CACHE_EXPIRES)
+    return matrix
+
+
+def delete_spu_spec_matrix(spu_id):
+    """
+    清除spu的规格矩阵缓存
+    :param spu_id: 商品spu_id
+    :return: None
+    """
+    cache.delete(constants.SPU_SPEC_MATRIX_CACHE_KEY % spu_id)
+
+
+def get_sku_cards(sku_ids):
+    """
+    批量获取sku卡片, 一次MGET读取缓存, 未命中的sku一次查询数据库后写入缓存
+    缓存中保存 (名称, 价格, 图片地址, 分类id, 是否上架) 元组
+    :param sku_ids: sku_id列表
+    :return: {sku_id: {'id', 'name', 'price', 'default_image_url', 'category_id', 'is_launched'}}, 不存在的sku不返回
+    """
+    sku_ids = [int(sku_id) for sku_id in sku_ids]
+    if not sku_ids:
+        return {}
+
+    keys = {constants.SKU_CARD_CACHE_KEY % sku_id: sku_id for sku_id in sku_ids}
+    records = {keys[key]: record for key, record in cache.get_many(keys.keys()).items()}
+
+    missing_ids = set(sku_ids) - set(records)
+    if missing_ids:
+        # 只查询元组不构造模型实例, 不会触发post_init等信号处理, 图片地址由存储类生成
+        storage = SKU._meta.get_field('default_image').storage
+        rows = SKU.objects.filter(id__in=missing_ids).values_list(
+            'id', 'name', 'price', 'default_image', 'category_id', 'is_launched')
+        missing_records = {}
+        for sku_id, name, price, default_image, category_id, is_launched in rows:
+            default_image_url = storage.url(default_image) if default_image else ''
+            records[sku_id] = missing_records[constants.SKU_CARD_CACHE_KEY % sku_id] = (
+                name, price, default_image_url, category_id, is_launched)
+        if missing_records:
+            cache.set_many(missing_records, constants.SKU_CARD_CACHE_EXPIRES)
+
+    cards = {}
+    for sku_id, (name, price, default_image_url, category_id, is_launched) in records.items():
+        cards[sku_id] = {
+            'id': sku_id,
+            'name': name,
+            'price': price,
+            'default_image_url': default_image_url,
+            'category_id': category_id,
+            'is_launched': is_launched,
+        }
+    return cards
+
+
+def delete_sku_card(sku_id):
+    """
+    清除sku卡片缓存
+    :param sku_id: 商品sku_id
+    :return: None
+    """
+    cache.delete(constants.SKU_CARD_CACHE_KEY % sku_id)
+
+
+def get_sku_specs(sku):
+    """
+    构造当前sku的规格选项数据,并给每个选项绑定选中后对应的sku_id
+    :param sku: 当前要显示的sku模型对象
+    :return: [{'name': 规格名称, 'spec_options': [{'value': 选项值, 'sku_id': 对应sku_id}]}]
+    """
+    matrix = get_spu_spec_matrix(sku.spu_id)
+    spec_sku_map = matrix['spec_sku_map']
+    # 当前正显示的sku商品的规格选项id列表
+    current_sku_option_ids = list(matrix['sku_options'].get(sku.id, ()))
+
+    specs = []
+    for index, spec in enumerate(matrix['specs']):  # 遍历当前所有的规格
+        temp_option_ids = current_sku_option_ids[:]  # 复制一个新的当前显示商品的规格选项列表
+        spec_options = []
+        for option in spec['options']:  # 遍历当前规格下的所有选项
+            sku_id = None
+            if index < len(temp_option_ids):
+                temp_option_ids[index] = option['id']  # [8, 12]
+                sku_id = spec_sku_map.get(tuple(temp_option_ids))
+            spec_options.append({'value': option['value'], 'sku_id': sku_id})
+
+        specs.append({'name': spec['name'], 'spec_options': spec_options})
+
+    return specs
+
+
+def get_detail_context(sku):
+    """
+    构造商品详情页模板上下文
+    :param sku: 当前要显示的sku模型对象
+    :return: context
+    """
+    category = sku.category  # 获取当前sku所对应的三级分类
+
+    # 渲染页面
+    context = {
+        'categories': get_categories(),  # 商品分类
+        'breadcrumb': get_breadcrumb(category),  # 面包屑导航
+        'sku': sku,  # 当前要显示的sku模型对象
+        'category': category,  # 当前的显示sku所属的三级类别
+        'spu': sku.spu,  # sku所属的spu
+        'spec_qs': get_sku_specs(sku),  # 当前商品的所有规格数据
+    }
+
+    return context
+
+
+def get_static_detail_html_path(sku_id):
+    """
+    获取静态详情页文件路径
+    :param sku_id: 商品sku_id
+    :return: 文件绝对路径
+    """
+    return os.path.join(settings.GENERATED_STATIC_HTML_FILES_DIR, 'detail', '%s.html' % sku_id)
+
+
+def generate_static_sku_detail_html(sku_id):
+    """
+    生成静态商品详情页面,商品不存在或已下架时删除旧的静态页面
+    :param sku_id: 商品sku_id
+    :return: 生成的文件路径, 未生成时返回None
+    """
+    file_path = get_static_detail_html_path(sku_id)
+
+    try:
+        sku = SKU.objects.get(id=sku_id, is_launched=True)
+    except SKU.DoesNotExist:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return None
+
+    # 静态页面生成后长期使用, 先确认类别版本号, 不使用进程内可能过期的类别数据
+    get_categories(refresh=True)
+    # 渲染模板,生成静态html文本
+    template = loader.get_template('detail.html')
+    html_text = template.render(get_detail_context(sku))
+
+    # 先写临时文件再替换,保证正在读取静态页面的请求不会读到半个文件
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = '%s.%s.tmp' % (file_path, os.getpid())
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(html_text)
+    os.replace(temp_path, file_path)
+
+    return file_path
+
+
+def generate_all_static_sku_detail_html():
+    """
+    重新生成所有上架商品的静态详情页面, 用于类别或频道修改后更新页面中的商品分类导航
+    :return: 生成的页面数量
+    """
+    count = 0
+    sku_ids = SKU.objects.filter(is_launched=True).order_by('id').values_list('id', flat=True)
+    for sku_id in sku_ids.iterator():
+        if generate_static_sku_detail_html(sku_id):
+            count += 1
+    return count
@@ -1,14 +1,16 @@
+import os, math
 from django import http
 from django.views import View
-from django.utils import timezone
 from django.shortcuts import render
 from django.core.paginator import Paginator, EmptyPage
 
 from meiduo_mall.utils.response_code import RETCODE
-from .models import GoodsCategory, SKU, GoodsVisitCount
+from .models import GoodsCategory, SKU
 from . import constants
-from .utils import get_breadcrumb
-from contents.utils import get_categories
+from .utils import get_breadcrumb, get_detail_context, get_static_detail_html_path, get_goods_list_count, \
+    get_keyset_page, dumps_list_cursor, loads_list_cursor, get_hot_sku_ids, incr_goods_visit, \
+    get_sku_cards
+from contents.utils import get_categories, get_category_ids
 
 
 class ListView(View):
@@ -35,31 +37,41 @@ class ListView(View):
         breadcrumb = get_breadcrumb(category)
 
         # 按照排序规则查询给分类商品sku信息
-        if sort == 'price':
-            # 按照价格由低向高
-            sort_field = 'price'
-        elif sort == 'hot':
-            # 按照销量由低向高
-            sort_field = '-sales'
-        else:
-            # 'price'和'sales'以外的所有排序方式都归为'default'
+        if sort not in constants.GOODS_LIST_ORDERINGS:
+            # 'price'和'hot'以外的所有排序方式都归为'default'
             sort = 'default'
-            sort_field = 'create_time'
+        # 'price'按照价格由低向高, 'hot'按照销量由高向低, 'default'按照创建时间
+        ordering = constants.GOODS_LIST_ORDERINGS[sort]
 
         # 查询出指定类别下的所有商品
-        skus = SKU.objects.filter(category=category, is_launched=True).order_by(sort_field)
-
-        # 创建分页器对象: Paginator(要分页的所有数据, 指定每页显示多少条数据)
-        paginator = Paginator(skus, constants.GOODS_LIST_LIMIT)
-        # 获取每页商品数据
-        try:
-            # 获取到指定页中的所有数据
-            page_skus = paginator.page(page_num)
-        except EmptyPage:
-            # 如果page_num不正确，默认给用户404
-            return http.HttpResponseNotFound('empty page')
-        # 获取列表页总页数
-        total_page = paginator.num_pages
+        skus = SKU.objects.filter(category=category, is_launched=True)
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            # 游标分页: 从上一页最后一个商品之后开始查询,不需要OFFSET和COUNT(*)
+            after = loads_list_cursor(sort, cursor)
+            if after is None:
+                return http.HttpResponseForbidden('参数cursor有误')
+            page_skus = get_keyset_page(skus, sort, after, constants.GOODS_LIST_LIMIT)
+            if not page_skus:
+                return http.HttpResponseNotFound('empty page')
+            # 获取列表页总页数
+            total_page = max(1, math.ceil(get_goods_list_count(category.id) / constants.GOODS_LIST_LIMIT))
+        else:
+            # 创建分页器对象: Paginator(要分页的所有数据, 指定每页显示多少条数据)
+            paginator = Paginator(skus.order_by(*ordering), constants.GOODS_LIST_LIMIT)
+            # 获取每页商品数据
+            try:
+                # 获取到指定页中的所有数据
+                page_skus = paginator.page(page_num)
+            except EmptyPage:
+                # 如果page_num不正确，默认给用户404
+                return http.HttpResponseNotFound('empty page')
+            # 获取列表页总页数
+            total_page = paginator.num_pages
+
+        # 下一页的游标,顺序翻页时使用游标分页
+        next_cursor = dumps_list_cursor(sort, page_skus[-1]) if len(page_skus) else ''
 
         # 渲染页面
         context = {
@@ -70,6 +82,7 @@ class ListView(View):
             'page_skus': page_skus,  # 分页后数据
             'total_page': total_page,  # 总页数
             'page_num': page_num,  # 当前页码
+            'next_cursor': next_cursor,  # 下一页游标
         }
 
         return render(request, 'list.html', context)
@@ -80,23 +93,30 @@ class HotGoodsView(View):
 
     def get(self, request, category_id):
 
-        # 校验
-        try:
-            cat3 = GoodsCategory.objects.get(id=category_id)
-        except GoodsCategory.DoesNotExist:
-            return http.HttpResponseForbidden('category_id不存在')
-
-        # 查询指定三级类型下的销售最高的前两个sku
-        sku_qs = cat3.sku_set.filter(is_launched=True).order_by('-sales')[:2]
-        # 模型转字典
+        # 从redis热销排行中查询指定三级类型下的销售最高的前两个sku, 只有存在的分类才有排行
+        sku_ids = get_hot_sku_ids(category_id, constants.HOT_GOODS_LIMIT)
+        if sku_ids is None:
+            # 排行还未建立时校验分类并查询数据库
+            try:
+                cat3 = GoodsCategory.objects.get(id=category_id)
+            except GoodsCategory.DoesNotExist:
+                return http.HttpResponseForbidden('category_id不存在')
+            sku_ids = list(cat3.sku_set.filter(is_launched=True).order_by('-sales').values_list(
+                'id', flat=True)[:constants.HOT_GOODS_LIMIT])
+
+        # 从sku卡片缓存中读取, 并按排行顺序排列
+        sku_cards = get_sku_cards(sku_ids)
         sku_list = []  # 用来装两个sku字典
-        for sku_model in sku_qs:
+        for sku_id in sku_ids:
+            card = sku_cards.get(sku_id)
+            if card is None or not card['is_launched'] or card['category_id'] != int(category_id):
+                continue
             sku_list.append(
                 {
-                    'id': sku_model.id,
-                    'price': sku_model.price,
-                    'name': sku_model.name,
-                    'default_image_url': sku_model.default_image.url
+                    'id': card['id'],
+                    'price': card['price'],
+                    'name': card['name'],
+                    'default_image_url': card['default_image_url']
                 }
             )
 
@@ -113,65 +133,20 @@ class DetailView(View):
         :param request:
         :return:
         """
+        # 优先返回已生成的静态详情页,不查询数据库
+        file_path = get_static_detail_html_path(sku_id)
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                return http.HttpResponse(f.read())
+
         # 获取当前sku的信息
         try:
             sku = SKU.objects.get(id=sku_id)
         except SKU.DoesNotExist:
             return render(request, '404.html')
 
-        category = sku.category  # 获取当前sku所对应的三级分类
-
-        # 查询当前sku所对应的spu
-        spu = sku.spu
-
-        """1.准备当前商品的规格选项列表"""
-        # 获取出当前正显示的sku商品的规格选项id列表
-        current_sku_spec_qs = sku.specs.order_by('spec_id')
-        current_sku_option_ids = []
-        for current_sku_spec in current_sku_spec_qs:
-            current_sku_option_ids.append(current_sku_spec.option_id)
-
-        """2.构造规格选择仓库
-         {(8, 11): 3, (8, 12): 4, (9, 11): 5, (9, 12): 6, (10, 11): 7, (10, 12): 8}
-         """
-        # 构造规格选择仓库
-        temp_sku_qs = spu.sku_set.all()  # 获取当前spu下的所有sku
-        # 选项仓库大字典
-        spec_sku_map = {}  # {(8, 11): 3, (8, 12): 4, (9, 11): 5, (9, 12): 6, (10, 11): 7, (10, 12): 8}
-        for temp_sku in temp_sku_qs:
-            # 查询每一个sku的规格数据
-            temp_spec_qs = temp_sku.specs.order_by('spec_id')
-            temp_sku_option_ids = []  # 用来包装每个sku的选项值
-            for temp_spec in temp_spec_qs:
-                temp_sku_option_ids.append(temp_spec.option_id)
-            spec_sku_map[tuple(temp_sku_option_ids)] = temp_sku.id
-
-        """3.组合 并找到sku_id 绑定"""
-        spu_spec_qs = spu.specs.order_by('id')  # 获取当前spu中的所有规格
-
-        for index, spec in enumerate(spu_spec_qs):  # 遍历当前所有的规格
-            spec_option_qs = spec.options.all()  # 获取当前规格中的所有选项
-            temp_option_ids = current_sku_option_ids[:]  # 复制一个新的当前显示商品的规格选项列表
-            for option in spec_option_qs:  # 遍历当前规格下的所有选项
-                temp_option_ids[index] = option.id  # [8, 12]
-                option.sku_id = spec_sku_map.get(tuple(temp_option_ids))  # 给每个选项对象绑定下他sku_id属性
-
-            spec.spec_options = spec_option_qs  # 把规格下的所有选项绑定到规格对象的spec_options属性上
-
-        # 查询商品频道分类
-        categories = get_categories()
-        # 查询面包屑导航
-        breadcrumb = get_breadcrumb(sku.category)
-
-        # 渲染页面
-        context = {
-            'categories': categories,  # 商品分类
-            'breadcrumb': breadcrumb,  # 面包屑导航
-            'sku': sku,  # 当前要显示的sku模型对象
-            'category': category,  # 当前的显示sku所属的三级类别
-            'spu': spu,  # sku所属的spu
-            'spec_qs': spu_spec_qs,  # 当前商品的所有规格数据
-        }
+        # 静态页面尚未生成时,动态渲染页面
+        context = get_detail_context(sku)
 
         return render(request, 'detail.html', context)
 
@@ -181,23 +156,11 @@ class DetailVisitView(View):
 
     def post(self, request, category_id):
         """记录分类商品访问量"""
-        try:
-            category = GoodsCategory.objects.get(id=category_id)
-        except GoodsCategory.DoesNotExist:
-            return http.HttpResponseForbidden('缺少必传参数')
-
-        today_date = timezone.now()  # 获取当天的日期
-
-        try:
-            # 查询当天有没有访问过此类别商品
-            counts_data = GoodsVisitCount.objects.get(date=today_date, category=category)
-        except GoodsVisitCount.DoesNotExist:
-            # 如果没有访问过就创建一个新记录
-            counts_data = GoodsVisitCount(
-                category=category
-            )
+        # 不存在的分类不记录, 避免redis缓冲中出现任意的分类字段
+        if int(category_id) not in get_category_ids():
+            return http.HttpResponseForbidden('category_id不存在')
 
-            counts_data.count += 1  # 增加访问量
-            counts_data.save()
+        # 访问量先累加到redis中,由定时任务批量写入数据库
+        incr_goods_visit(category_id)
 
         return http.JsonResponse({'code': RETCODE.OK, 'errmsg': 'OK'})
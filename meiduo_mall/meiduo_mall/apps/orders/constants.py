@@ -0,0 +1,81 @@
+# 下单遇到数据库死锁或锁等待超时时的最大尝试次数
+ORDER_COMMIT_MAX_ATTEMPTS = 3
+
+# 下单重试的基础退避时间(秒), 第n次重试随机等待 0 ~ 基础时间 * 2^n
+ORDER_COMMIT_RETRY_DELAY = 0.02
+
+# 订单运费
+ORDER_FREIGHT = '10.00'
+
+# 异步下单凭证的redis键及有效时间(秒)
+ORDER_TICKET_REDIS_KEY = 'order_ticket_%s'
+ORDER_TICKET_EXPIRES = 60 * 10
+
+# 用户正在排队的下单凭证, 同一用户同一时间只处理一个下单任务
+# 锁与凭证同时过期, 凭证还在排队时用户不能提交新的下单任务
+ORDER_COMMIT_USER_LOCK_KEY = 'order_commit_user_%s'
+ORDER_COMMIT_USER_LOCK_EXPIRES = ORDER_TICKET_EXPIRES
+
+# 异步下单的状态
+ORDER_TICKET_QUEUED = 'queued'
+ORDER_TICKET_SUCCEEDED = 'succeeded'
+ORDER_TICKET_FAILED = 'failed'
+
+# 未支付订单的自动取消时间(秒)
+ORDER_UNPAID_EXPIRES = 60 * 30
+
+# 支付宝支付截止后到自动取消前的宽限期(秒), 支付截止时间只精确到分钟, 并留出付款结果返回的时间
+ORDER_CANCEL_GRACE_PERIOD = 60 * 10
+
+# 向支付宝查询交易状态失败或交易未关闭时, 推迟重新处理的时间(秒)
+ORDER_CANCEL_RETRY_DELAY = 60 * 5
+
+# 等待自动取消的订单, 分数为取消时间戳
+ORDER_CANCEL_QUEUE_REDIS_KEY = 'order_cancel_queue'
+
+# 每批取消的订单数量
+ORDER_CANCEL_BATCH_SIZE = 500
+
+# 取消前并发查询支付宝交易状态的线程数
+ORDER_CANCEL_QUERY_WORKERS = 20
+
+# 自动取消任务锁及其过期时间(秒)
+ORDER_CANCEL_LOCK_KEY = 'order_cancel_lock'
+ORDER_CANCEL_LOCK_EXPIRES = 60 * 5
+
+# 我的订单每页显示的订单数量
+ORDER_LIST_LIMIT = 5
+
+# 用户订单第一页及订单总数的缓存, 下单或订单状态变化时清除
+USER_ORDERS_CACHE_KEY = 'user_orders_%s'
+USER_ORDERS_CACHE_EXPIRES = 60 * 60
+
+# 结算快照的有效时间(秒), 过期后需要重新进入结算页
+ORDER_CHECKOUT_SNAPSHOT_EXPIRES = 60 * 10
+
+# 订单提交幂等键, 值为提交中的标记或第一次提交的结果
+ORDER_IDEMPOTENCY_REDIS_KEY = 'order_idempotency_%s_%s'
+ORDER_IDEMPOTENCY_PENDING = 'pending'
+
+# 提交中标记的有效时间(秒), 需要大于一次下单的最长耗时, 进程崩溃时到期后允许重新提交
+ORDER_IDEMPOTENCY_PENDING_EXPIRES = 60 * 2
+
+# 提交结果的保存时间(秒), 不短于结算快照的有效时间
+ORDER_IDEMPOTENCY_EXPIRES = ORDER_CHECKOUT_SNAPSHOT_EXPIRES
+
+# 重复提交等待第一次提交完成的最长时间及查询间隔(秒)
+ORDER_IDEMPOTENCY_WAIT_TIMEOUT = 5
+ORDER_IDEMPOTENCY_WAIT_INTERVAL = 0.05
+
+# 销售汇总只处理下单时间早于当前时间减去该延迟(秒)的订单, 保证这些订单的事务都已经提交
+SALES_ROLLUP_DELAY = 60 * 5
+
+# 每个事务汇总的下单时间跨度(秒)
+SALES_ROLLUP_CHUNK_SECONDS = 60 * 60
+
+# 每次写入汇总表的行数
+SALES_ROLLUP_BATCH_SIZE = 500
+
+# 汇总任务锁及其过期时间(秒)
+SALES_ROLLUP_LOCK_KEY = 'sales_rollup_lock'
+SALES_ROLLUP_LOCK_EXPIRES = 60 * 5
@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from orders.rollups import rebuild_sales_rollups, get_sales_watermark
+
+
+class Command(BaseCommand):
+    help = '按天重新汇总每日销售汇总表, 每天一个事务, 只汇总水位线之前的订单; 新订单由定时任务增量汇总'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='开始日期, 如2019-07-01')
+        parser.add_argument('end', nargs='?', help='结束日期(包含), 默认到水位线所在的日期')
+        parser.add_argument('--sleep', type=float, default=0.5, help='每天汇总完成后暂停的秒数, 减轻数据库压力')
+
+    def handle(self, *args, **options):
+        watermark = get_sales_watermark()
+        if watermark is None:
+            raise CommandError('还没有开始汇总, 请先执行定时任务rollup_order_sales')
+
+        start = parse_date(options['start'])
+        end = parse_date(options['end']) if options['end'] else timezone.localdate(watermark)
+        if start is None or end is None:
+            raise CommandError('日期格式有误')
+
+        count = 0
+        date = start
+        while date <= end:
+            if not rebuild_sales_rollups(date):
+                break
+            count += 1
+            self.stdout.write('%s 汇总完成' % date)
+            date += timedelta(days=1)
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS('重新汇总%d天' % count))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from orders.models import OrderInfo
+from orders import constants
+
+
+class Command(BaseCommand):
+    help = '把已有的未支付订单加入自动取消队列, 上线自动取消功能时执行一次'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='每次写入redis的订单数')
+
+    def handle(self, *args, **options):
+        redis_conn = get_redis_connection('orders')
+        expires = timedelta(seconds=constants.ORDER_UNPAID_EXPIRES + constants.ORDER_CANCEL_GRACE_PERIOD)
+        orders = OrderInfo.objects.filter(status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).values_list(
+            'order_id', 'create_time')
+
+        count = 0
+        deadlines = {}
+        for order_id, create_time in orders.iterator():
+            deadlines[order_id] = (create_time + expires).timestamp()
+            if len(deadlines) >= options['batch_size']:
+                redis_conn.zadd(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, deadlines)
+                count += len(deadlines)
+                deadlines = {}
+        if deadlines:
+            redis_conn.zadd(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, deadlines)
+            count += len(deadlines)
+
+        self.stdout.write(self.style.SUCCESS('加入自动取消队列%d个订单' % count))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2026-10-17 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_goodsvisitcount_date_default'),
+        ('orders', '0002_orderinfo_user_orders_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryDailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('date', models.DateField(verbose_name='统计日期')),
+                ('count', models.IntegerField(default=0, verbose_name='销量')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='销售额')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='goods.GoodsCategory', verbose_name='商品分类')),
+            ],
+            options={
+                'verbose_name': '分类每日销售汇总',
+                'verbose_name_plural': '分类每日销售汇总',
+                'db_table': 'tb_category_daily_sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='PayMethodDailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('date', models.DateField(verbose_name='统计日期')),
+                ('pay_method', models.SmallIntegerField(choices=[(1, '货到付款'), (2, '支付宝')], verbose_name='支付方式')),
+                ('count', models.IntegerField(default=0, verbose_name='订单数')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='订单金额')),
+            ],
+            options={
+                'verbose_name': '支付方式每日订单汇总',
+                'verbose_name_plural': '支付方式每日订单汇总',
+                'db_table': 'tb_pay_method_daily_sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollupWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('watermark', models.DateTimeField(verbose_name='水位线')),
+            ],
+            options={
+                'verbose_name': '销售汇总进度',
+                'verbose_name_plural': '销售汇总进度',
+                'db_table': 'tb_sales_rollup_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='SKUDailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('date', models.DateField(verbose_name='统计日期')),
+                ('count', models.IntegerField(default=0, verbose_name='销量')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='销售额')),
+                ('sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='goods.SKU', verbose_name='商品SKU')),
+            ],
+            options={
+                'verbose_name': 'sku每日销售汇总',
+                'verbose_name_plural': 'sku每日销售汇总',
+                'db_table': 'tb_sku_daily_sales',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='skudailysales',
+            unique_together=set([('date', 'sku')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paymethoddailysales',
+            unique_together=set([('date', 'pay_method')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorydailysales',
+            unique_together=set([('date', 'category')]),
+        ),
+        migrations.AddIndex(
+            model_name='orderinfo',
+            index=models.Index(fields=['create_time'], name='tb_order_ctime_idx'),
+        ),
+    ]
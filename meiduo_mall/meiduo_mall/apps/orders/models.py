@@ -1,6 +1,6 @@
 from django.db import models
 
-from goods.models import SKU
+from goods.models import SKU, GoodsCategory
 from meiduo_mall.utils.models import BaseModel
 from users.models import User, Address
 
@@ -20,7 +20,8 @@ class OrderInfo(BaseModel):
         "UNSEND": 2,
         "UNRECEIVED": 3,
         "UNCOMMENT": 4,
-        "FINISHED": 5
+        "FINISHED": 5,
+        "CANCELED": 6
     }
     ORDER_STATUS_CHOICES = (
         (1, "待支付"),
@@ -43,6 +44,12 @@ class OrderInfo(BaseModel):
         db_table = "tb_order_info"
         verbose_name = '订单基本信息'
         verbose_name_plural = verbose_name
+        indexes = [
+            # 我的订单游标分页联合索引
+            models.Index(fields=['user', 'create_time', 'order_id'], name='tb_order_user_ctime_idx'),
+            # 销售汇总按下单时间增量扫描
+            models.Index(fields=['create_time'], name='tb_order_ctime_idx'),
+        ]
 
     def __str__(self):
         return self.order_id
@@ -74,3 +81,55 @@ class OrderGoods(BaseModel):
 
     def __str__(self):
         return self.sku.name
+
+
+class SKUDailySales(BaseModel):
+    """sku每日销售汇总, 不含已取消的订单"""
+    date = models.DateField(verbose_name='统计日期')
+    sku = models.ForeignKey(SKU, on_delete=models.CASCADE, verbose_name='商品SKU')
+    count = models.IntegerField(default=0, verbose_name='销量')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='销售额')
+
+    class Meta:
+        db_table = 'tb_sku_daily_sales'
+        verbose_name = 'sku每日销售汇总'
+        verbose_name_plural = verbose_name
+        unique_together = ('date', 'sku')
+
+
+class CategoryDailySales(BaseModel):
+    """三级分类每日销售汇总, 不含已取消的订单"""
+    date = models.DateField(verbose_name='统计日期')
+    category = models.ForeignKey(GoodsCategory, on_delete=models.CASCADE, verbose_name='商品分类')
+    count = models.IntegerField(default=0, verbose_name='销量')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='销售额')
+
+    class Meta:
+        db_table = 'tb_category_daily_sales'
+        verbose_name = '分类每日销售汇总'
+        verbose_name_plural = verbose_name
+        unique_together = ('date', 'category')
+
+
+class PayMethodDailySales(BaseModel):
+    """支付方式每日订单汇总, 不含已取消的订单"""
+    date = models.DateField(verbose_name='统计日期')
+    pay_method = models.SmallIntegerField(choices=OrderInfo.PAY_METHOD_CHOICES, verbose_name='支付方式')
+    count = models.IntegerField(default=0, verbose_name='订单数')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='订单金额')
+
+    class Meta:
+        db_table = 'tb_pay_method_daily_sales'
+        verbose_name = '支付方式每日订单汇总'
+        verbose_name_plural = verbose_name
+        unique_together = ('date', 'pay_method')
+
+
+class SalesRollupWatermark(BaseModel):
+    """销售汇总进度: 下单时间早于水位线的订单已经计入汇总表"""
+    watermark = models.DateTimeField(verbose_name='水位线')
+
+    class Meta:
+        db_table = 'tb_sales_rollup_watermark'
+        verbose_name = '销售汇总进度'
+        verbose_name_plural = verbose_name
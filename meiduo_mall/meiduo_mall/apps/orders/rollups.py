@@ -0,0 +1,253 @@
+import time
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import F, Sum, Count, Case, When, Value, IntegerField, DecimalField
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_lock import acquire_lock, release_lock
+from .models import OrderInfo, OrderGoods, SKUDailySales, CategoryDailySales, PayMethodDailySales, \
+    SalesRollupWatermark
+from . import constants
+
+# 销售汇总:
+# 定时任务从水位线开始, 每次汇总一段下单时间(不跨天)内未取消的订单, 累加到各汇总表后推进水位线, 两者在同一个事务中提交;
+# 订单取消时在取消事务中锁住水位线, 水位线之前的订单已计入汇总, 从汇总表中减去, 之后的订单汇总时会被跳过。
+# 运营报表只查询汇总表, 不再实时关联订单表和订单商品表。
+
+# 汇总表及其维度字段
+ROLLUPS = (
+    (SKUDailySales, 'sku_id'),
+    (CategoryDailySales, 'category_id'),
+    (PayMethodDailySales, 'pay_method'),
+)
+
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _day_start(date):
+    """统计日期当天0点"""
+    return timezone.make_aware(datetime.combine(date, datetime.min.time()))
+
+
+def _lock_watermark(create=False):
+    """
+    锁住并返回水位线记录, 必须在事务中调用
+    :param create: 没有记录时是否从最早的订单开始创建
+    :return: 水位线记录, 不存在时返回None
+    """
+    watermark = SalesRollupWatermark.objects.select_for_update().first()
+    if watermark is None and create:
+        first = OrderInfo.objects.order_by('create_time').values_list('create_time', flat=True).first()
+        if first is not None:
+            watermark = SalesRollupWatermark.objects.create(watermark=first)
+    return watermark
+
+
+def _valid_orders(start, end):
+    """
+    下单时间在 [start, end) 内未取消的订单
+    :return: (订单查询集, 订单商品查询集)
+    """
+    canceled = OrderInfo.ORDER_STATUS_ENUM['CANCELED']
+    orders = OrderInfo.objects.filter(create_time__gte=start, create_time__lt=end).exclude(status=canceled)
+    order_goods = OrderGoods.objects.filter(order__create_time__gte=start, order__create_time__lt=end).exclude(
+        order__status=canceled)
+    return orders, order_goods
+
+
+def _collect(orders, order_goods):
+    """
+    汇总同一天的订单
+    :param orders: 订单查询集
+    :param order_goods: 这些订单的订单商品查询集
+    :return: {汇总表模型类: {维度值: (数量, 金额)}}
+    """
+    amount = Sum(F('price') * F('count'), output_field=AMOUNT_FIELD)
+    sku_rows = order_goods.order_by().values('sku_id').annotate(total_count=Sum('count'), total_amount=amount)
+    category_rows = order_goods.order_by().values('sku__category_id').annotate(
+        total_count=Sum('count'), total_amount=amount)
+    pay_method_rows = orders.order_by().values('pay_method').annotate(
+        total_count=Count('order_id'), total_amount=Sum('total_amount'))
+
+    return {
+        SKUDailySales: {row['sku_id']: (row['total_count'], row['total_amount']) for row in sku_rows},
+        CategoryDailySales: {row['sku__category_id']: (row['total_count'], row['total_amount'])
+                             for row in category_rows},
+        PayMethodDailySales: {row['pay_method']: (row['total_count'], row['total_amount'])
+                              for row in pay_method_rows},
+    }
+
+
+def _apply(date, deltas, sign=1):
+    """
+    把一天的汇总结果累加到汇总表, 已有的行每批用一条UPDATE累加, 没有的行批量插入
+    :param date: 统计日期
+    :param deltas: _collect的返回值
+    :param sign: 1为累加, -1为减去
+    :return: None
+    """
+    for model, field in ROLLUPS:
+        rows = deltas[model]
+        if not rows:
+            continue
+        # 加锁读取, 能看到其他事务刚插入的行
+        existing = sorted(model.objects.select_for_update().filter(
+            date=date, **{field + '__in': rows.keys()}).values_list(field, flat=True))
+
+        for i in range(0, len(existing), constants.SALES_ROLLUP_BATCH_SIZE):
+            batch = existing[i:i + constants.SALES_ROLLUP_BATCH_SIZE]
+            model.objects.filter(date=date, **{field + '__in': batch}).update(
+                count=F('count') + Case(*[When(then=Value(sign * rows[key][0]), **{field: key}) for key in batch],
+                                        output_field=IntegerField()),
+                amount=F('amount') + Case(*[When(then=Value(sign * rows[key][1]), **{field: key}) for key in batch],
+                                          output_field=AMOUNT_FIELD),
+            )
+
+        existing = set(existing)
+        model.objects.bulk_create([
+            model(date=date, count=sign * count, amount=sign * amount, **{field: key})
+            for key, (count, amount) in rows.items() if key not in existing
+        ], batch_size=constants.SALES_ROLLUP_BATCH_SIZE)
+
+
+def _rollup_next_chunk():
+    """
+    汇总水位线之后的一段订单并推进水位线
+    :return: 是否汇总了一段, 已经追上当前时间时返回False
+    """
+    # 早于该时间创建的订单事务都已经提交, 不会在水位线推进后才出现
+    limit = timezone.now() - timedelta(seconds=constants.SALES_ROLLUP_DELAY)
+    with transaction.atomic():
+        watermark = _lock_watermark(create=True)
+        if watermark is None or watermark.watermark >= limit:
+            return False
+
+        start = watermark.watermark
+        date = timezone.localdate(start)
+        # 不跨天, 整段订单属于同一个统计日期
+        end = min(start + timedelta(seconds=constants.SALES_ROLLUP_CHUNK_SECONDS),
+                  _day_start(date + timedelta(days=1)), limit)
+
+        _apply(date, _collect(*_valid_orders(start, end)))
+
+        watermark.watermark = end
+        watermark.save(update_fields=['watermark', 'update_time'])
+    return True
+
+
+def rollup_sales():
+    """
+    从水位线开始分段汇总订单, 直到追上当前时间
+    :return: 汇总的时间段数量
+    """
+    redis_conn = get_redis_connection('orders')
+    # 同一时间只允许一个任务汇总
+    lock_token = acquire_lock(redis_conn, constants.SALES_ROLLUP_LOCK_KEY, constants.SALES_ROLLUP_LOCK_EXPIRES)
+    if lock_token is None:
+        return 0
+
+    count = 0
+    stop_time = time.time() + constants.SALES_ROLLUP_LOCK_EXPIRES / 2
+    try:
+        # 运行时间超过任务锁有效期的一半时停止, 剩余时间段由下次任务处理
+        while time.time() < stop_time and _rollup_next_chunk():
+            count += 1
+    finally:
+        release_lock(redis_conn, constants.SALES_ROLLUP_LOCK_KEY, lock_token)
+
+    return count
+
+
+def subtract_canceled_orders(order_ids):
+    """
+    从汇总表中减去已经计入汇总的订单, 必须在取消订单的事务中调用
+    :param order_ids: 已取消的订单编号列表
+    :return: None
+    """
+    watermark = _lock_watermark()
+    if watermark is None:
+        return
+
+    # 水位线之后的订单还没有汇总, 汇总时已取消的订单会被跳过
+    date_orders = {}
+    for order_id, create_time in OrderInfo.objects.filter(
+            order_id__in=order_ids, create_time__lt=watermark.watermark).values_list('order_id', 'create_time'):
+        date_orders.setdefault(timezone.localdate(create_time), []).append(order_id)
+
+    for date, ids in date_orders.items():
+        deltas = _collect(OrderInfo.objects.filter(order_id__in=ids), OrderGoods.objects.filter(order_id__in=ids))
+        _apply(date, deltas, sign=-1)
+
+
+def rebuild_sales_rollups(date):
+    """
+    重新汇总一天的订单: 删除这一天的汇总数据后按水位线之前的订单重新计算, 用于补数据或修正数据
+    :param date: 统计日期
+    :return: 是否重新汇总, 这一天还没有开始汇总时返回False
+    """
+    start = _day_start(date)
+    with transaction.atomic():
+        watermark = _lock_watermark()
+        if watermark is None or watermark.watermark <= start:
+            return False
+        end = min(_day_start(date + timedelta(days=1)), watermark.watermark)
+
+        for model, _ in ROLLUPS:
+            model.objects.filter(date=date).delete()
+        _apply(date, _collect(*_valid_orders(start, end)))
+    return True
+
+
+def get_sales_watermark():
+    """
+    查询汇总进度
+    :return: 水位线, 下单时间早于它的订单已经计入汇总表, 还没有开始汇总时返回None
+    """
+    return SalesRollupWatermark.objects.values_list('watermark', flat=True).first()
+
+
+def get_daily_sales(start_date, end_date):
+    """
+    查询每日订单数和订单金额
+    :param start_date: 开始日期(包含)
+    :param end_date: 结束日期(包含)
+    :return: [{'date', 'total_count', 'total_amount'}], 按日期排序
+    """
+    return list(PayMethodDailySales.objects.filter(date__range=(start_date, end_date)).values('date').annotate(
+        total_count=Sum('count'), total_amount=Sum('amount')).order_by('date'))
+
+
+def get_sku_sales(start_date, end_date, limit=None):
+    """
+    查询一段时间内各sku的销量和销售额
+    :param start_date: 开始日期(包含)
+    :param end_date: 结束日期(包含)
+    :param limit: 只返回销量最高的前几个sku
+    :return: [{'sku_id', 'total_count', 'total_amount'}], 按销量由高到低
+    """
+    rows = SKUDailySales.objects.filter(date__range=(start_date, end_date)).values('sku_id').annotate(
+        total_count=Sum('count'), total_amount=Sum('amount')).order_by('-total_count', 'sku_id')
+    return list(rows[:limit] if limit else rows)
+
+
+def get_category_sales(start_date, end_date):
+    """
+    查询一段时间内各三级分类的销量和销售额
+    :param start_date: 开始日期(包含)
+    :param end_date: 结束日期(包含)
+    :return: [{'category_id', 'total_count', 'total_amount'}], 按销售额由高到低
+    """
+    return list(CategoryDailySales.objects.filter(date__range=(start_date, end_date)).values('category_id').annotate(
+        total_count=Sum('count'), total_amount=Sum('amount')).order_by('-total_amount', 'category_id'))
+
+
+def get_pay_method_sales(start_date, end_date):
+    """
+    查询一段时间内各支付方式的订单数和订单金额
+    :param start_date: 开始日期(包含)
+    :param end_date: 结束日期(包含)
+    :return: [{'pay_method', 'total_count', 'total_amount'}], 按支付方式排序
+    """
+    return list(PayMethodDailySales.objects.filter(date__range=(start_date, end_date)).values('pay_method').annotate(
+        total_count=Sum('count'), total_amount=Sum('amount')).order_by('pay_method'))
@@ -1,3 +1,52 @@
-from django.test import TestCase
+import tempfile
+import multiprocessing
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from meiduo_mall.utils.order_id import SnowflakeOrderIdGenerator
+
+
+def generate_order_ids(lock_dir, count):
+    """在子进程中生成订单编号"""
+    generator = SnowflakeOrderIdGenerator(node=0, lock_dir=lock_dir)
+    return [generator.generate() for _ in range(count)]
+
+
+class SnowflakeOrderIdGeneratorTest(SimpleTestCase):
+    """订单编号生成器"""
+    PROCESSES = 8  # 同时生成订单编号的进程数
+    COUNT = 20000  # 每个进程生成的数量
+
+    def setUp(self):
+        self.lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.lock_dir.cleanup)
+
+    def test_format(self):
+        """订单编号为25位数字"""
+        order_id = SnowflakeOrderIdGenerator(node=7, lock_dir=self.lock_dir.name).generate()
+        self.assertEqual(len(order_id), 25)
+        self.assertTrue(order_id.isdigit())
+        self.assertEqual(order_id[17:19], '07')
+
+    def test_multi_process_unique(self):
+        """多个进程同时生成的订单编号不重复, 每个进程内按字符串排序单调递增"""
+        with multiprocessing.Pool(self.PROCESSES) as pool:
+            results = pool.starmap(generate_order_ids, [(self.lock_dir.name, self.COUNT)] * self.PROCESSES)
+
+        all_ids = set()
+        for order_ids in results:
+            self.assertEqual(order_ids, sorted(order_ids))
+            all_ids.update(order_ids)
+        self.assertEqual(len(all_ids), self.PROCESSES * self.COUNT)
+
+    def test_fork_reacquires_worker(self):
+        """fork出的子进程分配与父进程不同的进程号"""
+        generator = SnowflakeOrderIdGenerator(node=0, lock_dir=self.lock_dir.name)
+        parent_id = generator.generate()
+        # 直接fork, 子进程使用从父进程继承的生成器对象
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        process = ctx.Process(target=lambda: queue.put(generator.generate()))
+        process.start()
+        child_id = queue.get(timeout=10)
+        process.join()
+        self.assertNotEqual(parent_id[19:22], child_id[19:22])
@@ -7,6 +7,10 @@ urlpatterns = [
     url(r'^orders/settlement/$', views.OrderView.as_view()),
     # 订单结算
     url(r'^orders/commit/$', views.OrderCommitView.as_view()),
+    # 查询异步下单结果
+    url(r'^orders/commit/status/$', views.OrderCommitStatusView.as_view()),
     # 提交成功后界面
     url(r'^orders/success/$', views.OrderSuccessView.as_view()),
+    # 我的订单
+    url(r'^orders/info/(?P<page_num>\d+)/$', views.UserOrderInfoView.as_view()),
 ]
\ No newline at end of file
@@ -0,0 +1,605 @@
+import time, json, uuid, random, logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction, OperationalError
+from django.db.models import F, Q, Sum, Case, When, Value, IntegerField
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+
+from meiduo_mall.utils.redis_lock import acquire_lock, release_lock
+from goods.models import SKU
+from goods.utils import incr_hot_goods_sales
+from goods.inventory import reserve_hot_stock, confirm_hot_stock, release_hot_stock, restore_stock, \
+    get_expired_hot_stock_reservations
+from carts.stores import RedisCartStore
+from users.models import User
+from payment.models import Payment
+from payment.utils import query_alipay_trade, ALIPAY_TRADE_PAID, ALIPAY_TRADE_CLOSED
+from .models import OrderInfo, OrderGoods
+from .rollups import subtract_canceled_orders
+from . import constants
+
+logger = logging.getLogger('django')
+
+
+def deduct_stock(cart_dict, hot_sku_ids=()):
+    """
+    用一条带库存条件的UPDATE扣减所有商品的库存、增加销量
+    必须在事务中调用, UPDATE按主键顺序加行锁, 所有下单请求加锁顺序一致, 不会互相死锁
+    :param cart_dict: 要购买的商品 {sku_id: 数量}
+    :param hot_sku_ids: 已在redis中预占库存的热点商品, 不更新数据库, 由定时任务同步
+    :return: 是否扣减成功, 任一商品不存在或库存不足时返回False, 由调用方回滚事务
+    """
+    if any(count <= 0 for count in cart_dict.values()):
+        return False
+    sku_counts = {sku_id: count for sku_id, count in cart_dict.items() if sku_id not in hot_sku_ids}
+    if not sku_counts:
+        return True
+
+    def counts():
+        return Case(*[When(id=sku_id, then=Value(count)) for sku_id, count in sku_counts.items()],
+                    default=Value(0), output_field=IntegerField())
+
+    # 库存判断和扣减在同一条语句中完成, 匹配的行数少于商品数说明有商品不存在或库存不足
+    result = SKU.objects.filter(id__in=sku_counts.keys(), stock__gte=counts()).update(
+        stock=F('stock') - counts(), sales=F('sales') + counts())
+    return result == len(sku_counts)
+
+
+def _create_order(order_id, user, address_id, pay_method, lines, hot_sku_ids):
+    """在一个事务中创建订单并扣减库存, 库存不足时回滚并返回None"""
+    # 根据支付方法判断订单状态
+    status = (OrderInfo.ORDER_STATUS_ENUM['UNPAID']
+              if pay_method == OrderInfo.PAY_METHODS_ENUM['ALIPAY']
+              else OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
+
+    with transaction.atomic():
+        if not deduct_stock({sku_id: line[0] for sku_id, line in lines.items()}, hot_sku_ids):
+            # 库存不足事务中的操作进行回滚
+            transaction.set_rollback(True)
+            return None
+
+        # spu销量由定时任务根据sku销量汇总, 下单时不修改spu行
+        order_goods = []  # 订单中商品记录 OrderGoods记录 （多）
+        hot_goods_sales = []  # 用来更新分类热销排行 [(category_id, sku_id, 购买数量)]
+        total_count = 0
+        total_amount = Decimal('0.00')
+        for sku_id in sorted(lines):
+            # 单价使用结算快照中展示给用户的价格
+            buy_count, price, category_id = lines[sku_id]
+
+            order_goods.append(OrderGoods(
+                order_id=order_id,
+                sku_id=sku_id,
+                count=buy_count,
+                price=price
+            ))
+
+            # 累加订单中购买商品总数量和总价
+            total_count += buy_count
+            total_amount += (price * buy_count)
+            hot_goods_sales.append((category_id, sku_id, buy_count))
+
+        # 保存订单基本信息记录  OrderInfo记录（一）, 总价中运费只算一次
+        freight = Decimal(constants.ORDER_FREIGHT)
+        order_model = OrderInfo.objects.create(
+            order_id=order_id,
+            user=user,
+            address_id=address_id,
+            total_count=total_count,
+            total_amount=total_amount + freight,
+            freight=freight,
+            pay_method=pay_method,
+            status=status
+        )
+
+        # 一条INSERT保存所有订单商品
+        OrderGoods.objects.bulk_create(order_goods)
+
+        # 事务提交后更新分类热销排行, 清除用户订单第一页缓存
+        transaction.on_commit(lambda: incr_hot_goods_sales(hot_goods_sales))
+        transaction.on_commit(lambda: delete_user_orders_cache(user.id))
+        if status == OrderInfo.ORDER_STATUS_ENUM['UNPAID']:
+            # 事务提交后加入自动取消队列, 支付截止后再留一段宽限期
+            transaction.on_commit(lambda: schedule_order_cancel(
+                order_id, time.time() + constants.ORDER_UNPAID_EXPIRES + constants.ORDER_CANCEL_GRACE_PERIOD))
+
+    return order_model
+
+
+def create_order(order_id, user, address_id, pay_method, lines):
+    """
+    创建订单, 遇到数据库死锁或锁等待超时时整体重试, 重试次数有上限且随机退避
+    热点商品先在redis中预占库存, 订单创建成功后确认, 失败后释放
+    :param order_id: 订单编号
+    :param user: 下单用户
+    :param address_id: 收货地址id
+    :param pay_method: 支付方式
+    :param lines: 结算快照中的商品 {sku_id: (数量, 单价, 分类id)}
+    :return: 订单对象, 库存不足时返回None
+    """
+    hot_sku_ids = reserve_hot_stock(order_id, {sku_id: line[0] for sku_id, line in lines.items()})
+    if hot_sku_ids is None:
+        # 热点商品库存不足
+        return None
+
+    order_model = None
+    try:
+        for attempt in range(1, constants.ORDER_COMMIT_MAX_ATTEMPTS + 1):
+            try:
+                order_model = _create_order(order_id, user, address_id, pay_method, lines, hot_sku_ids)
+                break
+            except OperationalError as e:
+                if attempt == constants.ORDER_COMMIT_MAX_ATTEMPTS:
+                    raise
+                logger.warning('下单第%d次失败, 准备重试: %s' % (attempt, e))
+                time.sleep(random.uniform(0, constants.ORDER_COMMIT_RETRY_DELAY * 2 ** attempt))
+    finally:
+        if hot_sku_ids:
+            # 事务提交后的回调出错时订单已经创建, 以数据库为准
+            if order_model is not None or OrderInfo.objects.filter(order_id=order_id).exists():
+                confirm_hot_stock(order_id)
+            else:
+                release_hot_stock(order_id)
+
+    return order_model
+
+
+def resolve_expired_hot_stock_reservations():
+    """
+    处理过期的库存预占: 订单已创建的确认预占, 否则释放库存
+    :return: 处理的预占数量
+    """
+    order_ids = get_expired_hot_stock_reservations()
+    created = set(OrderInfo.objects.filter(order_id__in=order_ids).values_list('order_id', flat=True))
+    for order_id in order_ids:
+        if order_id in created:
+            confirm_hot_stock(order_id)
+        else:
+            release_hot_stock(order_id)
+    return len(order_ids)
+
+
+# 认领排队中的下单凭证, 同一个凭证只有一个任务能执行下单
+# KEYS: 下单凭证, 用户下单锁  ARGV: 下单凭证, 有效时间, 排队中状态
+# 返回: 1 认领成功; 0 凭证已过期、已处理或不再持有用户下单锁; -1 凭证已被其他任务认领
+CLAIM_TICKET_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'status') ~= ARGV[3] then
+    return 0
+end
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('HSETNX', KEYS[1], 'processing', 1) == 0 then
+    return -1
+end
+-- 下单期间凭证和用户下单锁不会过期
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def create_order_ticket(user_id):
+    """
+    生成异步下单凭证, 同一用户同一时间只能有一个排队中的下单任务
+    :param user_id: 用户id
+    :return: (下单凭证, 是否新生成), 用户已有排队中的任务时返回该任务的凭证
+    """
+    redis_conn = get_redis_connection('orders')
+    lock_key = constants.ORDER_COMMIT_USER_LOCK_KEY % user_id
+    ticket = uuid.uuid4().hex
+    ticket_key = constants.ORDER_TICKET_REDIS_KEY % ticket
+
+    # 先写入凭证再加锁, 拿到凭证的前端查询状态时凭证一定存在
+    pl = redis_conn.pipeline()
+    pl.hmset(ticket_key, {'user_id': user_id, 'status': constants.ORDER_TICKET_QUEUED})
+    pl.expire(ticket_key, constants.ORDER_TICKET_EXPIRES)
+    pl.execute()
+
+    if redis_conn.set(lock_key, ticket, nx=True, ex=constants.ORDER_COMMIT_USER_LOCK_EXPIRES):
+        return ticket, True
+
+    redis_conn.delete(ticket_key)
+    queued_ticket = redis_conn.get(lock_key)
+    if queued_ticket is None:
+        # 排队中的任务刚好结束, 重新生成
+        return create_order_ticket(user_id)
+    return queued_ticket.decode(), False
+
+
+def get_order_ticket(ticket):
+    """
+    查询异步下单结果
+    :param ticket: 下单凭证
+    :return: {'user_id', 'status', 'order_id', 'errmsg'}, 凭证不存在或已过期时返回None
+    """
+    data = get_redis_connection('orders').hgetall(constants.ORDER_TICKET_REDIS_KEY % ticket)
+    if not data:
+        return None
+    data = {key.decode(): value.decode() for key, value in data.items()}
+    data['user_id'] = int(data['user_id'])
+    return data
+
+
+def finish_order_ticket(ticket, user_id, status, **result):
+    """
+    记录异步下单结果并释放用户的下单锁
+    :param ticket: 下单凭证
+    :param user_id: 用户id
+    :param status: 下单状态
+    :param result: 订单编号或错误信息
+    :return: None
+    """
+    redis_conn = get_redis_connection('orders')
+    ticket_key = constants.ORDER_TICKET_REDIS_KEY % ticket
+    pl = redis_conn.pipeline()
+    pl.hmset(ticket_key, dict(result, status=status))
+    pl.expire(ticket_key, constants.ORDER_TICKET_EXPIRES)
+    pl.execute()
+    # 只释放自己持有的下单锁, 锁的值为下单凭证
+    release_lock(redis_conn, constants.ORDER_COMMIT_USER_LOCK_KEY % user_id, ticket)
+
+
+def process_order_ticket(ticket, user_id, address_id, pay_method, order_id, lines):
+    """
+    在下单队列中执行异步下单, 任务重复投递时不会重复下单
+    :param ticket: 下单凭证
+    :param user_id: 用户id
+    :param address_id: 收货地址id
+    :param pay_method: 支付方式
+    :param order_id: 订单编号
+    :param lines: 结算快照中的商品 {sku_id: (数量, 单价, 分类id)}
+    :return: None
+    """
+    redis_conn = get_redis_connection('orders')
+    claimed = redis_conn.register_script(CLAIM_TICKET_SCRIPT)(
+        keys=[constants.ORDER_TICKET_REDIS_KEY % ticket, constants.ORDER_COMMIT_USER_LOCK_KEY % user_id],
+        args=[ticket, constants.ORDER_TICKET_EXPIRES, constants.ORDER_TICKET_QUEUED], client=redis_conn)
+
+    if claimed == -1:
+        # 任务重复投递, 凭证已被认领; 上次执行已经创建了订单只是没有记录结果时补记结果
+        if OrderInfo.objects.filter(order_id=order_id).exists():
+            finish_order_ticket(ticket, user_id, constants.ORDER_TICKET_SUCCEEDED, order_id=order_id)
+        return
+    if claimed == 0:
+        ticket_data = get_order_ticket(ticket)
+        if ticket_data is not None and ticket_data['status'] == constants.ORDER_TICKET_QUEUED:
+            # 用户下单锁已经失效, 用户可能已经重新提交, 不能再下单
+            finish_order_ticket(ticket, user_id, constants.ORDER_TICKET_FAILED, errmsg='下单排队超时')
+        # 凭证已过期或已经处理过
+        return
+
+    try:
+        order_model = create_order(order_id, User.objects.get(id=user_id), address_id, pay_method, lines)
+    except Exception as e:
+        logger.error(e)
+        finish_order_ticket(ticket, user_id, constants.ORDER_TICKET_FAILED, errmsg='下单失败')
+        return
+
+    if order_model is None:
+        finish_order_ticket(ticket, user_id, constants.ORDER_TICKET_FAILED, errmsg='库存不足')
+        return
+
+    # 删除购物车中已经购买过的商品
+    RedisCartStore(user_id).remove(*lines.keys())
+    finish_order_ticket(ticket, user_id, constants.ORDER_TICKET_SUCCEEDED, order_id=order_id)
+
+
+def dumps_checkout_snapshot(user_id, cart_version, skus, address_ids):
+    """
+    生成结算快照: 结算页展示的商品、价格、总价和可选的收货地址, 签名后交给前端, 提交订单时原样带回
+    每次生成的快照带有新的幂等键, 用同一个快照重复提交只会下一次单
+    :param user_id: 用户id
+    :param cart_version: 读取购物车时的版本号, 购物车修改后快照失效
+    :param skus: 结算页展示的商品 [{'id', 'count', 'price', 'category_id'}]
+    :param address_ids: 用户的收货地址id列表
+    :return: 快照字符串
+    """
+    total_count = sum(sku['count'] for sku in skus)
+    total_amount = sum((sku['price'] * sku['count'] for sku in skus), Decimal('0.00'))
+    return signing.dumps({
+        'user_id': user_id,
+        'cart_version': cart_version,
+        'lines': [[sku['id'], sku['count'], str(sku['price']), sku['category_id']] for sku in skus],
+        'total_count': total_count,
+        'total_amount': str(total_amount),
+        'freight': constants.ORDER_FREIGHT,
+        'address_ids': list(address_ids),
+        'idempotency_key': uuid.uuid4().hex,
+    }, salt='checkout_snapshot', compress=True)
+
+
+def loads_checkout_snapshot(user_id, snapshot):
+    """
+    解析结算快照
+    :param user_id: 当前用户id
+    :param snapshot: 快照字符串
+    :return: {'cart_version', 'lines': {sku_id: (数量, 单价, 分类id)}, 'total_count', 'total_amount', 'freight',
+              'address_ids', 'idempotency_key'}, 快照无效、过期或不属于当前用户时返回None
+    """
+    try:
+        data = signing.loads(snapshot, salt='checkout_snapshot', max_age=constants.ORDER_CHECKOUT_SNAPSHOT_EXPIRES)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if data.get('user_id') != user_id:
+        return None
+
+    data['lines'] = {sku_id: (count, Decimal(price), category_id)
+                     for sku_id, count, price, category_id in data['lines']}
+    data['total_amount'] = Decimal(data['total_amount'])
+    data['freight'] = Decimal(data['freight'])
+    return data
+
+
+def claim_order_submission(user_id, idempotency_key):
+    """
+    用幂等键占用一次订单提交, 同一个幂等键只有第一次提交会执行下单
+    重复提交时等待第一次提交完成, 第一次提交失败释放幂等键后由重复提交重新占用
+    :param user_id: 用户id
+    :param idempotency_key: 幂等键
+    :return: (是否占用成功, 第一次提交的结果), 等待超时时结果为None
+    """
+    redis_conn = get_redis_connection('orders')
+    key = constants.ORDER_IDEMPOTENCY_REDIS_KEY % (user_id, idempotency_key)
+    deadline = time.time() + constants.ORDER_IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        if redis_conn.set(key, constants.ORDER_IDEMPOTENCY_PENDING, nx=True,
+                          ex=constants.ORDER_IDEMPOTENCY_PENDING_EXPIRES):
+            return True, None
+        value = redis_conn.get(key)
+        if value is not None and value.decode() != constants.ORDER_IDEMPOTENCY_PENDING:
+            return False, json.loads(value.decode())
+        if time.time() >= deadline:
+            return False, None
+        time.sleep(constants.ORDER_IDEMPOTENCY_WAIT_INTERVAL)
+
+
+def finish_order_submission(user_id, idempotency_key, **result):
+    """
+    记录订单提交的结果, 之后的重复提交直接返回该结果
+    :param user_id: 用户id
+    :param idempotency_key: 幂等键
+    :param result: 响应中的订单编号或下单凭证及提示信息
+    :return: result
+    """
+    get_redis_connection('orders').set(constants.ORDER_IDEMPOTENCY_REDIS_KEY % (user_id, idempotency_key),
+                                       json.dumps(result), ex=constants.ORDER_IDEMPOTENCY_EXPIRES)
+    return result
+
+
+def release_order_submission(user_id, idempotency_key):
+    """
+    订单提交失败后释放幂等键, 允许用同一个结算快照重新提交
+    :param user_id: 用户id
+    :param idempotency_key: 幂等键
+    :return: None
+    """
+    get_redis_connection('orders').delete(constants.ORDER_IDEMPOTENCY_REDIS_KEY % (user_id, idempotency_key))
+
+
+def schedule_order_cancel(order_id, deadline):
+    """
+    把未支付订单加入自动取消队列
+    :param order_id: 订单编号
+    :param deadline: 取消时间戳
+    :return: None
+    """
+    get_redis_connection('orders').zadd(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, {order_id: deadline})
+
+
+def unschedule_order_cancel(order_id):
+    """
+    订单支付后移出自动取消队列
+    :param order_id: 订单编号
+    :return: None
+    """
+    get_redis_connection('orders').zrem(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, order_id)
+
+
+def mark_order_paid(order_id, trade_id):
+    """
+    记录支付宝交易号, 未支付的订单改为已支付, 与自动取消订单互斥
+    :param order_id: 订单编号
+    :param trade_id: 支付宝交易号
+    :return: 处理后的订单对象, 订单不存在时返回None; 付款前已经取消的订单状态仍为已取消, 由调用方退款
+    """
+    with transaction.atomic():
+        # 锁住订单行, 与取消订单互斥
+        order = OrderInfo.objects.select_for_update().filter(order_id=order_id).first()
+        if order is None:
+            return None
+        # 保存支付宝交易号及订单编号
+        Payment.objects.get_or_create(trade_id=trade_id, defaults={'order_id': order_id})
+        if order.status == OrderInfo.ORDER_STATUS_ENUM['UNPAID']:
+            order.status = OrderInfo.ORDER_STATUS_ENUM['UNCOMMENT']
+            order.save(update_fields=['status', 'update_time'])
+
+    # 已支付的订单不再需要自动取消, 订单状态变化, 清除用户订单第一页缓存
+    unschedule_order_cancel(order_id)
+    delete_user_orders_cache(order.user_id)
+    return order
+
+
+def check_unpaid_orders(order_ids):
+    """
+    取消前向支付宝查询交易状态, 已经付款但买家没有回到支付结果页面的订单改为已支付
+    :param order_ids: 到期的订单编号列表
+    :return: (可以取消的订单编号列表, 需要稍后重新查询的订单编号列表)
+    """
+    alipay_ids = set(OrderInfo.objects.filter(
+        order_id__in=order_ids, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID'],
+        pay_method=OrderInfo.PAY_METHODS_ENUM['ALIPAY']).values_list('order_id', flat=True))
+
+    # 其他订单交给cancel_orders, 已支付或已取消的订单不会被处理
+    cancelable = [order_id for order_id in order_ids if order_id not in alipay_ids]
+    retry = []
+    if not alipay_ids:
+        return cancelable, retry
+
+    # 查询支付宝是网络请求, 用线程池并发查询, 处理查询结果仍在当前线程中
+    with ThreadPoolExecutor(max_workers=min(constants.ORDER_CANCEL_QUERY_WORKERS, len(alipay_ids))) as executor:
+        futures = {order_id: executor.submit(query_alipay_trade, order_id) for order_id in alipay_ids}
+
+    for order_id, future in futures.items():
+        try:
+            trade_status, trade_id = future.result()
+        except Exception as e:
+            logger.warning(e)
+            retry.append(order_id)
+            continue
+
+        if trade_status in ALIPAY_TRADE_PAID:
+            mark_order_paid(order_id, trade_id)
+        elif trade_status is None or trade_status == ALIPAY_TRADE_CLOSED:
+            # 支付截止时间已过, 交易不存在或已关闭的订单不会再付款
+            cancelable.append(order_id)
+        else:
+            # 交易还没有关闭, 稍后再查询
+            retry.append(order_id)
+    return cancelable, retry
+
+
+def cancel_orders(order_ids):
+    """
+    取消仍未支付的订单, 并归还订单商品的库存和销量
+    已支付或已取消的订单不处理, 重复调用是安全的
+    :param order_ids: 订单编号列表
+    :return: 取消的订单编号列表
+    """
+    with transaction.atomic():
+        # 锁住订单行, 与支付成功修改订单状态互斥
+        canceled_orders = dict(OrderInfo.objects.select_for_update().filter(
+            order_id__in=order_ids, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).values_list('order_id', 'user_id'))
+        if not canceled_orders:
+            return []
+        canceled_ids = list(canceled_orders)
+
+        OrderInfo.objects.filter(order_id__in=canceled_ids).update(status=OrderInfo.ORDER_STATUS_ENUM['CANCELED'])
+        sku_counts = dict(OrderGoods.objects.filter(order_id__in=canceled_ids).order_by().values_list(
+            'sku_id').annotate(Sum('count')))
+        # 普通商品与订单状态在同一个事务中归还库存, 热点商品记录待归还, 事务提交后归还到redis
+        restore_stock(sku_counts)
+        # 已计入销售汇总的订单从汇总表中减去
+        subtract_canceled_orders(canceled_ids)
+
+    for user_id in set(canceled_orders.values()):
+        delete_user_orders_cache(user_id)
+
+    return canceled_ids
+
+
+def cancel_expired_orders():
+    """
+    分批取消自动取消队列中已到期的订单, 处理完一批后才移出队列, 任务中途崩溃时下次重新处理
+    取消前先向支付宝确认没有付款, 查询失败的订单推迟后重新处理
+    :return: 取消的订单数量
+    """
+    redis_conn = get_redis_connection('orders')
+    # 同一时间只允许一个任务处理
+    lock_token = acquire_lock(redis_conn, constants.ORDER_CANCEL_LOCK_KEY, constants.ORDER_CANCEL_LOCK_EXPIRES)
+    if lock_token is None:
+        return 0
+
+    count = 0
+    stop_time = time.time() + constants.ORDER_CANCEL_LOCK_EXPIRES / 2
+    try:
+        # 运行时间超过任务锁有效期的一半时停止, 剩余订单由下次任务处理
+        while time.time() < stop_time:
+            order_ids = redis_conn.zrangebyscore(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, '-inf', time.time(),
+                                                 start=0, num=constants.ORDER_CANCEL_BATCH_SIZE)
+            if not order_ids:
+                break
+            cancelable, retry = check_unpaid_orders([order_id.decode() for order_id in order_ids])
+            count += len(cancel_orders(cancelable))
+            pl = redis_conn.pipeline()
+            pl.zrem(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, *order_ids)
+            if retry:
+                retry_time = time.time() + constants.ORDER_CANCEL_RETRY_DELAY
+                pl.zadd(constants.ORDER_CANCEL_QUEUE_REDIS_KEY, {order_id: retry_time for order_id in retry})
+            pl.execute()
+    finally:
+        release_lock(redis_conn, constants.ORDER_CANCEL_LOCK_KEY, lock_token)
+
+    return count
+
+
+def dumps_order_cursor(order):
+    """
+    生成我的订单游标: 记录当前页最后一个订单的创建时间和订单编号
+    :param order: 当前页最后一个订单
+    :return: 游标字符串
+    """
+    return signing.dumps([order['create_time'].isoformat(), order['order_id']], salt='user_orders_cursor')
+
+
+def loads_order_cursor(cursor):
+    """
+    解析我的订单游标
+    :param cursor: 游标字符串
+    :return: (创建时间, 订单编号), 游标无效时返回None
+    """
+    try:
+        create_time, order_id = signing.loads(cursor, salt='user_orders_cursor')
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    create_time = parse_datetime(create_time)
+    if create_time is None:
+        return None
+    return create_time, order_id
+
+
+def get_user_orders(user_id, after=None, offset=0, limit=constants.ORDER_LIST_LIMIT):
+    """
+    查询用户的一页订单, 按创建时间和订单编号倒序
+    一条SQL查询订单, 一条SQL查询这些订单的所有订单商品
+    :param user_id: 用户id
+    :param after: 上一页最后一个订单的(创建时间, 订单编号), 传入时使用游标分页
+    :param offset: 不使用游标时跳过的订单数量
+    :param limit: 每页数量
+    :return: 订单字典列表, 每个订单的'lines'为 [(sku_id, 数量, 单价)]
+    """
+    order_qs = OrderInfo.objects.filter(user_id=user_id)
+    if after is not None:
+        create_time, order_id = after
+        # 先用创建时间做范围条件, 保证能走(user, create_time, order_id)联合索引的范围扫描
+        order_qs = order_qs.filter(create_time__lte=create_time).filter(
+            Q(create_time__lt=create_time) | Q(order_id__lt=order_id))
+    orders = list(order_qs.order_by('-create_time', '-order_id').values(
+        'order_id', 'create_time', 'total_amount', 'freight', 'pay_method', 'status')[offset:offset + limit])
+
+    order_dict = {}
+    for order in orders:
+        order['lines'] = []
+        order_dict[order['order_id']] = order
+    if order_dict:
+        lines = OrderGoods.objects.filter(order_id__in=order_dict.keys()).order_by('id').values_list(
+            'order_id', 'sku_id', 'count', 'price')
+        for order_id, sku_id, count, price in lines:
+            order_dict[order_id]['lines'].append((sku_id, count, price))
+    return orders
+
+
+def get_user_orders_first_page(user_id):
+    """
+    获取用户订单第一页和订单总数, 优先读取缓存
+    :param user_id: 用户id
+    :return: (第一页订单列表, 订单总数)
+    """
+    key = constants.USER_ORDERS_CACHE_KEY % user_id
+    data = cache.get(key)
+    if data is None:
+        data = (get_user_orders(user_id), OrderInfo.objects.filter(user_id=user_id).count())
+        cache.set(key, data, constants.USER_ORDERS_CACHE_EXPIRES)
+    return data
+
+
+def delete_user_orders_cache(user_id):
+    """
+    清除用户订单第一页缓存, 下单或订单状态变化后调用
+    :param user_id: 用户id
+    :return: None
+    """
+    cache.delete(constants.USER_ORDERS_CACHE_KEY % user_id)
@@ -1,18 +1,23 @@
 from django.shortcuts import render
-from django_redis import get_redis_connection
 from decimal import Decimal
-import json, logging
-from django.http import HttpResponseForbidden, JsonResponse
-from django.utils import timezone
-from django.db import transaction
+import json, math, logging
+from django.http import HttpResponseForbidden, HttpResponseNotFound, JsonResponse
+from django.conf import settings
 
 from meiduo_mall.utils.response_code import RETCODE
-from .models import OrderInfo, OrderGoods
-from goods.models import SKU
+from meiduo_mall.utils.order_id import generate_order_id
+from .models import OrderInfo
+from .utils import create_order, create_order_ticket, get_order_ticket, get_user_orders, \
+    get_user_orders_first_page, dumps_order_cursor, loads_order_cursor, dumps_checkout_snapshot, \
+    loads_checkout_snapshot, claim_order_submission, finish_order_submission, release_order_submission
+from . import constants
+from goods.utils import get_sku_cards
+from carts.stores import RedisCartStore
 from users.models import Address
+from celery_tasks.orders.tasks import commit_order
 from utils.views import LoginRequiredView
 
-logger = logging.error('django')
+logger = logging.getLogger('django')
 
 
 class OrderView(LoginRequiredView):
@@ -33,27 +38,26 @@ class OrderView(LoginRequiredView):
             # 如果地址为空，渲染模板时会判断，并跳转到地址编辑页面
             addresses = None
 
-        # 从Redis购物车中查询出被勾选的商品信息
-        redis_conn = get_redis_connection('carts')
-        redis_cart = redis_conn.hgetall('carts_%s' % user.id)
-        cart_selected = redis_conn.smembers('selected_%s' % user.id)
-        cart = {}
-        for sku_id in cart_selected:
-            cart[int(sku_id)] = int(redis_cart[sku_id])
+        # 从Redis购物车中查询出被勾选的商品信息 {sku_id: count} 及购物车版本号
+        cart, cart_version = RedisCartStore(user.id).get_selected_with_version()
 
         # 准备初始值
         total_count = 0
         total_amount = Decimal(0.00)
-        # 查询商品信息
-        skus = SKU.objects.filter(id__in=cart.keys())
+        # 从sku卡片缓存中查询商品信息
+        skus = list(get_sku_cards(cart.keys()).values())
         for sku in skus:
-            sku.count = cart[sku.id]
-            sku.amount = sku.count * sku.price
+            sku['count'] = cart[sku['id']]
+            sku['amount'] = sku['count'] * sku['price']
             # 计算总数量和总金额
-            total_count += sku.count
-            total_amount += sku.count * sku.price
+            total_count += sku['count']
+            total_amount += sku['amount']
         # 补充运费
-        freight = Decimal('10.00')
+        freight = Decimal(constants.ORDER_FREIGHT)
+
+        # 生成结算快照, 提交订单时按快照中的商品和价格下单
+        checkout_snapshot = dumps_checkout_snapshot(user.id, cart_version, skus,
+                                                    [address.id for address in addresses])
 
         # 渲染界面
         context = {
@@ -62,7 +66,8 @@ class OrderView(LoginRequiredView):
             'total_count': total_count,
             'total_amount': total_amount,
             'freight': freight,
-            'payment_amount': total_amount + freight
+            'payment_amount': total_amount + freight,
+            'checkout_snapshot': checkout_snapshot,
         }
 
         return render(request, 'place_order.html', context)
@@ -76,134 +81,73 @@ class OrderCommitView(LoginRequiredView):
         json_dict = json.loads(request.body.decode())
         address_id = json_dict.get('address_id')  # 收货地址id,
         pay_method = json_dict.get('pay_method')  # 用户选择的支付方式
+        snapshot = json_dict.get('checkout_snapshot')  # 结算页生成的结算快照
         user = request.user  # 获取当前登录用户对象
         # 校验
-        if all([address_id, pay_method]) is False:
+        if all([address_id, pay_method, snapshot]) is False:
             return HttpResponseForbidden('缺少必传参数')
 
+        checkout = loads_checkout_snapshot(user.id, snapshot)
+        if checkout is None:
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '结算信息已过期，请重新结算'})
+        # 收货地址在结算页中已经查询过, 只需要校验是否是快照中的地址
         try:
-            address = Address.objects.get(id=address_id, user=user)
-        except Address.DoesNotExist:
+            address_id = int(address_id)
+        except (TypeError, ValueError):
+            return HttpResponseForbidden('address_id有误')
+        if address_id not in checkout['address_ids']:
             return HttpResponseForbidden('address_id有误')
         if pay_method not in [OrderInfo.PAY_METHODS_ENUM['CASH'], OrderInfo.PAY_METHODS_ENUM['ALIPAY']]:
             # if pay_method not in OrderInfo.PAY_METHODS_ENUM.values():
             return HttpResponseForbidden('支付方式有误')
 
-        # 生成订单编号: 时间 + 用户id  20190627091620000000001
-        order_id = timezone.now().strftime('%Y%m%d%H%M%S') + '%09d' % user.id
-
-        # 根据支付方法判断订单状态
-        # status = '待支付' if '支付方式如果是 支付宝支付' else '待发货'
-        status = (OrderInfo.ORDER_STATUS_ENUM['UNPAID']
-                  if pay_method == OrderInfo.PAY_METHODS_ENUM['ALIPAY']
-                  else OrderInfo.ORDER_STATUS_ENUM['UNSEND'])
-
-        # 手动开启一个事务
-        with transaction.atomic():
-
-            # 创建事务保存点
-            save_point = transaction.savepoint()
-            try:
-                # 保存订单基本信息记录  OrderInfo记录（一）
-                order_model = OrderInfo.objects.create(
-                    order_id=order_id,
-                    user=user,
-                    address_id=address_id,
-                    total_count=0,
-                    total_amount=Decimal('0.00'),  # 用来存储金钱,尽量用Decimal,在Decimal里面的数据必须用字符串
-                    freight=Decimal('10.00'),
-                    pay_method=pay_method,
-                    status=status
-                )
-
-                # 创建redis连接对象
-                redis_conn = get_redis_connection('carts')
-                # 获取redis中hash和set集合的购物车数据
-                redis_carts = redis_conn.hgetall('carts_%s' % user.id)
-                selected_ids = redis_conn.smembers('selected_%s' % user.id)
-
-                # 将redis购物车数据过滤,只要那些勾选商品的sku_id和count
-                cart_dict = {}  # 包装要购买的商品 {sku_id: count}
-                for sku_id_bytes in selected_ids:
-                    cart_dict[int(sku_id_bytes)] = int(redis_carts[sku_id_bytes])
-                # 注意sku模型不能一次全部查询出来,会有缓存
-
-                # 遍历要购物车商品的字典,开始对每个sku进行判断库存
-                for sku_id in cart_dict:
-
-                    while True:
-                        # 获取到对应的sku模型
-                        sku = SKU.objects.get(id=sku_id)
-                        # 获取当前商品要购物车的数量
-                        buy_count = cart_dict[sku_id]
-
-                        # 获取当前sku原本的库存
-                        origin_stock = sku.stock
-                        # 获取当前sku原本的销量
-                        origin_sales = sku.sales
-                        # 没法避免脏读,但必须要解决脏写
-                        # import time
-                        # time.sleep(5)
-                        # 判断库存
-                        # 如果当前商品要购买的数量大于的它的库存,是不能下单
-                        if buy_count > origin_stock:
-                            # 库存不足事务中的操作进行回滚
-                            transaction.savepoint_rollback(save_point)
-
-                            return JsonResponse({'code': RETCODE.STOCKERR, 'errmsg': '库存不足'})
-
-                        # 计算sku的新库存和销量
-                        new_stock = origin_stock - buy_count
-                        new_sales = origin_sales + buy_count
-                        # 修改sku的库存和销量
-                        # sku.stock = new_stock
-                        # sku.sales = new_sales
-                        # sku.save()
-                        # 使用乐观锁来修改sku的库存和销量
-                        result = SKU.objects.filter(id=sku_id, stock=origin_stock).update(stock=new_stock,
-                                                                                          sales=new_sales)
-                        # 如果返回0说明修改失败,说明有抢夺
-                        if result == 0:
-                            continue
-
-                        # 修改spu的销量
-                        spu = sku.spu
-                        spu.sales += buy_count
-                        spu.save()
-
-                        # 保存订单中商品记录 OrderGoods记录 （多）
-                        OrderGoods.objects.create(
-                            order_id=order_id,
-                            sku=sku,
-                            count=buy_count,
-                            price=sku.price
-                        )
-
-                        # 修改订单中购买商品总数量和总价
-                        order_model.total_count += buy_count
-                        order_model.total_amount += (sku.price * buy_count)
-
-                        break  # 本商品下单成功后结束死循环
-                    # 累加运费一定要放在for的外面,只算一次运费
-                order_model.total_amount += order_model.freight
-                order_model.save()
-            except Exception as e:
-                logger.error(e)
-                # 暴力回滚
-                transaction.savepoint_rollback(save_point)
-                # 此处必须要提前响应
-                return JsonResponse({'code': RETCODE.STOCKERR, 'errmsg': '下单失败'})
-            else:
-                # 提交事务
-                transaction.savepoint_commit(save_point)
+        lines = checkout['lines']  # 要购买的商品 {sku_id: (数量, 单价, 分类id)}
+        if not lines:
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '没有勾选的商品'})
+
+        # 同一结算快照重复提交时直接返回第一次提交的结果, 第一次提交还没有完成时等待
+        idempotency_key = checkout['idempotency_key']
+        claimed, result = claim_order_submission(user.id, idempotency_key)
+        if not claimed:
+            if result is None:
+                return JsonResponse({'code': RETCODE.THROTTLINGERR, 'errmsg': '订单正在提交中，请稍后'})
+            return JsonResponse(dict(result, code=RETCODE.OK))
+
+        # 结算后修改过购物车时快照失效, 只需要读取购物车版本号
+        cart_store = RedisCartStore(user.id)
+        if cart_store.get_version() != checkout['cart_version']:
+            release_order_submission(user.id, idempotency_key)
+            return JsonResponse({'code': RETCODE.PARAMERR, 'errmsg': '购物车已变化，请重新结算'})
+
+        # 生成订单编号: 时间 + 节点 + 序号  2019062709162012300001002
+        order_id = generate_order_id()
+
+        if settings.ORDER_COMMIT_ASYNC_ENABLED:
+            # 异步下单: 加入下单队列后立即返回下单凭证, 前端凭凭证查询下单结果
+            ticket, created = create_order_ticket(user.id)
+            if created:
+                commit_order.delay(ticket, user.id, address_id, pay_method, order_id,
+                                   [[sku_id, count, str(price), category_id]
+                                    for sku_id, (count, price, category_id) in lines.items()])
+            result = finish_order_submission(user.id, idempotency_key, errmsg='订单排队中', ticket=ticket)
+            return JsonResponse(dict(result, code=RETCODE.OK))
 
+        try:
+            order_model = create_order(order_id, user, address_id, pay_method, lines)
+        except Exception as e:
+            logger.error(e)
+            release_order_submission(user.id, idempotency_key)
+            return JsonResponse({'code': RETCODE.STOCKERR, 'errmsg': '下单失败'})
+        if order_model is None:
+            release_order_submission(user.id, idempotency_key)
+            return JsonResponse({'code': RETCODE.STOCKERR, 'errmsg': '库存不足'})
+
+        # 记录提交结果, 之后的重复提交直接返回订单编号
+        result = finish_order_submission(user.id, idempotency_key, errmsg='下单成功', order_id=order_id)
         # 删除购物车中已经购买过的商品
-        pl = redis_conn.pipeline()
-        pl.hdel('carts_%s' % user.id, *selected_ids)
-        pl.delete('selected_%s' % user.id)
-        pl.execute()
+        cart_store.remove(*lines.keys())
         # 响应订单编号
-        return JsonResponse({'code': RETCODE.OK, 'errmsg': '下单成功', 'order_id': order_id})
+        return JsonResponse(dict(result, code=RETCODE.OK))
 
 
 class OrderSuccessView(LoginRequiredView):
@@ -231,3 +175,83 @@ class OrderSuccessView(LoginRequiredView):
         }
 
         return render(request, 'order_success.html', context)
+
+
+class OrderCommitStatusView(LoginRequiredView):
+    """查询异步下单结果"""
+
+    def get(self, request):
+        ticket = request.GET.get('ticket')
+        ticket_data = get_order_ticket(ticket) if ticket else None
+        if ticket_data is None or ticket_data['user_id'] != request.user.id:
+            return JsonResponse({'code': RETCODE.NODATAERR, 'errmsg': '下单凭证不存在或已过期'})
+
+        return JsonResponse({
+            'code': RETCODE.OK,
+            'errmsg': ticket_data.get('errmsg', 'OK'),
+            'status': ticket_data['status'],
+            'order_id': ticket_data.get('order_id'),
+        })
+
+
+class UserOrderInfoView(LoginRequiredView):
+    """我的订单"""
+
+    def get(self, request, page_num):
+        """
+        展示用户订单列表
+        :param request:
+        :param page_num: 页码
+        :return:
+        """
+        user = request.user
+        page_num = int(page_num)
+        # 第一页和订单总数从缓存中读取
+        first_page, order_count = get_user_orders_first_page(user.id)
+        total_page = max(1, math.ceil(order_count / constants.ORDER_LIST_LIMIT))
+
+        cursor = request.GET.get('cursor')
+        if page_num == 1:
+            page_orders = first_page
+        elif cursor:
+            # 游标分页: 从上一页最后一个订单之后开始查询,不需要OFFSET
+            after = loads_order_cursor(cursor)
+            if after is None:
+                return HttpResponseForbidden('参数cursor有误')
+            page_orders = get_user_orders(user.id, after=after)
+        else:
+            page_orders = get_user_orders(user.id, offset=(page_num - 1) * constants.ORDER_LIST_LIMIT)
+        if page_num > total_page or (page_num > 1 and not page_orders):
+            return HttpResponseNotFound('empty page')
+
+        # 一次读取当前页所有订单商品的sku卡片
+        sku_cards = get_sku_cards({sku_id for order in page_orders for sku_id, _, _ in order['lines']})
+        pay_method_names = dict(OrderInfo.PAY_METHOD_CHOICES)
+        status_names = dict(OrderInfo.ORDER_STATUS_CHOICES)
+        orders = []
+        for order in page_orders:
+            sku_list = []
+            for sku_id, count, price in order['lines']:
+                card = sku_cards.get(sku_id, {})
+                # 单价使用下单时的价格
+                sku_list.append({
+                    'name': card.get('name', ''),
+                    'default_image_url': card.get('default_image_url', ''),
+                    'price': price,
+                    'count': count,
+                    'amount': price * count,
+                })
+            orders.append(dict(order, sku_list=sku_list,
+                               pay_method_name=pay_method_names[order['pay_method']],
+                               status_name=status_names[order['status']]))
+
+        # 下一页的游标,顺序翻页时使用游标分页
+        next_cursor = dumps_order_cursor(page_orders[-1]) if page_orders else ''
+
+        context = {
+            'page_orders': orders,
+            'page_num': page_num,
+            'total_page': total_page,
+            'next_cursor': next_cursor,
+        }
+        return render(request, 'user_center_order.html', context)
@@ -0,0 +1,51 @@
+import os
+from alipay import AliPay
+from django.conf import settings
+
+# 支付宝交易状态
+ALIPAY_TRADE_PAID = ('TRADE_SUCCESS', 'TRADE_FINISHED')  # 已付款
+ALIPAY_TRADE_WAITING = 'WAIT_BUYER_PAY'  # 等待买家付款
+ALIPAY_TRADE_CLOSED = 'TRADE_CLOSED'  # 超时关闭或已全额退款
+
+
+def get_alipay():
+    """
+    创建AliPay支付宝对象
+    :return: AliPay对象
+    """
+    keys_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys')
+    return AliPay(
+        appid=settings.ALIPAY_APPID,  # 应用的id
+        app_notify_url=None,  # 默认回调url
+        app_private_key_path=os.path.join(keys_dir, 'app_private_key.pem'),
+        # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
+        alipay_public_key_path=os.path.join(keys_dir, 'alipay_public_key.pem'),
+        sign_type="RSA2",  # 加密方式一定要和支付宝上设置的一致
+        debug=settings.ALIPAY_DEBUG  # 如果是沙箱环境就设置为True,真实环境就设置False
+    )
+
+
+def query_alipay_trade(order_id):
+    """
+    向支付宝查询订单的交易状态
+    :param order_id: 订单编号
+    :return: (交易状态, 支付宝交易号), 交易不存在(买家没有打开过付款页面)时返回 (None, None)
+    :raise: 网络错误或支付宝返回其他错误时抛出异常, 由调用方稍后重试
+    """
+    result = get_alipay().api_alipay_trade_query(out_trade_no=order_id)
+    if result.get('code') == '10000':
+        return result.get('trade_status'), result.get('trade_no')
+    if result.get('sub_code') == 'ACQ.TRADE_NOT_EXIST':
+        return None, None
+    raise RuntimeError('查询支付宝交易%s失败: %s' % (order_id, result))
+
+
+def refund_alipay_trade(order_id, amount):
+    """
+    全额退款
+    :param order_id: 订单编号
+    :param amount: 退款金额
+    :return: 是否退款成功
+    """
+    result = get_alipay().api_alipay_trade_refund(out_trade_no=order_id, refund_amount=str(amount))
+    return result.get('code') == '10000'
@@ -1,14 +1,19 @@
 from django.shortcuts import render
-from alipay import AliPay
 from django import http
 from django.conf import settings
-import os
+import pytz, logging
+from datetime import timedelta
 from django.views import View
+from django.utils import timezone
 
 from utils.views import LoginRequiredView
 from orders.models import OrderInfo
+from orders.utils import mark_order_paid
+from orders.constants import ORDER_UNPAID_EXPIRES
 from meiduo_mall.utils.response_code import RETCODE
-from .models import Payment
+from .utils import get_alipay, refund_alipay_trade
+
+logger = logging.getLogger('django')
 
 
 class PaymentView(LoginRequiredView):
@@ -29,25 +34,18 @@ class PaymentView(LoginRequiredView):
         # ALIPAY_URL = 'https://openapi.alipaydev.com/gateway.do'
         # ALIPAY_RETURN_URL = 'http://www.meiduo.site:8000/payment/status/'
         # 创建AliPay支付宝对象
-        alipay = AliPay(
-            appid=settings.ALIPAY_APPID,  # 应用的id
-            app_notify_url=None,  # 默认回调url
-            # /User/chao/Desktop/mei_27/mei/mei/apps/payment/keys/appxxx
-            app_private_key_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys/app_private_key.pem'),
-            # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
-            alipay_public_key_path=os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                                'keys/alipay_public_key.pem'),
-            sign_type="RSA2",  # 加密方式一定要和支付宝上设置的一致
-            debug=settings.ALIPAY_DEBUG  # 如果是沙箱环境就设置为True,真实环境就设置False
-        )
+        alipay = get_alipay()
 
         # 调用它里面api_alipay_trade_page_pay方法得到登录链接后面的查询参数部分
         # 手机网站支付，需要跳转到https://openapi.alipay.com/gateway.do? + order_string
+        # 支付截止时间早于订单自动取消时间(还有一段宽限期), 避免订单取消后仍能付款, 支付宝使用北京时间精确到分钟
+        time_expire = order.create_time + timedelta(seconds=ORDER_UNPAID_EXPIRES)
         order_string = alipay.api_alipay_trade_page_pay(
             out_trade_no=order_id,  # 要支付的订单编号
             total_amount=str(order.total_amount),  # 不能直接用Decimal类型需要转成字符串
             subject='美多商城:%s' % order_id,
             return_url=settings.ALIPAY_RETURN_URL,
+            time_expire=timezone.localtime(time_expire, pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d %H:%M'),
         )
 
         # 拼接好支付宝登录url
@@ -70,17 +68,7 @@ class PaymentStatusView(View):
         sign = data.pop('sign')
 
         # 创建alipay支付宝对象
-        alipay = AliPay(
-            appid=settings.ALIPAY_APPID,  # 应用的id
-            app_notify_url=None,  # 默认回调url
-            # /User/chao/Desktop/mei_27/mei/mei/apps/payment/keys/appxxx
-            app_private_key_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keys/app_private_key.pem'),
-            # 支付宝的公钥，验证支付宝回传消息使用，不是你自己的公钥,
-            alipay_public_key_path=os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                                'keys/alipay_public_key.pem'),
-            sign_type="RSA2",  # 加密方式一定要和支付宝上设置的一致
-            debug=settings.ALIPAY_DEBUG  # 如果是沙箱环境就设置为True,真实环境就设置False
-        )
+        alipay = get_alipay()
 
         # 调用verify方法进行对支付结果验证
         success = alipay.verify(data, sign)
@@ -89,17 +77,16 @@ class PaymentStatusView(View):
             trade_id = data.get('trade_no')
             # 获取美多订单编号
             order_id = data.get('out_trade_no')
-            try:
-                Payment.objects.get(trade_id=trade_id, order_id=order_id)
-            except Payment.DoesNotExist:
-                # 保存支付宝交易号及订单编号
-                Payment.objects.create(
-                    trade_id=trade_id,
-                    order_id=order_id
-                )
-            # 修改订单状态
-            OrderInfo.objects.filter(order_id=order_id, status=OrderInfo.ORDER_STATUS_ENUM['UNPAID']).update(
-                status=OrderInfo.ORDER_STATUS_ENUM['UNCOMMENT'])
+            # 保存支付宝交易号并修改订单状态
+            order = mark_order_paid(order_id, trade_id)
+            if order is None:
+                return http.HttpResponseForbidden('订单有误')
+            if order.status == OrderInfo.ORDER_STATUS_ENUM['CANCELED']:
+                # 付款时订单已经超时取消, 库存已经归还, 原路退款
+                if refund_alipay_trade(order_id, order.total_amount):
+                    return http.HttpResponse('订单已超时取消, 支付款项已原路退回')
+                logger.error('已取消的订单%s退款失败, 支付宝交易号%s' % (order_id, trade_id))
+                return http.HttpResponse('订单已超时取消, 退款正在处理中, 请联系客服')
             # 响应
             return render(request, 'pay_success.html', {'trade_id': trade_id})
         else:
@@ -10,6 +10,7 @@ from django.conf import settings
 
 from .models import User, Address
 from goods.models import SKU
+from goods.utils import get_sku_cards
 from utils import constants
 from carts.utils import merge_cart_cookie_to_redis
 from utils.views import LoginRequiredView
@@ -615,16 +616,18 @@ class UserBrowseHistory(LoginRequiredView):
         # lrange获取当前用户在redis中存储的浏览记录sku_id
         sku_ids = redis_conn.lrange('history_%s' % request.user.id, 0, -1)
 
-        # 根据sku_ids列表数据，查询出商品sku信息
+        # 根据sku_ids列表数据，从sku卡片缓存中批量查询出商品sku信息
+        sku_cards = get_sku_cards(sku_ids)
         skus = []  # 用来装每一个sku的字典
-        # 通过sku_id查询出对应的sku模型
         for sku_id in sku_ids:
-            sku = SKU.objects.get(id=sku_id)
+            sku = sku_cards.get(int(sku_id))
+            if sku is None:
+                continue
             skus.append({
-                'id': sku.id,
-                'name': sku.name,
-                'default_image_url': sku.default_image.url,
-                'price': sku.price
+                'id': sku['id'],
+                'name': sku['name'],
+                'default_image_url': sku['default_image_url'],
+                'price': sku['price']
             })
 
         # 响应：把sku模型转换成字典, 再添加到列表中,一定要注意它的顺序
@@ -42,8 +42,10 @@ INSTALLED_APPS = [
     # 注册应用
     'users.apps.UsersConfig',  # 用户模块
     'oauth.apps.OauthConfig',  # QQ模块
+    'contents.apps.ContentsConfig',  # 首页广告模块
     'areas.apps.AreasConfig',  # 省市区模块
     'goods.apps.GoodsConfig',  # 商品模块
+    'carts.apps.CartsConfig',  # 购物车模块
     'orders.apps.OrdersConfig',  # 订单模块
     'payment.apps.PaymentConfig',  # 支付模块
 
@@ -172,6 +174,27 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     },
+    "goods": {  # 商品销量排行等统计数据
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/5",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    "inventory": {  # 热点商品库存和库存预占
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/6",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
+    "orders": {  # 异步下单凭证
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/8",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
 
 }
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"  # 修改session存储机制使用Redis保存
@@ -253,6 +276,23 @@ DEFAULT_FILE_STORAGE = 'meiduo_mall.utils.fastdfs.fdfs_storage.FastDFSStorage'
 # FDFS_BASE_URL = 'http://192.168.88.129:8888/'
 FDFS_BASE_URL = 'http://image.meiduo.site:8888/'
 
+# 静态化页面的生成目录
+GENERATED_STATIC_HTML_FILES_DIR = os.path.join(os.path.dirname(BASE_DIR), 'static_html')
+# 是否优先返回定时生成的静态首页
+STATIC_INDEX_HTML_ENABLED = True
+
+# 未登录用户的购物车是否保存在redis中(cookie中只保存签名的访客标识), 关闭时保存在cookie中
+CARTS_ANONYMOUS_REDIS_ENABLED = False
+
+# 是否异步下单: 请求只校验参数并把下单任务加入orders队列, 前端凭下单凭证查询结果
+ORDER_COMMIT_ASYNC_ENABLED = False
+
+# 订单编号生成器, 节点号(0~99)在每台机器上配置为不同的值
+ORDER_ID_GENERATOR = 'meiduo_mall.utils.order_id.SnowflakeOrderIdGenerator'
+ORDER_ID_NODE = 0
+# 同一台机器上的进程通过该目录下的文件锁分配订单编号进程号
+ORDER_ID_WORKER_LOCK_DIR = '/tmp/meiduo_order_id'
+
 # Haystack
 HAYSTACK_CONNECTIONS = {
     'default': {
@@ -262,8 +302,16 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
-# 当添加、修改、删除数据时，自动生成索引
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 不能连接Elasticsearch的环境(测试、压测、边缘节点)可以改用进程内的本地搜索引擎
+# HAYSTACK_CONNECTIONS = {
+#     'default': {
+#         'ENGINE': 'meiduo_mall.utils.local_search.backend.LocalSearchEngine',
+#         'PATH': os.path.join(os.path.dirname(BASE_DIR), 'search_index'),  # 本地索引文件目录
+#     },
+# }
+
+# 当添加、修改、删除数据时，记录到队列中由定时任务批量更新索引
+HAYSTACK_SIGNAL_PROCESSOR = 'goods.search_signals.SKUQueuedSignalProcessor'
 
 # 支付宝
 ALIPAY_APPID = '2016091900551154'
@@ -31,7 +31,8 @@ var vm = new Vue({
                 var url = this.host + '/orders/commit/';
                 axios.post(url, {
                         address_id: this.nowsite,
-                        pay_method: this.pay_method
+                        pay_method: this.pay_method,
+                        checkout_snapshot: checkout_snapshot
                     }, {
                         headers:{
                             'X-CSRFToken':getCookie('csrftoken')
@@ -39,10 +40,11 @@ var vm = new Vue({
                         responseType: 'json'
                     })
                     .then(response => {
-                        if (response.data.code == '0') {
-                            location.href = '/orders/success/?order_id='+response.data.order_id
-                                        +'&payment_amount='+this.payment_amount
-                                        +'&pay_method='+this.pay_method;
+                        if (response.data.code == '0' && response.data.ticket) {
+                            // 异步下单,轮询下单结果
+                            this.poll_order_status(response.data.ticket);
+                        } else if (response.data.code == '0') {
+                            this.on_order_success(response.data.order_id);
                         } else if (response.data.code == '4101') {
                             location.href = '/login/?next=/orders/settlement/';
                         } else {
@@ -54,6 +56,38 @@ var vm = new Vue({
                         console.log(error.response);
                     })
             }
+        },
+        // 下单成功
+        on_order_success(order_id){
+            location.href = '/orders/success/?order_id='+order_id
+                        +'&payment_amount='+this.payment_amount
+                        +'&pay_method='+this.pay_method;
+        },
+        // 查询异步下单结果
+        poll_order_status(ticket){
+            var url = this.host + '/orders/commit/status/?ticket=' + ticket;
+            axios.get(url, {
+                    responseType: 'json'
+                })
+                .then(response => {
+                    if (response.data.code != '0') {
+                        this.order_submitting = false;
+                        alert(response.data.errmsg);
+                    } else if (response.data.status == 'succeeded') {
+                        this.on_order_success(response.data.order_id);
+                    } else if (response.data.status == 'failed') {
+                        this.order_submitting = false;
+                        alert(response.data.errmsg);
+                    } else {
+                        setTimeout(() => {
+                            this.poll_order_status(ticket);
+                        }, 500);
+                    }
+                })
+                .catch(error => {
+                    this.order_submitting = false;
+                    console.log(error.response);
+                })
         }
     }
 });
@@ -0,0 +1,93 @@
+from django.core.exceptions import ImproperlyConfigured
+from haystack import connections
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, SearchNode, log_query
+from haystack.inputs import PythonData
+from haystack.models import SearchResult
+from haystack.utils import get_identifier
+
+from .index import LocalSearchIndex
+
+
+class LocalSearchBackend(BaseSearchBackend):
+    """
+    进程内本地搜索后端, 不依赖Elasticsearch
+    索引保存在PATH目录下的内存映射文件中, 一个PATH只能保存一个模型的索引
+    """
+
+    def __init__(self, connection_alias, **connection_options):
+        super(LocalSearchBackend, self).__init__(connection_alias, **connection_options)
+
+        if 'PATH' not in connection_options:
+            raise ImproperlyConfigured("You must specify a 'PATH' in your settings for connection '%s'."
+                                       % connection_alias)
+
+        self.index = LocalSearchIndex(connection_options['PATH'])
+
+    def get_model(self):
+        """返回建立索引的模型类"""
+        models = connections[self.connection_alias].get_unified_index().get_indexed_models()
+        if len(models) != 1:
+            raise ImproperlyConfigured("LocalSearchBackend only supports one indexed model for connection '%s'."
+                                       % self.connection_alias)
+        return models[0]
+
+    def update(self, index, iterable, commit=True):
+        documents = {}
+        for obj in iterable:
+            prepared = index.full_prepare(obj)
+            documents[obj.pk] = prepared[index.get_content_field()]
+
+        if documents:
+            self.index.update(documents)
+
+    def remove(self, obj_or_string, commit=True):
+        # 'goods.sku.1' -> 1
+        pk = get_identifier(obj_or_string).rsplit('.', 1)[1]
+        self.index.remove([int(pk)])
+
+    def clear(self, models=None, commit=True):
+        self.index.clear()
+
+    @log_query
+    def search(self, query_string, start_offset=0, end_offset=None, result_class=None, **kwargs):
+        if not query_string or query_string == '*':
+            return {'results': [], 'hits': 0}
+
+        hits, ranked = self.index.search(query_string, start_offset, end_offset)
+
+        model = self.get_model()
+        result_class = result_class or SearchResult
+        results = [result_class(model._meta.app_label, model._meta.model_name, pk, score) for pk, score in ranked]
+
+        return {'results': results, 'hits': hits}
+
+
+class LocalSearchQuery(BaseSearchQuery):
+    """把查询条件拼接为查询文本, 由本地索引分词后查询"""
+
+    def build_query(self):
+        if not self.query_filter:
+            return '*'
+
+        return self._build_sub_query(self.query_filter)
+
+    def _build_sub_query(self, search_node):
+        term_list = []
+
+        for child in search_node.children:
+            if isinstance(child, SearchNode):
+                term_list.append(self._build_sub_query(child))
+            else:
+                value = child[1]
+
+                if not hasattr(value, 'input_type_name'):
+                    value = PythonData(value)
+
+                term_list.append(value.prepare(self))
+
+        return ' '.join(map(str, term_list))
+
+
+class LocalSearchEngine(BaseEngine):
+    backend = LocalSearchBackend
+    query = LocalSearchQuery
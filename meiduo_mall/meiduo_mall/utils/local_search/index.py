@@ -0,0 +1,322 @@
+import os
+import json
+import math
+import mmap
+import fcntl
+import struct
+import bisect
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+
+from .tokenizer import tokenize, tokenize_query
+
+# 索引段文件头: 魔数, 版本, 文档数, 词数, 文档总词数
+HEADER = struct.Struct('=4sIIIQ')
+MAGIC = b'MDSI'
+VERSION = 1
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 增量文档数超过 max(最小值, 索引段文档数 * 比例) 时合并为新的索引段
+MERGE_MIN_DOCUMENTS = 1000
+MERGE_RATIO = 0.1
+
+
+def write_segment(path, documents):
+    """
+    将文档写入不可变的索引段文件
+    文件结构: 文件头, 文档pk(int64), 文档长度, 词偏移, 倒排表偏移, 倒排表文档序号, 倒排表词频, 词(utf-8)
+    :param path: 索引段文件路径
+    :param documents: {pk: Counter(词频)}
+    :return: None
+    """
+    pks = sorted(documents)
+    doc_pks = array('q', pks)
+    doc_lens = array('I', (sum(documents[pk].values()) for pk in pks))
+
+    # 构造倒排表 {词: [(文档序号, 词频)]}
+    postings = {}
+    for doc_index, pk in enumerate(pks):
+        for term, tf in documents[pk].items():
+            postings.setdefault(term.encode('utf-8'), []).append((doc_index, tf))
+
+    terms = sorted(postings)
+    term_offsets = array('I', [0])
+    posting_offsets = array('I', [0])
+    posting_docs = array('I')
+    posting_tfs = array('I')
+    term_blob = bytearray()
+    for term in terms:
+        term_blob += term
+        term_offsets.append(len(term_blob))
+        for doc_index, tf in postings[term]:
+            posting_docs.append(doc_index)
+            posting_tfs.append(tf)
+        posting_offsets.append(len(posting_docs))
+
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(pks), len(terms), sum(doc_lens)))
+        for part in (doc_pks, doc_lens, term_offsets, posting_offsets, posting_docs, posting_tfs):
+            f.write(part.tobytes())
+        f.write(term_blob)
+    os.replace(temp_path, path)
+
+
+class Segment(object):
+    """内存映射的只读索引段"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.doc_count, self.term_count, self.total_length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('无效的索引段文件: %s' % path)
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+
+        def take(typecode, count):
+            nonlocal offset
+            size = array(typecode).itemsize * count
+            part = view[offset:offset + size].cast(typecode)
+            offset += size
+            return part
+
+        self.doc_pks = take('q', self.doc_count)
+        self.doc_lens = take('I', self.doc_count)
+        self.term_offsets = take('I', self.term_count + 1)
+        self.posting_offsets = take('I', self.term_count + 1)
+        posting_count = self.posting_offsets[self.term_count]
+        self.posting_docs = take('I', posting_count)
+        self.posting_tfs = take('I', posting_count)
+        self.term_blob = view[offset:]
+
+    def _term(self, term_index):
+        return bytes(self.term_blob[self.term_offsets[term_index]:self.term_offsets[term_index + 1]])
+
+    def doc_index(self, pk):
+        """返回pk对应的文档序号, 不存在时返回None"""
+        index = bisect.bisect_left(self.doc_pks, pk)
+        if index < self.doc_count and self.doc_pks[index] == pk:
+            return index
+        return None
+
+    def postings(self, term):
+        """
+        二分查找词的倒排表
+        :param term: 词
+        :return: [(文档序号, 词频)]
+        """
+        key = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.term_count or self._term(low) != key:
+            return []
+        start, end = self.posting_offsets[low], self.posting_offsets[low + 1]
+        return zip(self.posting_docs[start:end], self.posting_tfs[start:end])
+
+    def documents(self):
+        """
+        从倒排表还原所有文档的词频, 合并索引段时使用
+        :return: {pk: Counter(词频)}
+        """
+        documents = {pk: Counter() for pk in self.doc_pks}
+        for term_index in range(self.term_count):
+            term = self._term(term_index).decode('utf-8')
+            start, end = self.posting_offsets[term_index], self.posting_offsets[term_index + 1]
+            for doc_index, tf in zip(self.posting_docs[start:end], self.posting_tfs[start:end]):
+                documents[self.doc_pks[doc_index]][term] = tf
+        return documents
+
+
+class LocalSearchIndex(object):
+    """
+    本地倒排索引
+    数据由一个内存映射的索引段和一份增量文档组成: 更新和删除先写入增量文档,
+    增量文档达到一定数量后与索引段合并生成新的索引段。
+    目录结构: CURRENT(当前索引段文件名), segment-<代数>.idx, pending.json(增量文档), LOCK(写锁)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._state = None  # 已加载的 (索引段文件名, 增量文档修改时间)
+        self._segment = None
+        self._pending = {}
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _write_lock(self):
+        """进程间写锁, 同一时间只允许一个进程修改索引"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file('LOCK'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_file(self, name, text):
+        temp_path = '%s.%s.tmp' % (self._file(name), os.getpid())
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, self._file(name))
+
+    def _read_segment_name(self):
+        try:
+            with open(self._file('CURRENT'), encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _read_pending(self):
+        """
+        读取增量文档
+        :return: {pk: Counter(词频)或None(已删除)}
+        """
+        try:
+            with open(self._file('pending.json'), encoding='utf-8') as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {int(pk): None if terms is None else Counter(terms) for pk, terms in pending.items()}
+
+    def _write_pending(self, pending):
+        self._write_file('pending.json', json.dumps(
+            {pk: None if terms is None else dict(terms) for pk, terms in pending.items()}, ensure_ascii=False))
+
+    def _load(self):
+        """索引段或增量文档变化时重新加载"""
+        segment_name = self._read_segment_name()
+        try:
+            pending_mtime = os.stat(self._file('pending.json')).st_mtime_ns
+        except FileNotFoundError:
+            pending_mtime = None
+
+        state = (segment_name, pending_mtime)
+        if state == self._state:
+            return
+
+        self._segment = Segment(self._file(segment_name)) if segment_name else None
+        self._pending = self._read_pending()
+        self._state = state
+
+    def _create_segment(self, documents):
+        """生成新一代索引段并切换, 保留上一代索引段给仍在读取的进程使用"""
+        segment_name = self._read_segment_name()
+        generation = int(segment_name.split('-')[1].split('.')[0]) + 1 if segment_name else 1
+        new_segment_name = 'segment-%d.idx' % generation
+        write_segment(self._file(new_segment_name), documents)
+
+        # 先切换索引段再清空增量文档, 读取方不会看到数据缺失的中间状态
+        self._write_file('CURRENT', new_segment_name)
+        self._write_pending({})
+
+        for name in os.listdir(self.path):
+            if name.startswith('segment-') and name.endswith('.idx') and name not in (new_segment_name, segment_name):
+                os.remove(self._file(name))
+
+    def _apply(self, changes):
+        """写入增量文档, 达到合并条件时合并为新的索引段"""
+        with self._write_lock():
+            self._state = None
+            self._load()
+            pending = self._pending
+            pending.update(changes)
+
+            segment_doc_count = self._segment.doc_count if self._segment else 0
+            if len(pending) < max(MERGE_MIN_DOCUMENTS, segment_doc_count * MERGE_RATIO):
+                self._write_pending(pending)
+                return
+
+            documents = self._segment.documents() if self._segment else {}
+            for pk, terms in pending.items():
+                if terms is None:
+                    documents.pop(pk, None)
+                else:
+                    documents[pk] = terms
+            self._create_segment(documents)
+
+    def update(self, documents):
+        """
+        新增或更新文档
+        :param documents: {pk: 文本}
+        :return: None
+        """
+        self._apply({pk: Counter(tokenize(text)) for pk, text in documents.items()})
+
+    def remove(self, pks):
+        """
+        删除文档
+        :param pks: pk列表
+        :return: None
+        """
+        self._apply({pk: None for pk in pks})
+
+    def clear(self):
+        """清空索引"""
+        with self._write_lock():
+            self._create_segment({})
+            self._state = None
+
+    def search(self, query, start_offset=0, end_offset=None):
+        """
+        BM25排序查询
+        :param query: 查询文本
+        :param start_offset: 分页起始位置
+        :param end_offset: 分页结束位置
+        :return: (命中总数, [(pk, 得分)])
+        """
+        self._load()
+        segment, pending = self._segment, self._pending
+
+        # 增量文档中出现的pk覆盖索引段中的同一文档
+        overridden = set()
+        doc_count = 0
+        total_length = 0
+        if segment:
+            for pk in pending:
+                doc_index = segment.doc_index(pk)
+                if doc_index is not None:
+                    overridden.add(doc_index)
+                    total_length -= segment.doc_lens[doc_index]
+            doc_count += segment.doc_count - len(overridden)
+            total_length += segment.total_length
+        pending_lens = {pk: sum(terms.values()) for pk, terms in pending.items() if terms is not None}
+        doc_count += len(pending_lens)
+        total_length += sum(pending_lens.values())
+        if not doc_count:
+            return 0, []
+        avg_length = total_length / doc_count
+
+        scores = Counter()
+        for term in tokenize_query(query):
+            # [(pk, 词频, 文档长度)]
+            matches = []
+            if segment:
+                for doc_index, tf in segment.postings(term):
+                    if doc_index not in overridden:
+                        matches.append((segment.doc_pks[doc_index], tf, segment.doc_lens[doc_index]))
+            for pk, length in pending_lens.items():
+                tf = pending[pk][term]
+                if tf:
+                    matches.append((pk, tf, length))
+
+            idf = math.log(1 + (doc_count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for pk, tf, length in matches:
+                scores[pk] += idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(ranked), ranked[start_offset:end_offset]
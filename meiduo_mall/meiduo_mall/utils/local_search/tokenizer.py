@@ -0,0 +1,43 @@
+import re
+import unicodedata
+
+# 连续的英文字母、连续的数字或连续的中文
+TOKEN_RE = re.compile(r'[a-z]+|[0-9]+|[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+
+def _is_chinese(run):
+    """判断TOKEN_RE匹配到的是否为中文"""
+    return run[0] >= '\u3400'
+
+
+def tokenize(text):
+    """
+    索引分词: 英文单词和数字分别切分, 中文同时切分为单字和相邻二字词
+    '华为手机Mate20' -> ['华', '为', '手', '机', '华为', '为手', '手机', 'mate', '20']
+    :param text: 文本
+    :return: 词列表
+    """
+    tokens = []
+    # NFKC将全角字母数字转换为半角
+    for run in TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if _is_chinese(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def tokenize_query(text):
+    """
+    查询分词: 中文只切分为相邻二字词(单个汉字时保留单字), 结果去重并保持顺序
+    :param text: 查询文本
+    :return: 词列表
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if _is_chinese(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return list(dict.fromkeys(tokens))
@@ -0,0 +1,96 @@
+import os
+import time
+import fcntl
+import threading
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class SnowflakeOrderIdGenerator(object):
+    """
+    时间 + 节点 + 序号 的订单编号生成器, 不需要访问数据库
+    格式: UTC年月日时分秒(14位) + 毫秒(3位) + 节点号(2位) + 进程号(3位) + 序号(3位), 共25位,
+    按字符串排序即按生成时间排序。
+    节点号在配置中为每台机器指定, 同一台机器上的进程通过文件锁分配不重复的进程号。
+    """
+    NODE_LIMIT = 100
+    WORKER_LIMIT = 1000
+    SEQUENCE_LIMIT = 1000
+
+    def __init__(self, node=None, lock_dir=None):
+        """
+        :param node: 节点号, 默认使用配置项ORDER_ID_NODE
+        :param lock_dir: 进程号文件锁目录, 默认使用配置项ORDER_ID_WORKER_LOCK_DIR
+        """
+        self.node = settings.ORDER_ID_NODE if node is None else node
+        if not 0 <= self.node < self.NODE_LIMIT:
+            raise ImproperlyConfigured('ORDER_ID_NODE must be between 0 and %d.' % (self.NODE_LIMIT - 1))
+        self.lock_dir = lock_dir or settings.ORDER_ID_WORKER_LOCK_DIR
+
+        self._lock = threading.Lock()
+        self._pid = None  # 分配进程号时的进程id, fork出的子进程需要重新分配
+        self._worker = None
+        self._worker_file = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _acquire_worker(self):
+        """为当前进程分配进程号, 持有对应的文件锁直到进程退出"""
+        if self._worker_file is not None:
+            # 从父进程继承的文件, 关闭后父进程仍持有锁
+            self._worker_file.close()
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for worker in range(self.WORKER_LIMIT):
+            f = open(os.path.join(self.lock_dir, 'worker-%03d.lock' % worker), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            self._pid = os.getpid()
+            self._worker = worker
+            self._worker_file = f
+            return
+        raise RuntimeError('没有可用的订单编号进程号')
+
+    def generate(self):
+        """
+        生成订单编号
+        :return: 25位数字字符串
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._acquire_worker()
+                self._last_ms = 0
+
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # 同一毫秒内或时钟回拨时在上一个时间上递增序号, 序号用完时借用下一毫秒, 保证单调递增
+                self._sequence += 1
+                if self._sequence == self.SEQUENCE_LIMIT:
+                    self._last_ms += 1
+                    self._sequence = 0
+            ms, sequence, worker = self._last_ms, self._sequence, self._worker
+
+        seconds, millisecond = divmod(ms, 1000)
+        return '%s%03d%02d%03d%03d' % (time.strftime('%Y%m%d%H%M%S', time.gmtime(seconds)),
+                                       millisecond, self.node, worker, sequence)
+
+
+_generator = None
+
+
+def generate_order_id():
+    """
+    使用配置项ORDER_ID_GENERATOR指定的生成器生成订单编号
+    :return: 订单编号
+    """
+    global _generator
+    if _generator is None:
+        _generator = import_string(settings.ORDER_ID_GENERATOR)()
+    return _generator.generate()
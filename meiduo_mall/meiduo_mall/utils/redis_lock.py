@@ -0,0 +1,35 @@
+import uuid
+
+# 释放锁, 只释放自己持有的锁 KEYS: 锁  ARGV: 加锁时写入的令牌
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_lock(redis_conn, key, expires, token=None):
+    """
+    用SET NX加锁, 锁的值为随机令牌
+    :param redis_conn: redis连接
+    :param key: 锁的键
+    :param expires: 锁的有效期(秒)
+    :param token: 令牌, 默认随机生成
+    :return: 加锁成功时返回令牌, 锁已被占用时返回None
+    """
+    token = token or uuid.uuid4().hex
+    if redis_conn.set(key, token, nx=True, ex=expires):
+        return token
+    return None
+
+
+def release_lock(redis_conn, key, token):
+    """
+    释放自己持有的锁, 锁已过期并被其他进程获得时不会误删
+    :param redis_conn: redis连接
+    :param key: 锁的键
+    :param token: 加锁时返回的令牌
+    :return: 是否释放
+    """
+    return bool(redis_conn.register_script(RELEASE_LOCK_SCRIPT)(keys=[key], args=[token], client=redis_conn))